@@ -7,7 +7,7 @@ if __name__ == '__main__':
     from src.KNN.ItemKNNCFRecommender import ItemKNNCFRecommender
     from src.MatrixFactorization.PureSVDRecommender import PureSVDItemRecommender
     from src.Hybrid.GeneralizedMergedHybridRecommender import GeneralizedMergedHybridRecommender
-    from src.SLIM_ElasticNet.SLIMElasticNetRecommender import MultiThreadSLIM_ElasticNet
+    from src.SLIM_ElasticNet.Cython.SLIM_ElasticNet_Cython import SLIM_ElasticNet_Cython
     from src.Implicit.FeatureCombinedImplicitALSRecommender import FeatureCombinedImplicitALSRecommender
     from src.Hybrid.GeneralizedSimilarityMergedHybridRecommender import GeneralizedSimilarityMergedHybridRecommender
     from src.Utils.ICM_preprocessing import *
@@ -64,7 +64,7 @@ if __name__ == '__main__':
         }
     )
 
-    SLIM_recommender = MultiThreadSLIM_ElasticNet(
+    SLIM_recommender = SLIM_ElasticNet_Cython(
             URM_train=ICM_combined.T,
             verbose=False
         )
@@ -73,7 +73,7 @@ if __name__ == '__main__':
         alpha=0.00026894910579512645,
         l1_ratio=0.08074126876487486,
         topK=int(395.376118479588),
-        workers=6
+        num_threads=6
     )
 
     SLIM_recommender.URM_train = URM_all
@@ -18,6 +18,7 @@ if __name__ == '__main__':
         "Cython_examples",
         "Base/Similarity",
         "SLIM_BPR",
+        "SLIM_ElasticNet",
     ]
 
     cython_file_list = []
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import os, tempfile
+
+import numpy as np
+
+from .Recommender_utils import check_matrix
+
+
+class BPR_Batch_Sampler(object):
+    """
+    Samples BPR triples (user, positive item, negative item) in vectorized chunks.
+    As in the sequential samplers the user is sampled uniformly among those with at least one and not all the items,
+    the positive item uniformly among the items of the user and the negative one uniformly among the others.
+
+    The triples of an epoch are returned as an (n_samples, 3) int32 array, whose columns are user, positive item
+    and negative item. If memmap_folder_path is given, the array is a memory mapped file in that folder, which is
+    reused by the following epochs.
+    """
+
+    def __init__(self, URM_train, random_seed=None, chunk_size=1000000, memmap_folder_path=None):
+        super(BPR_Batch_Sampler, self).__init__()
+
+        URM_train = check_matrix(URM_train, 'csr')
+        URM_train = URM_train.sorted_indices()
+
+        self.n_users, self.n_items = URM_train.shape
+        self.chunk_size = chunk_size
+        self.memmap_folder_path = memmap_folder_path
+
+        self.URM_train_indptr = np.array(URM_train.indptr, dtype=np.int64)
+        self.URM_train_indices = np.array(URM_train.indices, dtype=np.int64)
+
+        profile_length = np.ediff1d(self.URM_train_indptr)
+
+        # Skip users with no interactions or with no negative items
+        self.eligible_users = np.flatnonzero(np.logical_and(profile_length > 0, profile_length < self.n_items))
+
+        assert len(self.eligible_users) > 0, "BPR_Batch_Sampler: no user has at least one positive and one negative item"
+
+        # Rows are consecutive and the indices of each row are sorted, so the keys are sorted as well
+        self.interaction_keys = np.repeat(np.arange(self.n_users, dtype=np.int64), profile_length) * self.n_items + \
+                                self.URM_train_indices
+
+        self.random_state = np.random.RandomState(random_seed)
+
+        self._memmap_file_path = None
+        self._memmap_samples = None
+
+    def __del__(self):
+        self._clear_memmap()
+
+    def _clear_memmap(self):
+
+        self._memmap_samples = None
+
+        if self._memmap_file_path is not None:
+            os.remove(self._memmap_file_path)
+            self._memmap_file_path = None
+
+    def _is_seen(self, user_id_array, item_id_array):
+
+        keys = user_id_array * self.n_items + item_id_array
+
+        position = np.searchsorted(self.interaction_keys, keys)
+        position = np.minimum(position, len(self.interaction_keys) - 1)
+
+        return self.interaction_keys[position] == keys
+
+    def sample_batch(self, batch_size, out=None):
+        """
+        Samples batch_size triples
+        :param out:     optional (batch_size, 3) array in which the triples are written
+        :return:        (batch_size, 3) int32 array of user, positive item and negative item
+        """
+
+        if out is None:
+            out = np.empty((batch_size, 3), dtype=np.int32)
+
+        user_id_array = self.eligible_users[self.random_state.randint(len(self.eligible_users), size=batch_size)]
+
+        seen_items_start_pos = self.URM_train_indptr[user_id_array]
+        n_seen_items = self.URM_train_indptr[user_id_array + 1] - seen_items_start_pos
+
+        positive_offset = (self.random_state.random_sample(batch_size) * n_seen_items).astype(np.int64)
+        pos_item_id_array = self.URM_train_indices[seen_items_start_pos + positive_offset]
+
+        # Rejection sampling of the negative items, only the rejected ones are sampled again
+        neg_item_id_array = self.random_state.randint(self.n_items, size=batch_size).astype(np.int64)
+        rejected = np.flatnonzero(self._is_seen(user_id_array, neg_item_id_array))
+
+        while len(rejected) > 0:
+            neg_item_id_array[rejected] = self.random_state.randint(self.n_items, size=len(rejected))
+            rejected = rejected[self._is_seen(user_id_array[rejected], neg_item_id_array[rejected])]
+
+        out[:, 0] = user_id_array
+        out[:, 1] = pos_item_id_array
+        out[:, 2] = neg_item_id_array
+
+        return out
+
+    def sample_epoch(self, n_samples):
+        """
+        Samples the triples of a whole epoch, in chunks of chunk_size
+        :return:    (n_samples, 3) int32 array of user, positive item and negative item
+        """
+
+        if self.memmap_folder_path is None:
+            samples = np.empty((n_samples, 3), dtype=np.int32)
+
+        else:
+            if self._memmap_samples is None or self._memmap_samples.shape[0] != n_samples:
+                self._clear_memmap()
+
+                file_descriptor, self._memmap_file_path = tempfile.mkstemp(prefix="BPR_samples_", suffix=".dat",
+                                                                           dir=self.memmap_folder_path)
+                os.close(file_descriptor)
+
+                self._memmap_samples = np.memmap(self._memmap_file_path, dtype=np.int32, mode="w+",
+                                                 shape=(n_samples, 3))
+
+            samples = self._memmap_samples
+
+        for start_sample in range(0, n_samples, self.chunk_size):
+            end_sample = min(start_sample + self.chunk_size, n_samples)
+            self.sample_batch(end_sample - start_sample, out=samples[start_sample:end_sample])
+
+        return samples
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import unittest
+import tempfile
+
+import numpy as np
+import scipy.sparse as sps
+
+from ..Base.BPR_Batch_Sampler import BPR_Batch_Sampler
+
+
+class MyTestCase(unittest.TestCase):
+
+    def _get_URM(self, n_users=500, n_items=50):
+
+        URM = sps.random(n_users, n_items, density=0.3, format="csr", random_state=42)
+        URM.data[:] = 1.0
+
+        # A user with all the items and one without interactions, which cannot be sampled
+        URM = sps.vstack([URM, np.ones((1, n_items)), np.zeros((1, n_items))], format="csr")
+
+        return URM
+
+    def test_valid_triples(self):
+
+        URM = self._get_URM()
+        URM_dense = URM.toarray()
+
+        sampler = BPR_Batch_Sampler(URM, random_seed=42, chunk_size=777)
+        samples = sampler.sample_epoch(10000)
+
+        self.assertEqual(samples.shape, (10000, 3))
+        self.assertTrue(np.all(URM_dense[samples[:, 0], samples[:, 1]] == 1.0))
+        self.assertTrue(np.all(URM_dense[samples[:, 0], samples[:, 2]] == 0.0))
+        self.assertFalse(np.any(samples[:, 0] >= URM.shape[0] - 2))
+
+    def test_uniform_negative_items(self):
+
+        URM = sps.csr_matrix(([1.0, 1.0], ([0, 0], [2, 5])), shape=(1, 10))
+
+        samples = BPR_Batch_Sampler(URM, random_seed=42).sample_epoch(80000)
+        negative_frequency = np.bincount(samples[:, 2], minlength=10) / len(samples)
+
+        self.assertEqual(negative_frequency[2], 0.0)
+        self.assertEqual(negative_frequency[5], 0.0)
+        self.assertTrue(np.allclose(np.delete(negative_frequency, [2, 5]), 1 / 8, atol=0.01))
+
+    def test_memmap_buffer(self):
+
+        URM = self._get_URM()
+
+        with tempfile.TemporaryDirectory() as folder_path:
+            sampler = BPR_Batch_Sampler(URM, random_seed=42, memmap_folder_path=folder_path)
+
+            samples = sampler.sample_epoch(5000)
+            self.assertIsInstance(samples, np.memmap)
+
+            samples_new_epoch = sampler.sample_epoch(5000)
+            self.assertIs(samples, samples_new_epoch)
+
+            del samples, samples_new_epoch
+            sampler._clear_memmap()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ Created on 16/09/2017
 
 from ..Base.BaseRecommender import BaseRecommender
 from ..Base.DataIO import DataIO
+from ..Base.MIPS_IVF_Index import MIPS_IVF_Index
 import numpy as np
 
 
@@ -24,6 +25,9 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
 
         self.use_bias = False
 
+        self.MIPS_index = None
+        self.MIPS_index_kwargs = None
+
     #########################################################################################################
     ##########                                                                                     ##########
     ##########                               COMPUTE ITEM SCORES                                   ##########
@@ -64,6 +68,168 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
 
         return item_scores
 
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+        """
+        Estimates the latent factors of user profiles not used in fit (fold-in), the ITEM_factors are not changed
+        :param profile_csr_rows:    CSR matrix n_profiles x n_items
+        :return:                    array n_profiles x n_factors
+        """
+        raise NotImplementedError(
+            "{}: fold-in of the user factors not available for current recommender".format(self.RECOMMENDER_NAME))
+
+    def _compute_item_score_from_profile(self, profile_csr_rows, items_to_compute=None):
+
+        USER_factors = self._compute_user_factors_from_profile(profile_csr_rows)
+
+        if items_to_compute is not None:
+            item_scores = - np.ones((profile_csr_rows.shape[0], self.ITEM_factors.shape[0]), dtype=np.float32) * np.inf
+            item_scores[:, items_to_compute] = np.dot(USER_factors, self.ITEM_factors[items_to_compute, :].T)
+
+        else:
+            item_scores = np.dot(USER_factors, self.ITEM_factors.T)
+
+        # The user bias of a new profile is not known, but it is constant and does not change the ranking
+        if self.use_bias:
+            item_scores += self.ITEM_bias + self.GLOBAL_bias
+
+        return item_scores
+
+    #########################################################################################################
+    ##########                                                                                     ##########
+    ##########                          APPROXIMATE TOP-N WITH MIPS INDEX                          ##########
+    ##########                                                                                     ##########
+    #########################################################################################################
+
+    def set_MIPS_index(self, n_lists=None, n_probe=32, max_cutoff=100, n_iter=5, random_seed=None):
+        """
+        Enables an inverted file Maximum Inner Product Search index over ITEM_factors, used by recommend when
+        cutoff <= max_cutoff. Only the items in the n_probe lists closest to the user are scored, with their exact
+        score, so n_probe trades recall for latency. The index is rebuilt whenever ITEM_factors changes,
+        e.g., after fit or load_model, and its parameters are saved with the model.
+        :param n_lists:         number of clusters of the index, if None 4*sqrt(n_items)
+        :param n_probe:         number of clusters scored for each user
+        :param max_cutoff:      the exact recommendation is used for larger cutoffs
+        """
+
+        self.MIPS_index_kwargs = {"n_lists": n_lists,
+                                  "n_probe": n_probe,
+                                  "max_cutoff": max_cutoff,
+                                  "n_iter": n_iter,
+                                  "random_seed": random_seed,
+                                  }
+
+        self.MIPS_index = None
+        self._get_MIPS_index()
+
+    def reset_MIPS_index(self):
+        self.MIPS_index = None
+        self.MIPS_index_kwargs = None
+
+    def _get_MIPS_item_vectors(self):
+
+        # The item bias is an additional dimension, whose user component is always 1
+        if self.use_bias:
+            return np.hstack((self.ITEM_factors, np.reshape(self.ITEM_bias, (-1, 1))))
+
+        return self.ITEM_factors
+
+    def _get_MIPS_user_vectors(self, user_id_array):
+
+        # User and global bias are constant for each user, therefore they do not change the ranking
+        if self.use_bias:
+            return np.hstack((self.USER_factors[user_id_array], np.ones((len(user_id_array), 1))))
+
+        return self.USER_factors[user_id_array]
+
+    def _get_MIPS_index(self):
+
+        # Fitted or loaded factors are always new arrays, which invalidate the index
+        if self.MIPS_index is None or self._MIPS_index_ITEM_factors is not self.ITEM_factors or \
+                (self.use_bias and self._MIPS_index_ITEM_bias is not self.ITEM_bias):
+
+            self.MIPS_index = MIPS_IVF_Index(self._get_MIPS_item_vectors(),
+                                             n_lists=self.MIPS_index_kwargs["n_lists"],
+                                             n_iter=self.MIPS_index_kwargs["n_iter"],
+                                             random_seed=self.MIPS_index_kwargs["random_seed"])
+
+            self._MIPS_index_ITEM_factors = self.ITEM_factors
+            self._MIPS_index_ITEM_bias = self.ITEM_bias if self.use_bias else None
+
+        return self.MIPS_index
+
+    def recommend(self, user_id_array, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                  remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+
+        if self.MIPS_index_kwargs is None or cutoff is None or cutoff > self.MIPS_index_kwargs["max_cutoff"] or \
+                items_to_compute is not None or return_scores or \
+                type(self)._compute_item_score is not BaseMatrixFactorizationRecommender._compute_item_score:
+            return super(BaseMatrixFactorizationRecommender, self).recommend(user_id_array, cutoff=cutoff,
+                                                                           remove_seen_flag=remove_seen_flag,
+                                                                           items_to_compute=items_to_compute,
+                                                                           remove_top_pop_flag=remove_top_pop_flag,
+                                                                           remove_custom_items_flag=remove_custom_items_flag,
+                                                                           return_scores=return_scores)
+
+        # If is a scalar transform it in a 1-cell array
+        if np.isscalar(user_id_array):
+            user_id_array = np.atleast_1d(user_id_array)
+            single_user = True
+        else:
+            single_user = False
+
+        assert self.USER_factors.shape[0] > np.max(user_id_array), \
+            "{}: Cold users not allowed. Users in trained model are {}, requested prediction for users up to {}".format(
+                self.RECOMMENDER_NAME, self.USER_factors.shape[0], np.max(user_id_array))
+
+        MIPS_index = self._get_MIPS_index()
+        candidates_list = MIPS_index.search(self._get_MIPS_user_vectors(user_id_array),
+                                            n_probe=self.MIPS_index_kwargs["n_probe"])
+
+        items_to_remove = []
+
+        if remove_top_pop_flag:
+            items_to_remove.append(self.filterTopPop_ItemsID)
+
+        if remove_custom_items_flag:
+            items_to_remove.append(self.items_to_ignore_ID)
+
+        ranking_list = [None] * len(user_id_array)
+
+        for user_index in range(len(user_id_array)):
+
+            user_id = user_id_array[user_index]
+            candidate_items, candidate_scores = candidates_list[user_index]
+
+            user_items_to_remove = list(items_to_remove)
+
+            if remove_seen_flag:
+                user_items_to_remove.append(self.URM_train.indices[self.URM_train.indptr[user_id]:self.URM_train.indptr[user_id + 1]])
+
+            if len(user_items_to_remove) > 0:
+                valid_mask = np.logical_not(np.isin(candidate_items, np.concatenate(user_items_to_remove)))
+                candidate_items = candidate_items[valid_mask]
+                candidate_scores = candidate_scores[valid_mask]
+
+            # Too few candidates left in the probed lists, the exact ranking is used instead
+            if len(candidate_items) < cutoff:
+                ranking_list[user_index] = super(BaseMatrixFactorizationRecommender, self).recommend(
+                    user_id_array[user_index:user_index + 1], cutoff=cutoff,
+                    remove_seen_flag=remove_seen_flag,
+                    remove_top_pop_flag=remove_top_pop_flag,
+                    remove_custom_items_flag=remove_custom_items_flag)[0]
+                continue
+
+            relevant_items_partition = np.argpartition(-candidate_scores, cutoff - 1)[0:cutoff]
+            relevant_items_partition_sorting = np.argsort(-candidate_scores[relevant_items_partition])
+
+            ranking_list[user_index] = candidate_items[relevant_items_partition[relevant_items_partition_sorting]].tolist()
+
+        # Return single list for one user, instead of list of lists
+        if single_user:
+            ranking_list = ranking_list[0]
+
+        return ranking_list
+
     #########################################################################################################
     ##########                                                                                     ##########
     ##########                                LOAD AND SAVE                                        ##########
@@ -87,7 +253,18 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
             data_dict_to_save["USER_bias"] = self.USER_bias
             data_dict_to_save["GLOBAL_bias"] = self.GLOBAL_bias
 
+        if self.MIPS_index_kwargs is not None:
+            data_dict_to_save["MIPS_index_kwargs"] = self.MIPS_index_kwargs
+
+        data_dict_to_save.update(self._get_additional_data_dict_to_save())
+
         dataIO = DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save=data_dict_to_save)
 
         self._print("Saving complete")
+
+    def _get_additional_data_dict_to_save(self):
+        """
+        Model specific attributes to save together with the factors, e.g., the hyperparameters needed by the fold-in
+        """
+        return {}
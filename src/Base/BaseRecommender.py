@@ -6,6 +6,7 @@
 """
 
 import numpy as np
+import scipy.sparse as sps
 from ..Base.DataIO import DataIO
 import os
 from ..Base.Recommender_utils import check_matrix
@@ -142,6 +143,24 @@ class BaseRecommender(object):
         if remove_custom_items_flag:
             scores_batch = self._remove_custom_items_on_scores(scores_batch)
 
+        ranking_list = self._get_ranking_list(scores_batch, cutoff)
+
+        # Return single list for one user, instead of list of lists
+        if single_user:
+            ranking_list = ranking_list[0]
+
+        if return_scores:
+            return ranking_list, scores_batch
+
+        else:
+            return ranking_list
+
+    def _get_ranking_list(self, scores_batch, cutoff):
+        """
+        Ranks the items of each row of scores_batch, items with -inf score are not recommended
+        :return:    list of lists with the top cutoff items of each row
+        """
+
         # relevant_items_partition is block_size x cutoff
         relevant_items_partition = (-scores_batch).argpartition(cutoff, axis=1)[:, 0:cutoff]
 
@@ -158,7 +177,7 @@ class BaseRecommender(object):
 
         # Remove from the recommendation list any item that has a -inf score
         # Since -inf is a flag to indicate an item to remove
-        for user_index in range(len(user_id_array)):
+        for user_index in range(scores_batch.shape[0]):
             user_recommendation_list = ranking[user_index]
             user_item_scores = scores_batch[user_index, user_recommendation_list]
 
@@ -167,6 +186,49 @@ class BaseRecommender(object):
             user_recommendation_list = user_recommendation_list[not_inf_scores_mask]
             ranking_list[user_index] = user_recommendation_list.tolist()
 
+        return ranking_list
+
+    def recommend_from_profile(self, profile_csr_rows, cutoff=None, remove_seen_flag=True, items_to_compute=None,
+                               remove_top_pop_flag=False, remove_custom_items_flag=False, return_scores=False):
+        """
+        Recommends to user profiles which are not in URM_train, or whose interactions changed, without fitting the
+        model again. Available for recommenders implementing _compute_item_score_from_profile
+        :param profile_csr_rows:    n_profiles x n_items sparse matrix with the interactions of each profile, on the
+                                    same scale as URM_train, or a single 1-D array of n_items values
+        :return:                    same as recommend, the seen items are the ones in the profile
+        """
+
+        if not sps.issparse(profile_csr_rows) and np.ndim(profile_csr_rows) == 1:
+            profile_csr_rows = np.atleast_2d(profile_csr_rows)
+            single_user = True
+        else:
+            single_user = False
+
+        profile_csr_rows = check_matrix(sps.csr_matrix(profile_csr_rows), 'csr', dtype=np.float32)
+        profile_csr_rows.eliminate_zeros()
+
+        assert profile_csr_rows.shape[1] == self.n_items, \
+            "{}: Profiles have {} items, while URM_train has {}".format(
+                self.RECOMMENDER_NAME, profile_csr_rows.shape[1], self.n_items)
+
+        if cutoff is None:
+            cutoff = self.n_items - 1
+
+        scores_batch = self._compute_item_score_from_profile(profile_csr_rows, items_to_compute=items_to_compute)
+
+        if remove_seen_flag:
+            for profile_index in range(profile_csr_rows.shape[0]):
+                seen = profile_csr_rows.indices[profile_csr_rows.indptr[profile_index]:profile_csr_rows.indptr[profile_index + 1]]
+                scores_batch[profile_index, seen] = -np.inf
+
+        if remove_top_pop_flag:
+            scores_batch = self._remove_TopPop_on_scores(scores_batch)
+
+        if remove_custom_items_flag:
+            scores_batch = self._remove_custom_items_on_scores(scores_batch)
+
+        ranking_list = self._get_ranking_list(scores_batch, cutoff)
+
         # Return single list for one user, instead of list of lists
         if single_user:
             ranking_list = ranking_list[0]
@@ -177,6 +239,17 @@ class BaseRecommender(object):
         else:
             return ranking_list
 
+    def _compute_item_score_from_profile(self, profile_csr_rows, items_to_compute=None):
+        """
+
+        :param profile_csr_rows:    CSR matrix n_profiles x n_items with the interactions of each profile
+        :param items_to_compute:    array containing the items whose scores are to be computed.
+                                        If None, all items are computed, otherwise discarded items will have as score -np.inf
+        :return:                    array (n_profiles, n_items) with the score.
+        """
+        raise NotImplementedError(
+            "BaseRecommender: compute_item_score_from_profile not assigned for current recommender, unable to compute prediction scores")
+
     #########################################################################################################
     ##########                                                                                     ##########
     ##########                                LOAD AND SAVE                                        ##########
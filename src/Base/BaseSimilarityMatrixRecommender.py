@@ -74,16 +74,24 @@ class BaseItemSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
         :return:
         """
 
-        self._check_format()
+        return self._compute_item_score_from_profile(self.URM_train[user_id_array], items_to_compute=items_to_compute)
+
+    def _compute_item_score_from_profile(self, profile_csr_rows, items_to_compute=None):
+        """
+        The scores are profile * W_sparse, so any profile can be scored, also one which was not in URM_train
+        :param profile_csr_rows:    CSR matrix n_profiles x n_items
+        :param items_to_compute:
+        :return:
+        """
 
-        user_profile_array = self.URM_train[user_id_array]
+        self._check_format()
 
         if items_to_compute is not None:
-            item_scores = - np.ones((len(user_id_array), self.URM_train.shape[1]), dtype=np.float32) * np.inf
-            item_scores_all = user_profile_array.dot(self.W_sparse).toarray()
+            item_scores = - np.ones((profile_csr_rows.shape[0], self.URM_train.shape[1]), dtype=np.float32) * np.inf
+            item_scores_all = profile_csr_rows.dot(self.W_sparse).toarray()
             item_scores[:, items_to_compute] = item_scores_all[:, items_to_compute]
         else:
-            item_scores = user_profile_array.dot(self.W_sparse).toarray()
+            item_scores = profile_csr_rows.dot(self.W_sparse).toarray()
         return item_scores
 
 
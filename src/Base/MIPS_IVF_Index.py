@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import numpy as np
+import scipy.sparse as sps
+
+
+class MIPS_IVF_Index(object):
+    """
+    Inverted file index for Maximum Inner Product Search over the rows of a matrix of item vectors.
+
+    The item vectors are augmented with an extra component sqrt(M^2 - ||v||^2), M being the maximum norm, and the
+    queries with a zero, so that the inner product ranking becomes an Euclidean nearest neighbour ranking, see:
+        Speeding up the Xbox recommender system using a euclidean transformation for inner-product spaces,
+        Y. Bachrach et al., RecSys 2014.
+    The augmented vectors are clustered with k-means into n_lists lists. A query only visits the n_probe lists
+    with the nearest centroids, the inner products of the items in those lists are then computed exactly.
+    Larger n_probe values increase the recall and the latency.
+    """
+
+    def __init__(self, item_vectors, n_lists=None, n_iter=5, random_seed=None):
+        super(MIPS_IVF_Index, self).__init__()
+
+        self.item_vectors = np.ascontiguousarray(item_vectors, dtype=np.float32)
+        self.n_items, self.n_dimensions = self.item_vectors.shape
+
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(self.n_items))
+
+        self.n_lists = max(1, min(n_lists, self.n_items))
+
+        item_norms_squared = np.square(self.item_vectors).sum(axis=1)
+        augmented_component = np.sqrt(np.maximum(item_norms_squared.max() - item_norms_squared, 0.0))
+
+        augmented_vectors = np.hstack((self.item_vectors, augmented_component[:, None])).astype(np.float32)
+
+        centroids, assignment = self._kmeans(augmented_vectors, self.n_lists, n_iter, np.random.RandomState(random_seed))
+
+        # Queries have a zero augmented component, so only the first part of the centroids is needed
+        self.centroids = np.ascontiguousarray(centroids[:, :self.n_dimensions])
+        self.centroid_norms_squared = np.square(centroids).sum(axis=1)
+
+        # Items grouped by list, CSR-like
+        self.list_items = np.argsort(assignment, kind="stable").astype(np.int32)
+        self.list_indptr = np.zeros(self.n_lists + 1, dtype=np.int64)
+        self.list_indptr[1:] = np.cumsum(np.bincount(assignment, minlength=self.n_lists))
+
+    @staticmethod
+    def _assign(X, centroids, block_size=10000):
+
+        centroid_norms_squared = np.square(centroids).sum(axis=1)
+        assignment = np.empty(X.shape[0], dtype=np.int64)
+
+        for start in range(0, X.shape[0], block_size):
+            distance = centroid_norms_squared - 2 * np.dot(X[start:start + block_size], centroids.T)
+            assignment[start:start + block_size] = np.argmin(distance, axis=1)
+
+        return assignment
+
+    def _kmeans(self, X, n_clusters, n_iter, random_state):
+
+        centroids = X[random_state.choice(X.shape[0], n_clusters, replace=False)].copy()
+
+        for _ in range(n_iter):
+
+            assignment = self._assign(X, centroids)
+
+            cluster_size = np.bincount(assignment, minlength=n_clusters)
+            cluster_sum = sps.csr_matrix((np.ones(X.shape[0], dtype=np.float32), (assignment, np.arange(X.shape[0]))),
+                                         shape=(n_clusters, X.shape[0])).dot(X)
+
+            # Empty clusters keep their previous centroid
+            non_empty = cluster_size > 0
+            centroids[non_empty] = cluster_sum[non_empty] / cluster_size[non_empty, None]
+
+        return centroids, self._assign(X, centroids)
+
+    def search(self, query_vectors, n_probe):
+        """
+        Returns for each query the candidate items in the n_probe nearest lists and their exact inner products
+        :param query_vectors:   n_queries x n_dimensions
+        :return:                list of (candidate_items, candidate_scores) tuples
+        """
+
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        n_probe = max(1, min(n_probe, self.n_lists))
+
+        # Nearest centroids of the augmented query, the query norm is the same for all the centroids
+        centroid_score = 2 * np.dot(query_vectors, self.centroids.T) - self.centroid_norms_squared
+
+        if n_probe < self.n_lists:
+            probed_lists = np.argpartition(-centroid_score, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probed_lists = np.broadcast_to(np.arange(self.n_lists), centroid_score.shape)
+
+        candidates_list = []
+
+        for query_index in range(query_vectors.shape[0]):
+
+            list_start = self.list_indptr[probed_lists[query_index]]
+            list_length = self.list_indptr[probed_lists[query_index] + 1] - list_start
+
+            # Positions of the items of all the probed lists, built without a Python loop over the lists
+            offset = np.repeat(list_start - np.cumsum(list_length) + list_length, list_length)
+            candidate_items = self.list_items[offset + np.arange(list_length.sum())]
+
+            candidate_scores = np.dot(self.item_vectors[candidate_items], query_vectors[query_index])
+
+            candidates_list.append((candidate_items, candidate_scores))
+
+        return candidates_list
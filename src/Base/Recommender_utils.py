@@ -118,6 +118,31 @@ def similarityMatrixTopK(item_weights, k=100, verbose=False):
     return W_sparse
 
 
+def csr_rows_topK(X, topK):
+    """
+    Keeps only the topK largest values of each row of a CSR matrix, the indices of each row remain sorted
+    """
+
+    X = check_matrix(X, 'csr', dtype=np.float32)
+    row_length = np.ediff1d(X.indptr)
+
+    if row_length.max(initial=0) <= topK:
+        return X
+
+    row_index = np.repeat(np.arange(X.shape[0]), row_length)
+
+    # Sort by row and then by decreasing value, the rank of a cell is its position within its row
+    sorted_position = np.lexsort((-X.data, row_index))
+    rank = np.arange(X.nnz) - X.indptr[row_index[sorted_position]]
+
+    selected = np.sort(sorted_position[rank < topK])
+
+    new_indptr = np.zeros(X.shape[0] + 1, dtype=np.int64)
+    new_indptr[1:] = np.cumsum(np.minimum(row_length, topK))
+
+    return sps.csr_matrix((X.data[selected], X.indices[selected], new_indptr), shape=X.shape)
+
+
 def areURMequals(URM1, URM2):
     if (URM1.shape != URM2.shape):
         return False
@@ -74,22 +74,19 @@ class Compute_Similarity_Euclidean:
     def compute_similarity(self, start_col=None, end_col=None, block_size=100):
         """
         Compute the similarity for the given dataset
+        The distances of a whole block of columns are computed at once with the expansion (a-b)^2 = a^2 + b^2 - 2ab,
+        the TopK selection is then applied on all the columns of the block together
         :param self:
         :param start_col: column to begin with
         :param end_col: column to stop before, end_col is excluded
+        :param block_size: number of columns whose similarities are computed at the same time
         :return:
         """
 
-        values = []
-        rows = []
-        cols = []
-
         start_time = time.time()
         start_time_print_batch = start_time
         processedItems = 0
 
-        # self.dataMatrix = self.dataMatrix.toarray()
-
         start_col_local = 0
         end_col_local = self.n_columns
 
@@ -99,15 +96,29 @@ class Compute_Similarity_Euclidean:
         if end_col is not None and end_col > start_col_local and end_col < self.n_columns:
             end_col_local = end_col
 
+        # Use arrays as they reduce memory requirements compared to lists, each column has at most TopK values
+        max_cells = self.TopK * (end_col_local - start_col_local)
+
+        values = np.zeros(max_cells, dtype=np.float32)
+        rows = np.zeros(max_cells, dtype=np.int32)
+        cols = np.zeros(max_cells, dtype=np.int32)
+
+        numCells = 0
+
         # Compute sum of squared values
         item_distance_initial = np.array(self.dataMatrix.power(2).sum(axis=0)).ravel()
         sumOfSquared = np.sqrt(item_distance_initial)
 
+        if self.use_row_weights:
+            dataMatrix_for_product = self.dataMatrix_weighted
+        else:
+            dataMatrix_for_product = self.dataMatrix
+
         start_col_block = start_col_local
 
         this_block_size = 0
 
-        # Compute all similarities for each item using vectorization
+        # Compute all similarities for each block of items using vectorization
         while start_col_block < end_col_local:
 
             # Add previous block size
@@ -128,90 +139,73 @@ class Compute_Similarity_Euclidean:
 
                 start_time_print_batch = time.time()
 
-            # All data points for a given item
-            item_data = self.dataMatrix[:, start_col_block:end_col_block]
-            item_data = item_data.toarray().squeeze()
-
-            # If only 1 feature avoid last dimension to disappear
-            if item_data.ndim == 1:
-                item_data = np.atleast_2d(item_data)
-
-            if self.use_row_weights:
-                this_block_weights = self.dataMatrix_weighted.T.dot(item_data)
-
-            else:
-                # Compute item similarities
-                this_block_weights = self.dataMatrix.T.dot(item_data)
+            # All data points for the items in the block, this_block_weights is n_columns x this_block_size
+            item_data = self.dataMatrix[:, start_col_block:end_col_block].toarray()
+            this_block_weights = np.asarray(dataMatrix_for_product.T.dot(item_data))
 
-            for col_index_in_block in range(this_block_size):
+            block_column_index = np.arange(start_col_block, end_col_block)
+            block_diagonal = (block_column_index, np.arange(this_block_size))
 
-                if this_block_size == 1:
-                    this_column_weights = this_block_weights
-                else:
-                    this_column_weights = this_block_weights[:, col_index_in_block]
+            # (a-b)^2 = a^2 + b^2 - 2ab
+            item_distance = item_distance_initial[:, None] + item_distance_initial[None, start_col_block:end_col_block]
+            item_distance -= 2 * this_block_weights
 
-                columnIndex = col_index_in_block + start_col_block
+            item_distance[block_diagonal] = 0.0
 
-                # item_data = self.dataMatrix[:,columnIndex]
-
-                # (a-b)^2 = a^2 + b^2 - 2ab
-                item_distance = item_distance_initial.copy()
-                item_distance += item_distance_initial[columnIndex]
-
-                # item_distance -= 2*item_data.T.dot(self.dataMatrix).toarray().ravel()
-                item_distance -= 2 * this_column_weights
-
-                item_distance[columnIndex] = 0.0
-
-                if self.use_row_weights:
-                    item_distance = np.multiply(item_distance, self.row_weights)
-
-                if self.normalize:
-                    item_distance /= sumOfSquared[columnIndex] * sumOfSquared
-
-                if self.normalize_avg_row:
-                    item_distance /= self.n_rows
-
-                item_distance = np.sqrt(item_distance)
-
-                if self.similarity_is_exp:
-                    item_similarity = 1 / (np.exp(item_distance) + self.shrink + 1e-9)
-
-                elif self.similarity_is_lin:
-                    item_similarity = 1 / (item_distance + self.shrink + 1e-9)
+            if self.use_row_weights:
+                item_distance = np.multiply(item_distance, self.row_weights[:, None])
 
-                elif self.similarity_is_log:
-                    item_similarity = 1 / (np.log(item_distance + 1) + self.shrink + 1e-9)
+            if self.normalize:
+                item_distance /= sumOfSquared[:, None] * sumOfSquared[None, start_col_block:end_col_block]
 
-                else:
-                    assert False
+            if self.normalize_avg_row:
+                item_distance /= self.n_rows
 
-                item_similarity[columnIndex] = 0.0
+            item_distance = np.sqrt(item_distance)
 
-                this_column_weights = item_similarity
+            if self.similarity_is_exp:
+                item_similarity = 1 / (np.exp(item_distance) + self.shrink + 1e-9)
 
-                # Sort indices and select TopK
-                # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-                # - Partition the data to extract the set of relevant items
-                # - Sort only the relevant items
-                # - Get the original item index
-                relevant_items_partition = (-this_column_weights).argpartition(self.TopK - 1)[0:self.TopK]
-                relevant_items_partition_sorting = np.argsort(-this_column_weights[relevant_items_partition])
-                top_k_idx = relevant_items_partition[relevant_items_partition_sorting]
+            elif self.similarity_is_lin:
+                item_similarity = 1 / (item_distance + self.shrink + 1e-9)
 
-                # Incrementally build sparse matrix, do not add zeros
-                notZerosMask = this_column_weights[top_k_idx] != 0.0
-                numNotZeros = np.sum(notZerosMask)
+            elif self.similarity_is_log:
+                item_similarity = 1 / (np.log(item_distance + 1) + self.shrink + 1e-9)
 
-                values.extend(this_column_weights[top_k_idx][notZerosMask])
-                rows.extend(top_k_idx[notZerosMask])
-                cols.extend(np.ones(numNotZeros) * columnIndex)
+            else:
+                assert False
+
+            item_similarity[block_diagonal] = 0.0
+
+            # Sort indices and select TopK for all the columns in the block
+            # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
+            # - Partition the data to extract the set of relevant items
+            # - Sort only the relevant items
+            # - Get the original item index
+            relevant_items_partition = (-item_similarity).argpartition(self.TopK - 1, axis=0)[0:self.TopK, :]
+            relevant_items_partition_original_value = np.take_along_axis(item_similarity, relevant_items_partition,
+                                                                         axis=0)
+            relevant_items_partition_sorting = np.argsort(-relevant_items_partition_original_value, axis=0)
+            top_k_idx = np.take_along_axis(relevant_items_partition, relevant_items_partition_sorting, axis=0)
+            top_k_values = np.take_along_axis(relevant_items_partition_original_value,
+                                              relevant_items_partition_sorting, axis=0)
+
+            # Incrementally build sparse matrix, do not add zeros
+            # Transposing first keeps the values of each column contiguous
+            notZerosMask = (top_k_values != 0.0).T
+            numNotZeros = np.sum(notZerosMask)
+
+            values[numCells:numCells + numNotZeros] = top_k_values.T[notZerosMask]
+            rows[numCells:numCells + numNotZeros] = top_k_idx.T[notZerosMask]
+            cols[numCells:numCells + numNotZeros] = np.repeat(block_column_index, notZerosMask.sum(axis=1))
+
+            numCells += numNotZeros
 
             start_col_block += block_size
 
         # End while on columns
 
-        W_sparse = sps.csr_matrix((values, (rows, cols)),
+        W_sparse = sps.csr_matrix((values[:numCells], (rows[:numCells], cols[:numCells])),
                                   shape=(self.n_columns, self.n_columns),
                                   dtype=np.float32)
 
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import os
+import time
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from ...Base.Similarity.Compute_Similarity_Euclidean import Compute_Similarity_Euclidean
+
+
+def compute_similarity_column_wise(similarity_object):
+    """
+    Reference implementation processing one column at a time, as Compute_Similarity_Euclidean used to do
+    :param similarity_object: a Compute_Similarity_Euclidean instance
+    :return:
+    """
+
+    self = similarity_object
+
+    values, rows, cols = [], [], []
+
+    item_distance_initial = np.array(self.dataMatrix.power(2).sum(axis=0)).ravel()
+    sumOfSquared = np.sqrt(item_distance_initial)
+
+    dataMatrix_for_product = self.dataMatrix_weighted if self.use_row_weights else self.dataMatrix
+
+    for columnIndex in range(self.n_columns):
+
+        item_data = self.dataMatrix[:, columnIndex].toarray().ravel()
+        this_column_weights = dataMatrix_for_product.T.dot(item_data)
+
+        item_distance = item_distance_initial.copy()
+        item_distance += item_distance_initial[columnIndex]
+        item_distance -= 2 * this_column_weights
+        item_distance[columnIndex] = 0.0
+
+        if self.use_row_weights:
+            item_distance = np.multiply(item_distance, self.row_weights)
+
+        if self.normalize:
+            item_distance /= sumOfSquared[columnIndex] * sumOfSquared
+
+        if self.normalize_avg_row:
+            item_distance /= self.n_rows
+
+        item_distance = np.sqrt(item_distance)
+
+        if self.similarity_is_exp:
+            item_similarity = 1 / (np.exp(item_distance) + self.shrink + 1e-9)
+        elif self.similarity_is_lin:
+            item_similarity = 1 / (item_distance + self.shrink + 1e-9)
+        else:
+            item_similarity = 1 / (np.log(item_distance + 1) + self.shrink + 1e-9)
+
+        item_similarity[columnIndex] = 0.0
+
+        relevant_items_partition = (-item_similarity).argpartition(self.TopK - 1)[0:self.TopK]
+        relevant_items_partition_sorting = np.argsort(-item_similarity[relevant_items_partition])
+        top_k_idx = relevant_items_partition[relevant_items_partition_sorting]
+
+        notZerosMask = item_similarity[top_k_idx] != 0.0
+
+        values.extend(item_similarity[top_k_idx][notZerosMask])
+        rows.extend(top_k_idx[notZerosMask])
+        cols.extend(np.ones(np.sum(notZerosMask)) * columnIndex)
+
+    return sps.csr_matrix((values, (rows, cols)), shape=(self.n_columns, self.n_columns), dtype=np.float32)
+
+
+class MyTestCase(unittest.TestCase):
+
+    def _get_data(self, n_rows=300, n_columns=200, density=0.05):
+
+        dataMatrix = sps.random(n_rows, n_columns, density=density, format="csr", dtype=np.float32,
+                                random_state=42)
+        dataMatrix.data = np.round(dataMatrix.data * 5) + 1
+
+        return dataMatrix
+
+    def test_same_output_as_column_wise(self):
+
+        dataMatrix = self._get_data()
+
+        for mode in ["lin", "log", "exp"]:
+            for normalize in [False, True]:
+                for normalize_avg_row in [False, True]:
+                    similarity = Compute_Similarity_Euclidean(dataMatrix, topK=50, shrink=2, normalize=normalize,
+                                                              normalize_avg_row=normalize_avg_row,
+                                                              similarity_from_distance_mode=mode)
+
+                    W_block = similarity.compute_similarity(block_size=37)
+                    W_column = compute_similarity_column_wise(similarity)
+
+                    self.assertEqual(W_block.nnz, W_column.nnz)
+                    self.assertTrue(np.allclose(W_block.toarray(), W_column.toarray(), atol=1e-6))
+
+    def test_same_output_with_row_weights(self):
+
+        dataMatrix = self._get_data(n_rows=200)
+        row_weights = np.random.RandomState(42).uniform(0.5, 2.0, dataMatrix.shape[0])
+
+        similarity = Compute_Similarity_Euclidean(dataMatrix, topK=20, row_weights=row_weights)
+
+        W_block = similarity.compute_similarity()
+        W_column = compute_similarity_column_wise(similarity)
+
+        self.assertTrue(np.allclose(W_block.toarray(), W_column.toarray(), atol=1e-6))
+
+    @unittest.skipUnless(os.environ.get("RUN_BENCHMARKS"), "benchmark, set RUN_BENCHMARKS=1 to run it")
+    def test_throughput(self):
+
+        dataMatrix = self._get_data(n_rows=5000, n_columns=2000, density=0.01)
+
+        similarity = Compute_Similarity_Euclidean(dataMatrix, topK=100)
+
+        start_time = time.time()
+        W_column = compute_similarity_column_wise(similarity)
+        column_wise_time = time.time() - start_time
+
+        start_time = time.time()
+        W_block = similarity.compute_similarity()
+        block_time = time.time() - start_time
+
+        print("Compute_Similarity_Euclidean: column-wise {:.2f} column/sec, block {:.2f} column/sec".format(
+            dataMatrix.shape[1] / column_wise_time, dataMatrix.shape[1] / block_time))
+
+        self.assertTrue(np.allclose(W_block.toarray(), W_column.toarray(), atol=1e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
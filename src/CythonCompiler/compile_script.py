@@ -33,9 +33,19 @@ del sys.argv[1]
 
 extensionName = re.sub("\.pyx", "", fileToCompile)
 
+# OpenMP is required by the prange loops, without it they are compiled as sequential loops.
+# Apple clang does not support it out of the box
+if sys.platform == "win32":
+    openmp_compile_args, openmp_link_args = ['/openmp'], []
+elif sys.platform == "darwin":
+    openmp_compile_args, openmp_link_args = [], []
+else:
+    openmp_compile_args, openmp_link_args = ['-fopenmp'], ['-fopenmp']
+
 ext_modules = Extension(extensionName,
                         [fileToCompile],
-                        extra_compile_args=['-O2'],
+                        extra_compile_args=['-O2'] + openmp_compile_args,
+                        extra_link_args=openmp_link_args,
                         include_dirs=[numpy.get_include(), ],
                         )
 
@@ -7,14 +7,156 @@ Created on 23/10/17
 """
 
 from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
-from ..Base.Recommender_utils import similarityMatrixTopK, check_matrix
+from ..Base.Recommender_utils import check_matrix
 from ..Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 from sklearn.preprocessing import normalize
 import numpy as np
 import time
 import scipy.sparse as sps
+import scipy.linalg
 
-from ..Base.Similarity.Compute_Similarity import Compute_Similarity
+
+def compute_gram_matrix(X, block_size=None):
+    """
+    Computes the dense float32 Gram matrix X.T * X with sparse-dense products on blocks of columns
+    :param block_size:  number of columns computed together, if None the dense block of X has about 1e7 cells
+    """
+
+    X = check_matrix(X, 'csc', dtype=np.float32)
+    n_rows, n_columns = X.shape
+
+    if block_size is None:
+        block_size = max(1, min(n_columns, 10000000 // max(n_rows, 1)))
+
+    X_T = X.T
+
+    gram_matrix = np.empty((n_columns, n_columns), dtype=np.float32)
+
+    for start_column in range(0, n_columns, block_size):
+        end_column = min(start_column + block_size, n_columns)
+        gram_matrix[:, start_column:end_column] = X_T.dot(X[:, start_column:end_column].toarray())
+
+    return gram_matrix
+
+
+def compute_regularized_gram_inverse(X, l2_norm):
+    """
+    Computes (X.T * X + l2_norm * I)^-1 in float32 with a Cholesky factorization, in place of the Gram matrix
+    """
+
+    P = compute_gram_matrix(X)
+    P[np.diag_indices(P.shape[0])] += l2_norm
+
+    potrf, potri = scipy.linalg.lapack.get_lapack_funcs(('potrf', 'potri'), (P,))
+
+    P, info = potrf(P, lower=False, overwrite_a=True, clean=True)
+    assert info == 0, "EASE_R: Cholesky factorization failed, the regularized Gram matrix is not positive definite. l2_norm was {}".format(l2_norm)
+
+    P, info = potri(P, lower=False, overwrite_c=True)
+    assert info == 0, "EASE_R: inversion from the Cholesky factor failed"
+
+    # Only the upper triangle is computed, copy it in the lower one in blocks to avoid large temporary arrays
+    n_columns = P.shape[0]
+    block_size = 1000
+
+    for start_row in range(0, n_columns, block_size):
+        end_row = min(start_row + block_size, n_columns)
+        P[start_row:end_row, :start_row] = P[:start_row, start_row:end_row].T
+
+        diagonal_block = P[start_row:end_row, start_row:end_row]
+        diagonal_block[np.tril_indices(end_row - start_row, -1)] = diagonal_block.T[np.tril_indices(end_row - start_row, -1)]
+
+    return P
+
+
+def get_woodbury_P_columns(X, l2_norm, block_size=1000):
+    """
+    Computes P = (X.T * X + l2_norm * I)^-1 for X with fewer rows than columns with the Woodbury identity
+        P = (I - X.T * K^-1 * X) / l2_norm,     K = X * X.T + l2_norm * I
+    so that only the n_rows x n_rows matrix K is factorized, with a Cholesky factorization. The columns of P are
+    computed on demand and no n_columns x n_columns array is built
+    :return:    get_P_columns, function(start_column, end_column) returning a block of columns of P, and diag(P)
+    """
+
+    X = check_matrix(X, 'csc', dtype=np.float32)
+    X_T = X.T
+    n_rows, n_columns = X.shape
+
+    # With K = L * L.T, half_solve(X_block) returns L^-1 * X_block and full_solve multiplies it by L^-T,
+    # so that X_block.T * K^-1 * X_block = half_solve(X_block).T * half_solve(X_block)
+    K = compute_gram_matrix(X_T)
+    K[np.diag_indices(n_rows)] += l2_norm
+    L = scipy.linalg.cholesky(K, lower=True, overwrite_a=True, check_finite=False)
+
+    half_solve = lambda X_block: scipy.linalg.solve_triangular(L, X_block, lower=True, check_finite=False)
+    full_solve = lambda Z_block: scipy.linalg.solve_triangular(L, Z_block, lower=True, trans='T', check_finite=False)
+
+    P_diagonal = np.empty(n_columns, dtype=np.float32)
+
+    for start_column in range(0, n_columns, block_size):
+        end_column = min(start_column + block_size, n_columns)
+        Z_block = half_solve(X[:, start_column:end_column].toarray())
+        P_diagonal[start_column:end_column] = (1.0 - np.square(Z_block).sum(axis=0)) / l2_norm
+
+    def get_P_columns(start_column, end_column):
+
+        P_block = - X_T.dot(full_solve(half_solve(X[:, start_column:end_column].toarray())))
+        P_block[np.arange(start_column, end_column), np.arange(end_column - start_column)] += 1.0
+        P_block /= l2_norm
+
+        return P_block.astype(np.float32, copy=False)
+
+    return get_P_columns, P_diagonal
+
+
+def compute_B_from_P_columns(get_P_columns, P_diagonal, topK=None, block_size=1000, out=None):
+    """
+    Computes the EASE_R weights B = P / -diag(P), with zero diagonal, on blocks of columns of P
+    :param get_P_columns:   function(start_column, end_column) returning the columns of P as a dense array
+    :param topK:            if not None only the topK largest values of each column are kept, as in
+                            similarityMatrixTopK, and the dense B is never built
+    :param out:             n x n array in which the dense B is written when topK is None, it can be P itself
+    :return:                dense B if topK is None, CSC matrix otherwise
+    """
+
+    n_columns = len(P_diagonal)
+
+    if topK is None and out is None:
+        out = np.empty((n_columns, n_columns), dtype=np.float32)
+
+    rows, cols, values = [], [], []
+
+    for start_column in range(0, n_columns, block_size):
+        end_column = min(start_column + block_size, n_columns)
+        block_columns = np.arange(end_column - start_column)
+
+        B_block = get_P_columns(start_column, end_column)
+        B_block /= -P_diagonal[start_column:end_column]
+        B_block[start_column + block_columns, block_columns] = 0.0
+
+        if topK is None:
+            if B_block is not out[:, start_column:end_column]:
+                out[:, start_column:end_column] = B_block
+            continue
+
+        # The diagonal is excluded from the selection as the zeros are in similarityMatrixTopK
+        B_block[start_column + block_columns, block_columns] = -np.inf
+
+        k = min(topK, n_columns)
+        top_k_rows = np.argpartition(-B_block, k - 1, axis=0)[:k, :]
+        top_k_values = B_block[top_k_rows, block_columns]
+
+        valid_mask = np.logical_and(np.isfinite(top_k_values), top_k_values != 0.0)
+
+        rows.append(top_k_rows[valid_mask])
+        cols.append(np.broadcast_to(start_column + block_columns, top_k_rows.shape)[valid_mask])
+        values.append(top_k_values[valid_mask])
+
+    if topK is None:
+        return out
+
+    return sps.csc_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(n_columns, n_columns), dtype=np.float32)
 
 
 class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
@@ -37,7 +179,15 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
         super(EASE_R_Recommender, self).__init__(URM_train)
         self.sparse_threshold_quota = sparse_threshold_quota
 
-    def fit(self, topK=None, l2_norm=1e3, normalize_matrix=False, verbose=True):
+    def fit(self, topK=None, l2_norm=1e3, normalize_matrix=False, verbose=True, block_size=1000, use_woodbury=None):
+        """
+        The Gram matrix X.T * X keeps its diagonal, the item popularity, while the original implementation built it
+        with Compute_Similarity, which zeroes the diagonal. The same l2_norm therefore gives a different W and the
+        values tuned before this change have to be tuned again.
+        :param block_size:      number of columns of B computed together
+        :param use_woodbury:    if True the n_users x n_users system is inverted instead of the n_items x n_items one,
+                                if None it is chosen when there are fewer users than items, e.g., for EASE_R_CBF
+        """
 
         self.verbose = verbose
 
@@ -50,29 +200,28 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
             self.URM_train = normalize(self.URM_train, norm='l2', axis=0)
             self.URM_train = sps.csr_matrix(self.URM_train)
 
-        # Grahm matrix is X X^t, compute dot product
-        similarity = Compute_Similarity(self.URM_train, shrink=0, topK=self.URM_train.shape[1], normalize=False,
-                                        similarity="cosine")
-        grahm_matrix = similarity.compute_similarity().toarray()
+        if use_woodbury is None:
+            use_woodbury = self.URM_train.shape[0] < self.URM_train.shape[1]
 
-        diag_indices = np.diag_indices(grahm_matrix.shape[0])
+        if use_woodbury:
+            get_P_columns, P_diagonal = get_woodbury_P_columns(self.URM_train, l2_norm, block_size=block_size)
 
-        grahm_matrix[diag_indices] += l2_norm
+            B = compute_B_from_P_columns(get_P_columns, P_diagonal, topK=topK, block_size=block_size)
 
-        P = np.linalg.inv(grahm_matrix)
+        else:
+            P = compute_regularized_gram_inverse(self.URM_train, l2_norm)
+            P_diagonal = np.diag(P).copy()
 
-        B = P / (-np.diag(P))
+            # The columns of B are written in place of those of P
+            get_P_columns = lambda start_column, end_column: P[:, start_column:end_column]
 
-        B[diag_indices] = 0.0
+            B = compute_B_from_P_columns(get_P_columns, P_diagonal, topK=topK, block_size=block_size, out=P)
 
         new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
         self._print("Fitting model... done in {:.2f} {}".format(new_time_value, new_time_unit))
 
         # Check if the matrix should be saved in a sparse or dense format
         # The matrix is sparse, regardless of the presence of the topK, if nonzero cells are less than sparse_threshold_quota %
-        if topK is not None:
-            B = similarityMatrixTopK(B, k=topK, verbose=False)
-
         if self._is_content_sparse_check(B):
             self._print("Detected model matrix to be sparse, changing format.")
             self.W_sparse = check_matrix(B, format='csr', dtype=np.float32)
@@ -112,16 +261,20 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
         :return:
         """
 
-        self._check_format()
+        return self._compute_item_score_from_profile(self.URM_train[user_id_array], items_to_compute=items_to_compute)
+
+    def _compute_item_score_from_profile(self, profile_csr_rows, items_to_compute=None):
 
-        user_profile_array = self.URM_train[user_id_array]
+        if sps.issparse(self.W_sparse):
+            return super(EASE_R_Recommender, self)._compute_item_score_from_profile(profile_csr_rows,
+                                                                                   items_to_compute=items_to_compute)
 
         if items_to_compute is not None:
-            item_scores = - np.ones((len(user_id_array), self.URM_train.shape[1]), dtype=np.float32) * np.inf
-            item_scores_all = user_profile_array.dot(self.W_sparse)  # .toarray()
+            item_scores = - np.ones((profile_csr_rows.shape[0], self.URM_train.shape[1]), dtype=np.float32) * np.inf
+            item_scores_all = profile_csr_rows.dot(self.W_sparse)  # .toarray()
             item_scores[:, items_to_compute] = item_scores_all[:, items_to_compute]
         else:
-            item_scores = user_profile_array.dot(self.W_sparse)  # .toarray()
+            item_scores = profile_csr_rows.dot(self.W_sparse)  # .toarray()
 
         return item_scores
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from ..Base.Recommender_utils import check_matrix
+from ..Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+from sklearn.preprocessing import normalize
+import numpy as np
+import time, sys
+import scipy.sparse as sps
+
+
+class SparseEASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
+    """
+    Sparse approximation of EASE_R for item counts whose dense n_items x n_items inverse does not fit in memory.
+
+    The column j of the EASE_R matrix B = -P[:, j] / P[j, j] is the ridge regression of the item j on all the other
+    items, (G_-j,-j + l2_norm * I) * b = G_-j,j with G = X.T * X. Here each column is restricted to the
+    neighborhood_size items which co-occur the most with j, so that only a neighborhood_size x neighborhood_size
+    system is solved for each item, in batches, and G is only needed as a sparse matrix.
+    If fewer items co-occur with j the neighborhood is filled with the items reachable in two steps, by their
+    two-step co-occurrence, and then with the remaining items, since they also have a nonzero weight in EASE_R.
+    The neighborhood_size is the accuracy knob, the larger the closer W is to EASE_R and the slower the fit,
+    with neighborhood_size >= n_items - 1 W is EASE_R. topK sets the density of W, the largest topK weights of each
+    column are kept.
+    """
+
+    RECOMMENDER_NAME = "SparseEASE_R_Recommender"
+
+    def __init__(self, URM_train, verbose=True):
+        super(SparseEASE_R_Recommender, self).__init__(URM_train, verbose=verbose)
+
+    def fit(self, topK=100, l2_norm=1e3, neighborhood_size=200, normalize_matrix=False, batch_size=256,
+            batch_memory_MB=64):
+        """
+        :param topK:                number of weights kept for each item, at most neighborhood_size
+        :param neighborhood_size:   number of items each item is regressed on, the co-occurring ones first
+        :param batch_size:          maximum number of items whose systems are solved together
+        :param batch_memory_MB:     maximum size of the systems of a batch, batch_size is reduced so that the stacked
+                                    neighborhood_size x neighborhood_size systems and the copy solve makes fit in it
+        """
+
+        self.topK = topK
+        self.l2_norm = l2_norm
+        self.neighborhood_size = neighborhood_size
+
+        start_time = time.time()
+        self._print("Fitting model... ")
+
+        if normalize_matrix:
+            # Normalize rows and then columns
+            self.URM_train = normalize(self.URM_train, norm='l2', axis=1)
+            self.URM_train = normalize(self.URM_train, norm='l2', axis=0)
+            self.URM_train = sps.csr_matrix(self.URM_train)
+
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+        n_items = URM_train.shape[1]
+
+        # Sparse Gram matrix, symmetric so its columns are also its rows
+        gram_matrix = check_matrix(URM_train.T.dot(URM_train), 'csr', dtype=np.float32)
+
+        # Each system takes 4 bytes per cell and np.linalg.solve copies it
+        system_bytes = 2 * 4 * min(self.neighborhood_size, n_items) ** 2
+        batch_size = int(max(1, min(batch_size, batch_memory_MB * 1e6 // system_bytes)))
+
+        rows, cols, values = [], [], []
+
+        for start_item in range(0, n_items, batch_size):
+            end_item = min(start_item + batch_size, n_items)
+
+            neighbors_list = [self._get_neighbors(gram_matrix, item_id) for item_id in range(start_item, end_item)]
+            max_neighbors = max([len(neighbors) for neighbors, _ in neighbors_list] + [1])
+
+            # Items with fewer neighbors are padded with an identity block and a zero target, whose solution is zero
+            A = np.zeros((end_item - start_item, max_neighbors, max_neighbors), dtype=np.float32)
+            A[:] = np.eye(max_neighbors, dtype=np.float32)
+            target = np.zeros((end_item - start_item, max_neighbors, 1), dtype=np.float32)
+
+            for batch_index, (neighbors, co_occurrence) in enumerate(neighbors_list):
+                n_neighbors = len(neighbors)
+
+                A[batch_index, :n_neighbors, :n_neighbors] = gram_matrix[neighbors][:, neighbors].toarray()
+                A[batch_index, np.arange(n_neighbors), np.arange(n_neighbors)] += l2_norm
+                target[batch_index, :n_neighbors, 0] = co_occurrence
+
+            weights_batch = np.linalg.solve(A, target)[:, :, 0]
+
+            for batch_index, (neighbors, _) in enumerate(neighbors_list):
+                weights = weights_batch[batch_index, :len(neighbors)]
+
+                if self.topK < len(neighbors):
+                    top_k_positions = np.argpartition(-weights, self.topK - 1)[:self.topK]
+                    neighbors, weights = neighbors[top_k_positions], weights[top_k_positions]
+
+                non_zero_mask = weights != 0.0
+
+                rows.append(neighbors[non_zero_mask])
+                cols.append(np.full(non_zero_mask.sum(), start_item + batch_index, dtype=np.int32))
+                values.append(weights[non_zero_mask])
+
+        self.W_sparse = sps.csc_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                       shape=(n_items, n_items), dtype=np.float32)
+        self.W_sparse = check_matrix(self.W_sparse, format='csr', dtype=np.float32)
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+        self._print("Fitting model... done in {:.2f} {}".format(new_time_value, new_time_unit))
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def _get_neighbors(self, gram_matrix, item_id):
+        """
+        :return:    the neighborhood_size items with the largest co-occurrence with item_id, itself excluded,
+                    and their co-occurrence. If there are fewer, the items with the largest two-step co-occurrence
+                    and then the remaining items are added, with zero co-occurrence
+        """
+
+        start_pos = gram_matrix.indptr[item_id]
+        end_pos = gram_matrix.indptr[item_id + 1]
+
+        candidates = gram_matrix.indices[start_pos:end_pos]
+        co_occurrence = gram_matrix.data[start_pos:end_pos]
+
+        not_self_mask = candidates != item_id
+        candidates, co_occurrence = candidates[not_self_mask], co_occurrence[not_self_mask]
+
+        if len(candidates) > self.neighborhood_size:
+            top_positions = np.argpartition(-co_occurrence, self.neighborhood_size - 1)[:self.neighborhood_size]
+            candidates, co_occurrence = candidates[top_positions], co_occurrence[top_positions]
+
+        n_missing = min(self.neighborhood_size, gram_matrix.shape[0] - 1) - len(candidates)
+
+        if n_missing > 0:
+            fill_neighbors = self._get_fill_neighbors(gram_matrix, item_id, candidates, n_missing)
+            candidates = np.concatenate((candidates, fill_neighbors))
+            co_occurrence = np.concatenate((co_occurrence, np.zeros(n_missing, dtype=co_occurrence.dtype)))
+
+        return candidates, co_occurrence
+
+    def _get_fill_neighbors(self, gram_matrix, item_id, candidates, n_missing):
+        """
+        :return:    the n_missing items, other than item_id and candidates, with the largest two-step co-occurrence
+                    G[item_id] * G, then the remaining items by index
+        """
+
+        excluded_mask = np.zeros(gram_matrix.shape[0], dtype=np.bool_)
+        excluded_mask[candidates] = True
+        excluded_mask[item_id] = True
+
+        two_step = gram_matrix[item_id].dot(gram_matrix).tocsr()
+        two_step_items, two_step_values = two_step.indices, two_step.data
+
+        valid_mask = np.logical_and(np.logical_not(excluded_mask[two_step_items]), two_step_values != 0)
+        two_step_items, two_step_values = two_step_items[valid_mask], two_step_values[valid_mask]
+
+        if len(two_step_items) > n_missing:
+            top_positions = np.argpartition(-two_step_values, n_missing - 1)[:n_missing]
+            return two_step_items[top_positions]
+
+        excluded_mask[two_step_items] = True
+        remaining_items = np.flatnonzero(np.logical_not(excluded_mask))[:n_missing - len(two_step_items)]
+
+        return np.concatenate((two_step_items, remaining_items)).astype(candidates.dtype)
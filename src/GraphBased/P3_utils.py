@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import numpy as np
+import scipy.sparse as sps
+
+from sklearn.preprocessing import normalize
+from ..Base.Recommender_utils import check_matrix, csr_rows_topK
+from ..Base.DataIO import DataIO
+
+
+def compute_P3_rows(URM_train, URM_train_csc, row_ids, alpha=1., degree=None, topK=100, block_dim=200):
+    """
+    Computes the rows row_ids of the item-item random walk matrix Piu * Pui * diag(degree) as done in the fit of
+    P3alpha (degree None) and RP3beta, without the item itself and with the topK values of each row.
+    Only the users who interacted with the items in row_ids and their profiles are used.
+    :param URM_train_csc:   URM_train in CSC format
+    :return:                CSR matrix len(row_ids) x n_items
+    """
+
+    n_items = URM_train.shape[1]
+
+    # Piu rows, the items are column-normalized and "boolean"
+    Piu_rows = check_matrix(URM_train_csc[:, row_ids].T, 'csr', dtype=np.float32)
+    Piu_rows.data = np.ones(Piu_rows.data.size, np.float32)
+    Piu_rows = normalize(Piu_rows, norm='l1', axis=1)
+
+    users = np.unique(Piu_rows.indices)
+    Piu_rows = Piu_rows[:, users]
+
+    # Pui rows of the users reached by the walk, row-normalized
+    Pui_rows = normalize(URM_train[users], norm='l1', axis=1)
+
+    if alpha != 1.:
+        Pui_rows = Pui_rows.power(alpha)
+        Piu_rows = Piu_rows.power(alpha)
+
+    rows, cols, values = [], [], []
+
+    for current_block_start_row in range(0, len(row_ids), block_dim):
+
+        block_row_ids = row_ids[current_block_start_row:current_block_start_row + block_dim]
+
+        similarity_block = (Piu_rows[current_block_start_row:current_block_start_row + block_dim, :] * Pui_rows).toarray()
+
+        for row_in_block in range(len(block_row_ids)):
+
+            if degree is None:
+                row_data = similarity_block[row_in_block, :]
+            else:
+                row_data = np.multiply(similarity_block[row_in_block, :], degree)
+
+            row_data[block_row_ids[row_in_block]] = 0
+
+            best = row_data.argsort()[::-1][:topK]
+
+            notZerosMask = row_data[best] != 0.0
+
+            rows.append(np.full(notZerosMask.sum(), current_block_start_row + row_in_block, dtype=np.int32))
+            cols.append(best[notZerosMask])
+            values.append(row_data[best][notZerosMask])
+
+    if len(rows) == 0:
+        return sps.csr_matrix((len(row_ids), n_items), dtype=np.float32)
+
+    return sps.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(row_ids), n_items), dtype=np.float32)
+
+
+def replace_rows(W, row_ids, W_rows):
+    """
+    Returns a copy of the CSR matrix W in which the rows row_ids are replaced by the rows of W_rows
+    """
+
+    n_rows = W.shape[0]
+
+    keep_mask = np.ones(n_rows, dtype=np.float32)
+    keep_mask[row_ids] = 0.0
+
+    placement = sps.csr_matrix((np.ones(len(row_ids), dtype=np.float32), (row_ids, np.arange(len(row_ids)))),
+                               shape=(n_rows, len(row_ids)))
+
+    W_new = sps.diags(keep_mask).dot(W) + placement.dot(W_rows)
+    W_new.eliminate_zeros()
+
+    return check_matrix(W_new, 'csr', dtype=np.float32)
+
+
+def columns_topK(W_rows_topK, W_topK, column_ids, topK):
+    """
+    Applies the column-wise topK selection of similarityMatrixTopK only to the columns column_ids of W_rows_topK,
+    the other columns are taken from W_topK, the already selected matrix
+    """
+
+    n_columns = W_topK.shape[1]
+
+    keep_mask = np.ones(n_columns, dtype=np.float32)
+    keep_mask[column_ids] = 0.0
+
+    # Columns of W_rows_topK as rows of its transpose
+    columns = check_matrix(check_matrix(W_rows_topK, 'csc', dtype=np.float32)[:, column_ids].T, 'csr', dtype=np.float32)
+    columns = csr_rows_topK(columns, topK)
+
+    placement = sps.csr_matrix((np.ones(len(column_ids), dtype=np.float32), (np.arange(len(column_ids)), column_ids)),
+                               shape=(len(column_ids), n_columns))
+
+    W_new = W_topK.dot(sps.diags(keep_mask)) + columns.T.dot(placement)
+    W_new.eliminate_zeros()
+
+    return check_matrix(W_new, 'csr', dtype=np.float32)
+
+
+class P3_Incremental_Update(object):
+    """
+    Adds to P3alpha and RP3beta the update of W_sparse when new interactions are appended to URM_train.
+    Only the rows of the walk matrix of the items interacted by the users in the delta change, because their Pui
+    rows and the Piu rows of the new items are the only ones which change, so only those rows are computed again.
+    The degree of the new items also changes, in RP3beta the cells of those columns in the other rows are rescaled.
+
+    The class requires the attributes in UPDATE_HYPERPARAMETERS and the method _get_degree of the recommender.
+    The matrix W_sparse_rows_topK is W_sparse before the column-wise topK selection, which is kept by fit to be able
+    to apply it again on the changed columns. Both are saved with the model, so a loaded model can be updated.
+    """
+
+    UPDATE_HYPERPARAMETERS = ["alpha", "topK", "normalize_similarity", "min_rating", "implicit"]
+
+    def save_model(self, folder_path, file_name=None):
+
+        if file_name is None:
+            file_name = self.RECOMMENDER_NAME
+
+        self._print("Saving model in file '{}'".format(folder_path + file_name))
+
+        data_dict_to_save = {"W_sparse": self.W_sparse,
+                             "W_sparse_rows_topK": self.W_sparse_rows_topK}
+
+        for attrib_name in self.UPDATE_HYPERPARAMETERS:
+            data_dict_to_save[attrib_name] = getattr(self, attrib_name)
+
+        dataIO = DataIO(folder_path=folder_path)
+        dataIO.save_data(file_name=file_name, data_dict_to_save=data_dict_to_save)
+
+        self._print("Saving complete")
+
+    def _get_degree(self, item_degree):
+        """
+        :return: the array multiplying the columns of the walk matrix, None for no degree penalization
+        """
+        return None
+
+    def update_model(self, URM_delta, exact=False):
+        """
+        Adds the interactions in URM_delta to URM_train and updates W_sparse computing again only the changed rows
+        :param URM_delta:   sparse matrix with the same shape of URM_train with the new interactions
+        :param exact:       if True the rows of the items co-occurring with items whose degree changed are computed
+                            again as well, otherwise their cells are only rescaled and their topK items not updated.
+                            The column-wise topK is then selected again on all the columns of the rescaled rows.
+                            There is no difference when the degree is not used
+        :return:            array of the items whose row has been computed again
+        """
+
+        missing_attributes = [attrib_name for attrib_name in self.UPDATE_HYPERPARAMETERS if not hasattr(self, attrib_name)]
+
+        if self.W_sparse_rows_topK is None and getattr(self, "topK", None) != False:
+            missing_attributes.append("W_sparse_rows_topK")
+
+        assert len(missing_attributes) == 0, "{}: the model has no {}, it was not fitted or was saved without them".format(
+            self.RECOMMENDER_NAME, missing_attributes)
+
+        URM_delta = check_matrix(URM_delta, 'csr', dtype=np.float32)
+        URM_delta.eliminate_zeros()
+
+        assert URM_delta.shape == self.URM_train.shape, \
+            "{}: URM_delta shape is {}, while URM_train has {}".format(self.RECOMMENDER_NAME, URM_delta.shape,
+                                                                      self.URM_train.shape)
+
+        if self.min_rating > 0:
+            URM_delta.data[URM_delta.data < self.min_rating] = 0
+            URM_delta.eliminate_zeros()
+
+        n_items = self.URM_train.shape[1]
+        old_item_degree = np.bincount(self.URM_train.indices, minlength=n_items)
+
+        self.URM_train = check_matrix(self.URM_train + URM_delta, 'csr', dtype=np.float32)
+
+        if self.min_rating > 0 and self.implicit:
+            self.URM_train.data = np.ones(self.URM_train.data.size, dtype=np.float32)
+
+        URM_train_csc = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+        new_item_degree = np.ediff1d(URM_train_csc.indptr)
+
+        self._cold_user_mask = np.ediff1d(self.URM_train.indptr) == 0
+        self._cold_item_mask = new_item_degree == 0
+
+        touched_users = np.unique(URM_delta.nonzero()[0])
+        row_ids = np.unique(self.URM_train[touched_users].indices)
+
+        old_degree = self._get_degree(old_item_degree)
+        degree = self._get_degree(new_item_degree)
+
+        degree_changed = np.flatnonzero(old_item_degree != new_item_degree) if degree is not None else np.array([], dtype=np.int32)
+
+        if exact and len(degree_changed) > 0:
+            degree_changed_users = np.unique(URM_train_csc[:, degree_changed].indices)
+            row_ids = np.union1d(row_ids, self.URM_train[degree_changed_users].indices)
+
+        W_rows = compute_P3_rows(self.URM_train, URM_train_csc, row_ids, alpha=self.alpha, degree=degree,
+                                 topK=self.topK)
+
+        if self.normalize_similarity:
+            W_rows = normalize(W_rows, norm='l1', axis=1)
+
+        W_sparse_rows_topK = self.W_sparse_rows_topK if self.W_sparse_rows_topK is not None else self.W_sparse
+        W_sparse_rows_topK = check_matrix(W_sparse_rows_topK, 'csr', dtype=np.float32)
+
+        # Columns whose cells change, either because they appear in the old or new changed rows or due to the degree
+        changed_columns = [W_sparse_rows_topK[row_ids].indices, W_rows.indices, degree_changed]
+
+        if not exact and len(degree_changed) > 0:
+            # Items without interactions before the update had no cells, their scale does not matter
+            column_scale = np.ones(n_items, dtype=np.float32)
+            old_degree_nonzero = old_degree[degree_changed] != 0
+            column_scale[degree_changed[old_degree_nonzero]] = degree[degree_changed[old_degree_nonzero]] / \
+                                                               old_degree[degree_changed[old_degree_nonzero]]
+
+            W_sparse_rows_topK = W_sparse_rows_topK.dot(sps.diags(column_scale))
+
+            if self.normalize_similarity:
+                W_sparse_rows_topK = normalize(W_sparse_rows_topK, norm='l1', axis=1)
+
+                # The normalization changes all the cells of the rescaled rows, so all their columns change
+                rescaled_rows = np.unique(W_sparse_rows_topK.tocsc()[:, degree_changed].indices)
+                changed_columns.append(W_sparse_rows_topK[rescaled_rows].indices)
+
+        W_sparse_rows_topK = replace_rows(W_sparse_rows_topK, row_ids, W_rows)
+
+        if self.topK != False:
+            self.W_sparse_rows_topK = W_sparse_rows_topK
+            self.W_sparse = columns_topK(W_sparse_rows_topK, check_matrix(self.W_sparse, 'csr', dtype=np.float32),
+                                         np.unique(np.concatenate(changed_columns)).astype(np.int32), self.topK)
+        else:
+            self.W_sparse = W_sparse_rows_topK
+
+        return row_ids
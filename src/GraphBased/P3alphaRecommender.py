@@ -11,10 +11,11 @@ from sklearn.preprocessing import normalize
 from ..Base.Recommender_utils import check_matrix, similarityMatrixTopK
 
 from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from .P3_utils import P3_Incremental_Update
 import time, sys
 
 
-class P3alphaRecommender(BaseItemSimilarityMatrixRecommender):
+class P3alphaRecommender(P3_Incremental_Update, BaseItemSimilarityMatrixRecommender):
     """ P3alpha recommender """
 
     RECOMMENDER_NAME = "P3alphaRecommender"
@@ -22,6 +23,8 @@ class P3alphaRecommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, verbose=True):
         super(P3alphaRecommender, self).__init__(URM_train, verbose=verbose)
 
+        self.W_sparse_rows_topK = None
+
     def __str__(self):
         return "P3alpha(alpha={}, min_rating={}, topk={}, implicit={}, normalize_similarity={})".format(self.alpha,
                                                                                                         self.min_rating,
@@ -129,6 +132,9 @@ class P3alphaRecommender(BaseItemSimilarityMatrixRecommender):
         if self.normalize_similarity:
             self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
 
+        # Kept for update_model, which applies the column-wise topK again only on the changed columns
+        self.W_sparse_rows_topK = check_matrix(self.W_sparse, format='csr')
+
         if self.topK != False:
             self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
 
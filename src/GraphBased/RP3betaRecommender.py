@@ -11,23 +11,38 @@ from sklearn.preprocessing import normalize
 from ..Base.Recommender_utils import check_matrix, similarityMatrixTopK
 
 from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from .P3_utils import P3_Incremental_Update
 import time, sys
 
 
-class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
+class RP3betaRecommender(P3_Incremental_Update, BaseItemSimilarityMatrixRecommender):
     """ RP3beta recommender """
 
     RECOMMENDER_NAME = "RP3betaRecommender"
 
+    UPDATE_HYPERPARAMETERS = P3_Incremental_Update.UPDATE_HYPERPARAMETERS + ["beta"]
+
     def __init__(self, URM_train, verbose=True):
         super(RP3betaRecommender, self).__init__(URM_train, verbose=verbose)
 
+        self.W_sparse_rows_topK = None
+
     def __str__(self):
         return "RP3beta(alpha={}, beta={}, min_rating={}, topk={}, implicit={}, normalize_similarity={})".format(
             self.alpha,
             self.beta, self.min_rating, self.topK,
             self.implicit, self.normalize_similarity)
 
+    def _get_degree(self, item_degree):
+
+        # Some items might have no interactions, make sure their degree remains zero
+        degree = np.zeros(len(item_degree))
+        nonZeroMask = item_degree != 0
+
+        degree[nonZeroMask] = np.power(item_degree[nonZeroMask].astype(np.float64), -self.beta)
+
+        return degree
+
     def fit(self, alpha=1., beta=0.6, min_rating=0, topK=100, implicit=False, normalize_similarity=True):
 
         self.alpha = alpha
@@ -139,6 +154,9 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
         if self.normalize_similarity:
             self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
 
+        # Kept for update_model, which applies the column-wise topK again only on the changed columns
+        self.W_sparse_rows_topK = check_matrix(self.W_sparse, format='csr')
+
         if self.topK != False:
             self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
 
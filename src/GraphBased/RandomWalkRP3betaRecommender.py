@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import multiprocessing
+import time, sys
+
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.preprocessing import normalize
+from ..Base.Recommender_utils import check_matrix, similarityMatrixTopK, csr_rows_topK
+
+from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from .P3_utils import compute_P3_rows
+from ..Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+def rows_topK_overlap(W_rows, W_rows_reference):
+    """
+    Average over the rows of W_rows_reference with at least one value of the fraction of its items which are
+    also in the same row of W_rows
+    """
+
+    W_rows = check_matrix(W_rows, 'csr', dtype=np.float32)
+    W_rows_reference = check_matrix(W_rows_reference, 'csr', dtype=np.float32)
+
+    overlap = []
+
+    for row_index in range(W_rows_reference.shape[0]):
+
+        reference_items = W_rows_reference.indices[W_rows_reference.indptr[row_index]:W_rows_reference.indptr[row_index + 1]]
+
+        if len(reference_items) > 0:
+            items = W_rows.indices[W_rows.indptr[row_index]:W_rows.indptr[row_index + 1]]
+            overlap.append(np.isin(reference_items, items).mean())
+
+    return np.mean(overlap) if len(overlap) > 0 else 1.0
+
+
+class RandomWalkRP3betaRecommender(BaseItemSimilarityMatrixRecommender):
+    """
+    Monte-Carlo approximation of RP3beta, P3alpha if beta is 0.
+
+    Instead of computing the two-hop product Piu * Pui, whose cost grows with the square of the item popularity,
+    each row is estimated from walks_per_item random walks item -> user -> item, as in Pixie:
+        C. Eksombatchai et al., Pixie: a system for recommending 3+ billion items to 200+ million users in real-time,
+        WWW 2018.
+    The user is sampled uniformly among the users of the item and the next item proportionally to the ratings of the
+    user. Each walk is weighted so that the visit counts are an unbiased estimate of the rows of (Piu * Pui)^alpha
+    as computed by P3alpha, then the degree penalization, topK selection and normalization are the same of RP3beta.
+    More walks_per_item give a more accurate similarity, the estimate of the most similar items converges first.
+
+    The walks of chunks of items are sampled in parallel threads, each with its own random state.
+    To use it on the item-feature graph pass the transposed combined matrix, as in FeatureCombinedRP3betaRecommender.
+    """
+
+    RECOMMENDER_NAME = "RandomWalkRP3betaRecommender"
+
+    def __init__(self, URM_train, verbose=True):
+        super(RandomWalkRP3betaRecommender, self).__init__(URM_train, verbose=verbose)
+
+    def __str__(self):
+        return "RandomWalkRP3beta(alpha={}, beta={}, walks_per_item={}, min_rating={}, topk={}, implicit={}, normalize_similarity={})".format(
+            self.alpha, self.beta, self.walks_per_item, self.min_rating, self.topK,
+            self.implicit, self.normalize_similarity)
+
+    def fit(self, topK=100, alpha=1., beta=0.6, walks_per_item=1000, min_rating=0, implicit=False,
+            normalize_similarity=True, num_threads=multiprocessing.cpu_count(), walks_per_chunk=2000000,
+            random_seed=None, overlap_sample_size=0):
+        """
+        :param walks_per_item:          number of walks sampled from each item, the accuracy increases with it
+        :param num_threads:             number of threads sampling chunks of items in parallel
+        :param walks_per_chunk:         approximate number of walks sampled together, bounds the memory usage
+        :param overlap_sample_size:     if greater than 0 the rows of that many random items are also computed
+                                        exactly and the overlap of their topK items is printed and stored in
+                                        self.topK_overlap
+        """
+
+        self.topK = topK
+        self.alpha = alpha
+        self.beta = beta
+        self.walks_per_item = walks_per_item
+        self.min_rating = min_rating
+        self.implicit = implicit
+        self.normalize_similarity = normalize_similarity
+
+        if self.min_rating > 0:
+            self.URM_train.data[self.URM_train.data < self.min_rating] = 0
+            self.URM_train.eliminate_zeros()
+            if self.implicit:
+                self.URM_train.data = np.ones(self.URM_train.data.size, dtype=np.float32)
+
+        start_time = time.time()
+
+        n_items = self.URM_train.shape[1]
+
+        URM_train = check_matrix(self.URM_train, 'csr', dtype=np.float32)
+        URM_train_csc = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+
+        item_popularity = np.ediff1d(URM_train_csc.indptr)
+
+        # Taking the degree of each item to penalize top popular
+        # Some items might have no interactions, make sure their degree remains zero
+        degree = np.zeros(n_items)
+        nonZeroMask = item_popularity != 0
+        degree[nonZeroMask] = np.power(item_popularity[nonZeroMask].astype(np.float64), -self.beta)
+
+        # The next item of a walk is found sampling uniformly the cumulative ratings of the user
+        cumulative_data = np.cumsum(URM_train.data, dtype=np.float64)
+        user_start_cumulative = np.concatenate(([0.0], cumulative_data))[URM_train.indptr[:-1]]
+        user_rating_sum = np.concatenate(([0.0], cumulative_data))[URM_train.indptr[1:]] - user_start_cumulative
+
+        # With equal ratings the next item is sampled uniformly, without searching the cumulative ratings
+        uniform_ratings = URM_train.nnz == 0 or np.all(URM_train.data == URM_train.data[0])
+
+        walk_context = (URM_train, URM_train_csc, item_popularity, cumulative_data, user_start_cumulative,
+                        user_rating_sum, degree, uniform_ratings)
+
+        items_per_chunk = max(1, walks_per_chunk // max(1, self.walks_per_item))
+        chunk_start_list = list(range(0, n_items, items_per_chunk))
+
+        seed_state = np.random.RandomState(random_seed)
+        chunk_seed_list = seed_state.randint(np.iinfo(np.int32).max, size=len(chunk_start_list))
+
+        def _fit_chunk(chunk_index):
+            start_item = chunk_start_list[chunk_index]
+            item_ids = np.arange(start_item, min(start_item + items_per_chunk, n_items))
+
+            return self._estimate_rows(item_ids, walk_context, np.random.RandomState(chunk_seed_list[chunk_index]))
+
+        if num_threads > 1:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                W_rows_list = list(executor.map(_fit_chunk, range(len(chunk_start_list))))
+        else:
+            W_rows_list = [_fit_chunk(chunk_index) for chunk_index in range(len(chunk_start_list))]
+
+        self.W_sparse = sps.vstack(W_rows_list, format='csr')
+
+        if self.normalize_similarity:
+            self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
+
+        W_sparse_rows_topK = self.W_sparse
+
+        if self.topK != False:
+            self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
+
+        self.W_sparse = check_matrix(self.W_sparse, format='csr')
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+
+        self._print("Sampled {} walks for {} items in {:.2f} {}. Walks per second: {:.0f}".format(
+            self.walks_per_item * n_items, n_items, new_time_value, new_time_unit,
+            self.walks_per_item * n_items / (time.time() - start_time)))
+
+        if overlap_sample_size > 0:
+            self.topK_overlap = self._compute_exact_topK_overlap(W_sparse_rows_topK, URM_train, URM_train_csc, degree,
+                                                                 overlap_sample_size, seed_state)
+
+            self._print("Overlap of the topK items with the exact RP3beta on {} items: {:.4f}".format(
+                min(overlap_sample_size, n_items), self.topK_overlap))
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def _estimate_rows(self, item_ids, walk_context, random_state):
+        """
+        Samples walks_per_item walks from each item in item_ids
+        :return:    CSR matrix len(item_ids) x n_items with the estimated rows, without the item itself and
+                    with the topK values of each row
+        """
+
+        URM_train, URM_train_csc, item_popularity, cumulative_data, user_start_cumulative, user_rating_sum, degree, \
+            uniform_ratings = walk_context
+
+        n_items = URM_train.shape[1]
+
+        # Items with no users have no walks and their rows are empty
+        walk_row = np.repeat(np.flatnonzero(item_popularity[item_ids] > 0), self.walks_per_item)
+        walk_item = item_ids[walk_row]
+
+        # First hop, a user of the item sampled uniformly, which is the Piu probability
+        user_position = URM_train_csc.indptr[walk_item] + \
+                        (random_state.random_sample(len(walk_item)) * item_popularity[walk_item]).astype(np.int64)
+        walk_user = URM_train_csc.indices[user_position]
+
+        # Second hop, an item of the user sampled proportionally to the rating, which is the Pui probability
+        if uniform_ratings:
+            item_position = URM_train.indptr[walk_user] + (random_state.random_sample(len(walk_user)) *
+                                                           (URM_train.indptr[walk_user + 1] - URM_train.indptr[walk_user])).astype(np.int64)
+        else:
+            rating_target = user_start_cumulative[walk_user] + random_state.random_sample(len(walk_user)) * user_rating_sum[walk_user]
+            item_position = np.searchsorted(cumulative_data, rating_target, side='right')
+            item_position = np.minimum(item_position, URM_train.indptr[walk_user + 1] - 1)
+        walk_target = URM_train.indices[item_position]
+
+        # Importance weights p^alpha / p of both hops, they are 1 for alpha = 1
+        walk_weight = np.full(len(walk_item), 1.0 / self.walks_per_item)
+
+        if self.alpha != 1.:
+            walk_weight *= np.power(item_popularity[walk_item].astype(np.float64), 1.0 - self.alpha)
+            walk_weight *= np.power(URM_train.data[item_position] / user_rating_sum[walk_user], self.alpha - 1.0)
+
+        walk_weight *= degree[walk_target]
+
+        # The item itself is never recommended
+        not_self_mask = walk_target != walk_item
+
+        W_rows = sps.csr_matrix((walk_weight[not_self_mask], (walk_row[not_self_mask], walk_target[not_self_mask])),
+                                shape=(len(item_ids), n_items), dtype=np.float32)
+        W_rows.sum_duplicates()
+
+        if self.topK != False:
+            W_rows = csr_rows_topK(W_rows, self.topK)
+
+        return W_rows
+
+    def _compute_exact_topK_overlap(self, W_sparse_rows_topK, URM_train, URM_train_csc, degree, n_sample_items,
+                                    random_state):
+
+        sample_items = np.sort(random_state.choice(URM_train.shape[1], min(n_sample_items, URM_train.shape[1]),
+                                                   replace=False))
+
+        W_rows_exact = compute_P3_rows(URM_train, URM_train_csc, sample_items, alpha=self.alpha, degree=degree,
+                                       topK=self.topK)
+
+        return rows_topK_overlap(W_sparse_rows_topK[sample_items], W_rows_exact)
@@ -6,8 +6,15 @@ Created on 01/12/2020
 @author: Alessandro Sanvito
 """
 
+import numpy as np
+import scipy.sparse as sps
+
+from sklearn.preprocessing import normalize
+from ..Base.Recommender_utils import check_matrix
 from ..Base.BaseSimilarityMatrixRecommender import BaseUserSimilarityMatrixRecommender
+from ..Base.DataIO import DataIO
 from .RP3betaRecommender import RP3betaRecommender
+from .P3_utils import compute_P3_rows, replace_rows
 
 class UserRP3betaRecommender(BaseUserSimilarityMatrixRecommender):
     """ Recommender based on random walks"""
@@ -17,8 +24,88 @@ class UserRP3betaRecommender(BaseUserSimilarityMatrixRecommender):
     def __init__(self, URM_train, verbose=True):
         super(UserRP3betaRecommender, self).__init__(URM_train, verbose=verbose)
 
+        self.fitted_user_ids = None
+
+    def fit(self, topK=100, alpha=1., beta=0.6, min_rating=0, implicit=False, normalize_similarity=False, user_ids=None,
+            column_topK=None):
+        """
+        :param user_ids:    if not None only the rows of W_sparse of these users are computed, e.g., the target users
+                            or the users to evaluate, so time and memory depend on their number. Only these users can
+                            then be recommended to. It requires column_topK=False
+        :param column_topK: if True the column-wise topK selection of RP3beta is applied after the row-wise one. It
+                            requires all the rows, so it is not available with user_ids. Use False when tuning the
+                            hyperparameters of a model which will then be fitted with user_ids, so that they match.
+                            If None it is True for the full fit and False with user_ids
+        """
+
+        if column_topK is None:
+            column_topK = user_ids is None
+
+        assert user_ids is None or not column_topK, \
+            "{}: the fit restricted to user_ids cannot apply the column-wise topK, use column_topK=False".format(
+                self.RECOMMENDER_NAME)
+
+        if user_ids is None:
+            self.fitted_user_ids = None
+
+            calculator = RP3betaRecommender(self.URM_train.T, verbose=self.verbose)
+            calculator.fit(topK=topK, alpha=alpha, beta=beta, min_rating=min_rating, implicit=implicit, normalize_similarity=normalize_similarity)
+
+            if column_topK:
+                self.W_sparse = calculator.W_sparse
+            else:
+                self.W_sparse = calculator.W_sparse_rows_topK
+
+            return
+
+        self.fitted_user_ids = np.unique(np.asarray(user_ids, dtype=np.int32))
+
+        URM_train = self.URM_train.copy()
+
+        if min_rating > 0:
+            URM_train.data[URM_train.data < min_rating] = 0
+            URM_train.eliminate_zeros()
+            if implicit:
+                URM_train.data = np.ones(URM_train.data.size, dtype=np.float32)
+
+        # The random walk is on the transposed graph, where the users take the place of the items
+        URM_train_T = check_matrix(URM_train.T, 'csr', dtype=np.float32)
+        URM_train_T_csc = check_matrix(URM_train.T, 'csc', dtype=np.float32)
+
+        user_degree = np.ediff1d(URM_train.indptr)
+
+        degree = np.zeros(self.n_users)
+        nonZeroMask = user_degree != 0
+        degree[nonZeroMask] = np.power(user_degree[nonZeroMask].astype(np.float64), -beta)
+
+        W_rows = compute_P3_rows(URM_train_T, URM_train_T_csc, self.fitted_user_ids, alpha=alpha, degree=degree,
+                                 topK=topK)
+
+        if normalize_similarity:
+            W_rows = normalize(W_rows, norm='l1', axis=1)
+
+        self.W_sparse = replace_rows(sps.csr_matrix((self.n_users, self.n_users), dtype=np.float32),
+                                     self.fitted_user_ids, W_rows)
+
+    def save_model(self, folder_path, file_name=None):
+
+        if file_name is None:
+            file_name = self.RECOMMENDER_NAME
+
+        self._print("Saving model in file '{}'".format(folder_path + file_name))
+
+        data_dict_to_save = {"W_sparse": self.W_sparse,
+                             "fitted_user_ids": self.fitted_user_ids}
+
+        dataIO = DataIO(folder_path=folder_path)
+        dataIO.save_data(file_name=file_name, data_dict_to_save=data_dict_to_save)
+
+        self._print("Saving complete")
+
+    def _compute_item_score(self, user_id_array, items_to_compute=None):
+
+        assert self.fitted_user_ids is None or np.isin(user_id_array, self.fitted_user_ids).all(), \
+            "{}: the model was fitted only for a subset of the users, which does not contain all the requested ones".format(
+                self.RECOMMENDER_NAME)
 
-    def fit(self, topK=100, alpha=1., beta=0.6, min_rating=0, implicit=False, normalize_similarity=False):
-        calculator = RP3betaRecommender(self.URM_train.T, verbose=self.verbose)
-        calculator.fit(topK=topK, alpha=alpha, beta=beta, min_rating=min_rating, implicit=implicit, normalize_similarity=normalize_similarity)
-        self.W_sparse = calculator.W_sparse
\ No newline at end of file
+        return super(UserRP3betaRecommender, self)._compute_item_score(user_id_array, items_to_compute=items_to_compute)
@@ -7,13 +7,16 @@ Created on 15/11/2020
 """
 
 from ..Base.BaseRecommender import BaseRecommender
-from ..MatrixFactorization.PureSVDRecommender import PureSVDItemRecommender
+from ..MatrixFactorization.PureSVDRecommender import PureSVDItemRecommender, ProductLinearOperator, \
+    compute_randomized_svd
 from ..KNN.ItemKNNCBFCFSimilarityHybridRecommender import ItemKNNCBFCFSimilarityHybridRecommender
 
 
 class CBFCFPureSVDPipelinedRecommender(BaseRecommender):
     """ This recommender first builds a new user rating matrix using a CBFCF hybrid, then it uses the new matrix to fit
-        a PureSVD recommender
+        a PureSVD recommender.
+        The new matrix URM_train * W_sparse is nearly dense, so it is never computed: the SVD is computed on a
+        LinearOperator applying the product lazily.
     """
 
     RECOMMENDER_NAME = "CBFCF+PureSVDPipelinedRecommender"
@@ -40,24 +43,33 @@ class CBFCFPureSVDPipelinedRecommender(BaseRecommender):
             shrink_knncf=shrink_knncf,
             topK_knncbf=topK_knncbf,
             shrink_knncbf=shrink_knncbf,
-            similarity=similarity,
+            similarity_knncbf=similarity,
+            similarity_knncf=similarity,
             verbose=verbose
         )
 
         recommender.fit(topK, alpha)
 
-        self.recommender = PureSVDItemRecommender(recommender.URM_train.dot(recommender.W_sparse), verbose=verbose)
+        self.URM_CBFCF_operator = ProductLinearOperator(recommender.URM_train, recommender.W_sparse)
+
+        self.recommender = PureSVDItemRecommender(self.URM_train, verbose=verbose)
 
     def fit(
             self,
             num_factors=100,
-            topK=None
+            topK=None,
+            random_seed=None,
+            n_iter=4
     ):
-        self.recommender.fit(num_factors=num_factors, topK=topK)
-        self.recommender.URM_train = self.URM_train
+        U, Sigma, QT = compute_randomized_svd(self.URM_CBFCF_operator,
+                                              num_factors,
+                                              n_iter=n_iter,
+                                              random_seed=random_seed)
+
+        self.recommender.fit_from_item_factors(QT.T, topK=topK)
 
     def _compute_item_score(self, user_id_array, items_to_compute=None):
-        self.recommender._compute_item_score(user_id_array=user_id_array, items_to_compute=items_to_compute)
+        return self.recommender._compute_item_score(user_id_array=user_id_array, items_to_compute=items_to_compute)
 
     def save_model(self, folder_path, file_name=None):
         self.recommender.save_model(folder_path=folder_path,file_name=file_name)
@@ -1,9 +1,11 @@
 import implicit
 from ..Base.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
+from .ImplicitALSRecommender import ImplicitALSFoldInMixin
+from ..MatrixFactorization.IALSRecommender import compute_ALS_user_factors_from_confidence
 from src.Utils.ICM_preprocessing import *
 
 
-class FeatureCombinedImplicitALSRecommender(BaseMatrixFactorizationRecommender):
+class FeatureCombinedImplicitALSRecommender(ImplicitALSFoldInMixin, BaseMatrixFactorizationRecommender):
     """ImplicitALSRecommender recommender"""
 
     RECOMMENDER_NAME = "FeatureCombinedImplicitALSRecommender"
@@ -22,6 +24,10 @@ class FeatureCombinedImplicitALSRecommender(BaseMatrixFactorizationRecommender):
             **confidence_args
             ):
 
+        self.confidence_scaling = confidence_scaling
+        self.confidence_args = confidence_args
+        self.regularization = regularization
+
         self.rec = implicit.als.AlternatingLeastSquares(factors=factors, regularization=regularization,
                                                         use_native=use_native, use_cg=use_cg, use_gpu=use_gpu,
                                                         iterations=iterations,
@@ -43,3 +49,9 @@ class FeatureCombinedImplicitALSRecommender(BaseMatrixFactorizationRecommender):
 
         self.USER_factors = self.rec.user_factors
         self.ITEM_factors = self.rec.item_factors
+
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+        # The item factors are learned on the items x (users + features) matrix, a new user is one more column of it
+        C_profile = self._get_confidence_scaling()(profile_csr_rows, **self.confidence_args['URM'])
+
+        return compute_ALS_user_factors_from_confidence(C_profile.tocsr(), self.ITEM_factors, self.regularization)
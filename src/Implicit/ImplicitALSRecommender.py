@@ -1,8 +1,48 @@
 import implicit
+import importlib
 from ..Base.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
+from ..MatrixFactorization.IALSRecommender import compute_ALS_user_factors_from_confidence
 
 
-class ImplicitALSRecommender(BaseMatrixFactorizationRecommender):
+def get_confidence_scaling_name(confidence_scaling):
+    """
+    Name of a module level confidence scaling function, saved with the model in place of the function itself
+    """
+    return "{}.{}".format(confidence_scaling.__module__, confidence_scaling.__qualname__)
+
+
+def load_confidence_scaling(confidence_scaling_name):
+
+    module_name, function_name = confidence_scaling_name.rsplit(".", 1)
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class ImplicitALSFoldInMixin(object):
+    """
+    Saves with the model the regularization and the confidence scaling needed by the fold-in of new users,
+    the confidence scaling function is saved by name and imported again when the loaded model needs it
+    """
+
+    def _get_confidence_scaling(self):
+
+        if getattr(self, "confidence_scaling", None) is None:
+            assert getattr(self, "confidence_scaling_name", None) is not None, \
+                "{}: the confidence scaling is not available, the model was not fitted or was saved without it".format(
+                    self.RECOMMENDER_NAME)
+
+            self.confidence_scaling = load_confidence_scaling(self.confidence_scaling_name)
+
+        return self.confidence_scaling
+
+    def _get_additional_data_dict_to_save(self):
+        return {"confidence_scaling_name": get_confidence_scaling_name(self.confidence_scaling),
+                "confidence_args": self.confidence_args,
+                "regularization": self.regularization,
+                }
+
+
+class ImplicitALSRecommender(ImplicitALSFoldInMixin, BaseMatrixFactorizationRecommender):
     """ImplicitALSRecommender recommender"""
 
     RECOMMENDER_NAME = "ImplicitALSRecommender"
@@ -17,6 +57,10 @@ class ImplicitALSRecommender(BaseMatrixFactorizationRecommender):
             **confidence_args
             ):
 
+        self.confidence_scaling = confidence_scaling
+        self.confidence_args = confidence_args
+        self.regularization = regularization
+
         self.rec = implicit.als.AlternatingLeastSquares(factors=factors, regularization=regularization,
                                                         use_native=use_native, use_cg=use_cg, use_gpu=use_gpu,
                                                         iterations=iterations,
@@ -26,3 +70,8 @@ class ImplicitALSRecommender(BaseMatrixFactorizationRecommender):
 
         self.USER_factors = self.rec.user_factors
         self.ITEM_factors = self.rec.item_factors
+
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+        C_profile = self._get_confidence_scaling()(profile_csr_rows, **self.confidence_args)
+
+        return compute_ALS_user_factors_from_confidence(C_profile.tocsr(), self.ITEM_factors, self.regularization)
@@ -37,14 +37,22 @@ class _MatrixFactorization_Cython(BaseMatrixFactorizationRecommender, Incrementa
             negative_interactions_quota=0.0,
             init_mean=0.0, init_std_dev=0.1,
             user_reg=0.0, item_reg=0.0, bias_reg=0.0, positive_reg=0.0, negative_reg=0.0,
-            random_seed=None,
+            random_seed=None, vectorized_sampling=False, num_threads=1, hogwild_batch_size=None,
             **earlystopping_kwargs):
+        """
+        :param vectorized_sampling:     MF_BPR only, if True the samples of each epoch are generated at once
+                                        by BPR_Batch_Sampler
+        :param num_threads:             if greater than 1 the epochs are run in parallel with lock-free (Hogwild) updates
+        :param hogwild_batch_size:      number of samples each thread processes in a single task, if None the
+                                        mini-batches are split evenly among the num_threads threads
+        """
 
         self.num_factors = num_factors
         self.use_bias = use_bias
         self.sgd_mode = sgd_mode
         self.positive_threshold_BPR = positive_threshold_BPR
         self.learning_rate = learning_rate
+        self.user_reg = user_reg
 
         assert negative_interactions_quota >= 0.0 and negative_interactions_quota < 1.0, "{}: negative_interactions_quota must be a float value >=0 and < 1.0, provided was '{}'".format(
             self.RECOMMENDER_NAME, negative_interactions_quota)
@@ -69,7 +77,9 @@ class _MatrixFactorization_Cython(BaseMatrixFactorizationRecommender, Incrementa
                                                                 negative_interactions_quota=negative_interactions_quota,
                                                                 init_std_dev=init_std_dev,
                                                                 verbose=self.verbose,
-                                                                random_seed=random_seed)
+                                                                random_seed=random_seed,
+                                                                num_threads=num_threads,
+                                                                hogwild_batch_size=hogwild_batch_size)
 
         elif self.algorithm_name == "MF_BPR":
 
@@ -95,7 +105,10 @@ class _MatrixFactorization_Cython(BaseMatrixFactorizationRecommender, Incrementa
                                                                 init_mean=init_mean,
                                                                 init_std_dev=init_std_dev,
                                                                 verbose=self.verbose,
-                                                                random_seed=random_seed)
+                                                                random_seed=random_seed,
+                                                                vectorized_sampling=vectorized_sampling,
+                                                                num_threads=num_threads,
+                                                                hogwild_batch_size=hogwild_batch_size)
         self._prepare_model_for_validation()
         self._update_best_model()
 
@@ -193,6 +206,40 @@ class MatrixFactorization_FunkSVD_Cython(_MatrixFactorization_Cython):
     def fit(self, **key_args):
         super(MatrixFactorization_FunkSVD_Cython, self).fit(**key_args)
 
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+        """
+        Fold-in of the user factors as the ridge regression of the observed ratings, minus the biases, on the item
+        factors of the profile. SGD applies user_reg at every rating, hence the regularization grows with the profile
+        """
+
+        n_factors = self.ITEM_factors.shape[1]
+        USER_factors = np.zeros((profile_csr_rows.shape[0], n_factors), dtype=self.ITEM_factors.dtype)
+
+        for row_index in range(profile_csr_rows.shape[0]):
+
+            start_pos, end_pos = profile_csr_rows.indptr[row_index], profile_csr_rows.indptr[row_index + 1]
+
+            if start_pos == end_pos:
+                continue
+
+            profile = profile_csr_rows.indices[start_pos:end_pos]
+            ratings = profile_csr_rows.data[start_pos:end_pos]
+
+            if self.use_bias:
+                ratings = ratings - self.ITEM_bias[profile] - self.GLOBAL_bias
+
+            Q_profile = self.ITEM_factors[profile, :]
+
+            A = Q_profile.T.dot(Q_profile) + self.user_reg * len(profile) * np.eye(n_factors)
+
+            # With no regularization the system can be singular when the profile is short
+            USER_factors[row_index, :] = np.linalg.lstsq(A, Q_profile.T.dot(ratings), rcond=None)[0]
+
+        return USER_factors
+
+    def _get_additional_data_dict_to_save(self):
+        return {"user_reg": self.user_reg}
+
 
 class MatrixFactorization_AsySVD_Cython(_MatrixFactorization_Cython):
     """
@@ -16,6 +16,7 @@ Created on 07/09/17
 #defining NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
 
 from ...Base.Recommender_utils import check_matrix
+from ...Base.BPR_Batch_Sampler import BPR_Batch_Sampler
 
 import cython
 
@@ -24,8 +25,10 @@ cimport numpy as np
 import time
 import sys
 
-from libc.math cimport exp, sqrt
-from libc.stdlib cimport rand, srand, RAND_MAX
+from libc.math cimport exp, sqrt, pow
+from libc.stdlib cimport rand, srand, RAND_MAX, malloc, free
+
+from cython.parallel import prange, threadid
 
 
 cdef struct BPR_sample:
@@ -40,6 +43,131 @@ cdef struct MSE_sample:
     double rating
 
 
+cdef struct Hogwild_workspace:
+    # Thread-local mini-batch accumulators, only the touched users and items have a slot
+    long * user_slot
+    long * item_slot
+    long * user_ids
+    long * item_ids
+    long n_touched_users
+    long n_touched_items
+    double * user_accumulator
+    double * item_accumulator
+    double * user_bias_accumulator
+    double * item_bias_accumulator
+    double global_bias_accumulator
+    double * factor_buffer
+    double loss
+    np.uint64_t random_state
+
+
+
+cdef inline np.uint64_t xorshift_random(np.uint64_t * random_state) nogil:
+    """
+    xorshift64* generator, each thread of the hogwild epoch owns its state so no synchronization is needed
+    """
+
+    random_state[0] ^= random_state[0] >> 12
+    random_state[0] ^= random_state[0] << 25
+    random_state[0] ^= random_state[0] >> 27
+
+    return (random_state[0] * <np.uint64_t> 2685821657736338717) >> 16
+
+
+
+cdef int sampleBPR_nogil(int * URM_train_indptr, int * URM_train_indices, long n_users, long n_items,
+                         np.uint64_t * random_state, BPR_sample * sample) nogil:
+    """
+    Same sampling as MatrixFactorization_Cython_Epoch.sampleBPR_Cython, using the given random generator state
+    """
+
+    cdef long index, start_pos_seen_items
+    cdef int neg_item_selected, n_seen_items = 0
+
+    # Skip users with no interactions or with no negative items
+    while n_seen_items == 0 or n_seen_items == n_items:
+
+        sample.user = xorshift_random(random_state) % n_users
+
+        start_pos_seen_items = URM_train_indptr[sample.user]
+        n_seen_items = URM_train_indptr[sample.user+1] - start_pos_seen_items
+
+
+    index = xorshift_random(random_state) % n_seen_items
+
+    sample.pos_item = URM_train_indices[start_pos_seen_items + index]
+
+
+    neg_item_selected = False
+
+    while not neg_item_selected:
+
+        sample.neg_item = xorshift_random(random_state) % n_items
+
+        index = 0
+        # Indices data is sorted, so I don't need to go to the end of the current row
+        while index < n_seen_items and URM_train_indices[start_pos_seen_items + index] < sample.neg_item:
+            index+=1
+
+        if index == n_seen_items or URM_train_indices[start_pos_seen_items + index] > sample.neg_item:
+            neg_item_selected = True
+
+    return 0
+
+
+
+cdef int sampleMSE_nogil(int * URM_train_indptr, int * URM_train_indices, double * URM_train_data, long n_users, long n_items,
+                         int sample_negative_interactions_flag, double negative_interactions_quota,
+                         np.uint64_t * random_state, MSE_sample * sample) nogil:
+    """
+    Same sampling as MatrixFactorization_Cython_Epoch.sampleMSE_Cython, using the given random generator state
+    """
+
+    cdef long index, start_pos_seen_items
+    cdef int neg_item_selected, sample_positive, n_seen_items = 0
+
+    # Skip users with no interactions or with no negative items
+    while n_seen_items == 0 or n_seen_items == n_items:
+
+        sample.user = xorshift_random(random_state) % n_users
+
+        start_pos_seen_items = URM_train_indptr[sample.user]
+        n_seen_items = URM_train_indptr[sample.user+1] - start_pos_seen_items
+
+
+    # Decide to sample positive or negative, the generator returns 48 random bits
+    if sample_negative_interactions_flag:
+        sample_positive = xorshift_random(random_state) <= negative_interactions_quota * 281474976710656.0
+    else:
+        sample_positive = True
+
+
+    if sample_positive:
+
+        index = xorshift_random(random_state) % n_seen_items
+
+        sample.item = URM_train_indices[start_pos_seen_items + index]
+        sample.rating = URM_train_data[start_pos_seen_items + index]
+
+    else:
+
+        neg_item_selected = False
+
+        while not neg_item_selected:
+
+            sample.item = xorshift_random(random_state) % n_items
+            sample.rating = 0.0
+
+            index = 0
+            while index < n_seen_items and URM_train_indices[start_pos_seen_items + index] < sample.item:
+                index+=1
+
+            if index == n_seen_items or URM_train_indices[start_pos_seen_items + index] > sample.item:
+                neg_item_selected = True
+
+    return 0
+
+
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -86,7 +214,14 @@ cdef class MatrixFactorization_Cython_Epoch:
     cdef double [:,:] sgd_cache_bias_U_momentum_1, sgd_cache_bias_U_momentum_2
     cdef double [:,:] sgd_cache_bias_GLOBAL_momentum_1, sgd_cache_bias_GLOBAL_momentum_2
     cdef double beta_1, beta_2, beta_1_power_t, beta_2_power_t
-    cdef double momentum_1, momentum_2
+
+    # Vectorized BPR sampling
+    cdef int vectorized_sampling
+    cdef object batch_sampler
+
+    # Hogwild
+    cdef int num_threads, hogwild_batch_size
+    cdef np.uint64_t[:] thread_random_state
 
     SGD_MODE_VALUES = ["sgd", "adam", "adagrad", "rmsprop"]
     ALGORITHM_NAME_VALUES = ["FUNK_SVD", "ASY_SVD", "MF_BPR"]
@@ -99,7 +234,18 @@ cdef class MatrixFactorization_Cython_Epoch:
                  user_reg = 0.0, item_reg = 0.0, bias_reg = 0.0, positive_reg = 0.0, negative_reg = 0.0,
                  verbose = False, random_seed = None,
                  init_mean = 0.0, init_std_dev = 0.1,
-                 sgd_mode='sgd', gamma=0.995, beta_1=0.9, beta_2=0.999):
+                 sgd_mode='sgd', gamma=0.995, beta_1=0.9, beta_2=0.999,
+                 vectorized_sampling = False,
+                 num_threads = 1, hogwild_batch_size = None):
+        """
+        :param vectorized_sampling:     MF_BPR only, if True the samples of each epoch are generated at the beginning
+                                        of the epoch by BPR_Batch_Sampler, instead of one at a time
+        :param num_threads:             if greater than 1 each epoch is run in parallel by num_threads threads
+                                        updating the shared latent factors without locks (Hogwild)
+        :param hogwild_batch_size:      number of samples assigned to a thread at a time, rounded to whole mini-batches,
+                                        if None the mini-batches of each of the 5 rounds of the epoch are split evenly
+                                        among the threads
+        """
 
         super(MatrixFactorization_Cython_Epoch, self).__init__()
 
@@ -143,9 +289,31 @@ cdef class MatrixFactorization_Cython_Epoch:
             np.random.seed(seed=random_seed)
             srand(<unsigned int> int(random_seed))
 
+        self.vectorized_sampling = vectorized_sampling and algorithm_name == "MF_BPR"
+        self.batch_sampler = BPR_Batch_Sampler(URM_train, random_seed=random_seed) if self.vectorized_sampling else None
+
         self._init_latent_factors()
         self._init_minibatch_data_structures()
         self._init_adaptive_gradient_cache(sgd_mode, gamma, beta_1, beta_2)
+        self._init_hogwild(num_threads, hogwild_batch_size, random_seed)
+
+
+
+    def _init_hogwild(self, num_threads, hogwild_batch_size, random_seed):
+
+        assert num_threads >= 1, "MatrixFactorization_Cython_Epoch: num_threads must be a positive integer, provided value was {}".format(
+            num_threads)
+
+        assert hogwild_batch_size is None or hogwild_batch_size >= 1, "MatrixFactorization_Cython_Epoch: hogwild_batch_size must be None or a positive integer, provided value was {}".format(
+            hogwild_batch_size)
+
+        self.num_threads = num_threads
+
+        # 0 selects the size from the number of mini-batches of each round
+        self.hogwild_batch_size = 0 if hogwild_batch_size is None else hogwild_batch_size
+
+        # Each thread has its own random generator, the states are derived from random_seed
+        self.thread_random_state = np.random.RandomState(random_seed).randint(1, 2**62, size=num_threads, dtype=np.uint64)
 
 
 
@@ -272,7 +440,10 @@ cdef class MatrixFactorization_Cython_Epoch:
 
     def epochIteration_Cython(self):
 
-        if self.algorithm_is_funk_svd:
+        if self.num_threads > 1:
+            self._epochIteration_hogwild()
+
+        elif self.algorithm_is_funk_svd:
             self.epochIteration_Cython_FUNK_SVD_SGD()
 
         elif self.algorithm_is_asy_svd:
@@ -474,7 +645,7 @@ cdef class MatrixFactorization_Cython_Epoch:
                 local_gradient_bias_global = prediction_error - self.bias_reg * self.GLOBAL_bias[0]
 
                 # Compute adaptive gradients
-                local_gradient_bias_global = self.adaptive_gradient(local_gradient_bias_global, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2)
+                local_gradient_bias_global = self.adaptive_gradient(local_gradient_bias_global, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                 # Apply updates to bias and latent factors
                 self.GLOBAL_bias[0] += self.learning_rate * local_gradient_bias_global
@@ -494,8 +665,8 @@ cdef class MatrixFactorization_Cython_Epoch:
                     local_gradient_bias_user = prediction_error - self.bias_reg * self.USER_bias[sample.user]
 
                     # Compute adaptive gradients
-                    local_gradient_bias_item = self.adaptive_gradient(local_gradient_bias_item, sample.item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2)
-                    local_gradient_bias_user = self.adaptive_gradient(local_gradient_bias_user, sample.user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2)
+                    local_gradient_bias_item = self.adaptive_gradient(local_gradient_bias_item, sample.item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
+                    local_gradient_bias_user = self.adaptive_gradient(local_gradient_bias_user, sample.user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                     # Apply updates to bias
                     self.ITEM_bias[sample.item] += self.learning_rate * local_gradient_bias_item
@@ -517,7 +688,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
                         # Compute adaptive gradients USER
                         # I need to update NOT sample.item but item_id
-                        local_gradient_user = self.adaptive_gradient(local_gradient_user, item_id, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2)
+                        local_gradient_user = self.adaptive_gradient(local_gradient_user, item_id, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                         # Apply update to latent factors
                         self.USER_factors[item_id, factor_index] += self.learning_rate * local_gradient_user
@@ -535,7 +706,7 @@ cdef class MatrixFactorization_Cython_Epoch:
                     local_gradient_item = prediction_error * W_u - self.item_reg * H_i
 
                     # Compute adaptive gradients ITEM
-                    local_gradient_item = self.adaptive_gradient(local_gradient_item, sample.item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2)
+                    local_gradient_item = self.adaptive_gradient(local_gradient_item, sample.item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                     # Apply update to latent factors
                     self.ITEM_factors[sample.item, factor_index] += self.learning_rate * local_gradient_item
@@ -584,6 +755,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
 
         cdef BPR_sample sample
+        cdef int[:,:] epoch_samples
         cdef long u, i, j
         cdef long factor_index, num_current_batch, num_sample_in_batch, processed_samples_last_print, print_block_size = 500
         cdef double x_uij, sigmoid_user, sigmoid_item, local_gradient_i, local_gradient_j, local_gradient_u
@@ -594,6 +766,9 @@ cdef class MatrixFactorization_Cython_Epoch:
         cdef long start_time_epoch = time.time()
         cdef long last_print_time = start_time_epoch
 
+        if self.vectorized_sampling:
+            epoch_samples = self.batch_sampler.sample_epoch(num_total_batch * self.batch_size)
+
         for num_current_batch in range(num_total_batch):
 
             self._clear_minibatch_data_structures()
@@ -602,7 +777,12 @@ cdef class MatrixFactorization_Cython_Epoch:
             for num_sample_in_batch in range(self.batch_size):
 
                 # Uniform user sampling with replacement
-                sample = self.sampleBPR_Cython()
+                if self.vectorized_sampling:
+                    sample.user = epoch_samples[num_current_batch * self.batch_size + num_sample_in_batch, 0]
+                    sample.pos_item = epoch_samples[num_current_batch * self.batch_size + num_sample_in_batch, 1]
+                    sample.neg_item = epoch_samples[num_current_batch * self.batch_size + num_sample_in_batch, 2]
+                else:
+                    sample = self.sampleBPR_Cython()
 
                 self._add_BPR_sample_in_minibatch(sample)
 
@@ -682,6 +862,452 @@ cdef class MatrixFactorization_Cython_Epoch:
 
 
 
+    def _epochIteration_hogwild(self):
+        """
+        Lock-free parallel epoch, see:
+            Hogwild!: A Lock-Free Approach to Parallelizing Stochastic Gradient Descent,
+            F. Niu, B. Recht, C. Re, S. J. Wright, NIPS 2011.
+        The mini-batches of the epoch are distributed over num_threads threads. Each thread samples with its own
+        random generator and accumulates the gradients of a mini-batch in its own workspace, then applies them
+        to the shared latent factors and adaptive gradient caches without synchronization.
+        """
+
+        cdef long n_samples_source = self.n_users if self.algorithm_is_BPR else len(self.URM_train_data)
+        cdef long n_minibatches = int(n_samples_source / self.batch_size) + 1
+        cdef long batch_size = self.batch_size
+        cdef long minibatches_per_chunk = max(1, self.hogwild_batch_size // self.batch_size)
+
+        cdef int n_rounds = 5, n_threads = self.num_threads, thread_index
+        cdef long round_index, round_start, round_minibatches, n_chunks, chunk_index, minibatch_index, minibatch_end
+        cdef long processed_samples
+
+        # With fixed size chunks a short epoch may have fewer chunks than threads in each round
+        if self.hogwild_batch_size == 0:
+            minibatches_per_chunk = max(1, ((n_minibatches + n_rounds - 1) // n_rounds + n_threads - 1) // n_threads)
+
+        cdef double beta_1 = self.beta_1, beta_2 = self.beta_2
+        cdef double start_beta_1_power_t = self.beta_1_power_t, start_beta_2_power_t = self.beta_2_power_t
+        cdef double beta_1_power_t, beta_2_power_t, cumulative_loss
+
+        cdef Hogwild_workspace * workspace
+        cdef Hogwild_workspace * thread_workspace
+
+        cdef int[:,:] epoch_samples
+        cdef int * epoch_samples_pointer = NULL
+
+        if self.vectorized_sampling:
+            epoch_samples = self.batch_sampler.sample_epoch(n_minibatches * batch_size)
+            epoch_samples_pointer = &epoch_samples[0, 0]
+
+        workspace = self._allocate_hogwild_workspace(n_threads)
+
+        start_time_epoch = time.time()
+        start_time_batch = time.time()
+
+        try:
+            for round_index in range(n_rounds):
+
+                round_start = n_minibatches * round_index // n_rounds
+                round_minibatches = n_minibatches * (round_index + 1) // n_rounds - round_start
+                n_chunks = (round_minibatches + minibatches_per_chunk - 1) // minibatches_per_chunk
+
+                for chunk_index in prange(n_chunks, nogil=True, schedule='dynamic', num_threads=n_threads):
+
+                    thread_index = threadid()
+                    thread_workspace = workspace + thread_index
+
+                    minibatch_end = min(round_start + (chunk_index + 1) * minibatches_per_chunk, round_start + round_minibatches)
+
+                    for minibatch_index in range(round_start + chunk_index * minibatches_per_chunk, minibatch_end):
+
+                        # Adam bias correction, as if the mini-batches were processed sequentially
+                        beta_1_power_t = start_beta_1_power_t * pow(beta_1, minibatch_index)
+                        beta_2_power_t = start_beta_2_power_t * pow(beta_2, minibatch_index)
+
+                        if self.algorithm_is_BPR:
+                            self._hogwild_minibatch_BPR(thread_workspace, epoch_samples_pointer, minibatch_index * batch_size,
+                                                        beta_1_power_t, beta_2_power_t)
+                        elif self.algorithm_is_funk_svd:
+                            self._hogwild_minibatch_FUNK_SVD(thread_workspace, beta_1_power_t, beta_2_power_t)
+                        else:
+                            self._hogwild_sample_ASY_SVD(thread_workspace, beta_1_power_t, beta_2_power_t)
+
+
+                if self.verbose:
+
+                    processed_samples = (round_start + round_minibatches) * batch_size
+                    cumulative_loss = 0.0
+
+                    for thread_index in range(n_threads):
+                        cumulative_loss += workspace[thread_index].loss
+
+                    print("{}: Processed {} ( {:.2f}% ) in {:.2f} seconds. {} loss {:.2E}. Sample per second: {:.0f}, per thread: {:.0f} with {} threads and chunks of {} mini-batches".format(
+                        self.algorithm_name,
+                        processed_samples,
+                        100.0* float(round_start + round_minibatches)/n_minibatches,
+                        time.time() - start_time_batch,
+                        "BPR" if self.algorithm_is_BPR else "MSE",
+                        cumulative_loss/(processed_samples + 1),
+                        float(processed_samples) / (time.time() - start_time_epoch),
+                        float(processed_samples) / (time.time() - start_time_epoch) / n_threads,
+                        n_threads,
+                        minibatches_per_chunk))
+
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+
+                    start_time_batch = time.time()
+
+        finally:
+            self._free_hogwild_workspace(workspace, n_threads)
+
+        if self.useAdam:
+            self.beta_1_power_t = start_beta_1_power_t * pow(beta_1, n_minibatches)
+            self.beta_2_power_t = start_beta_2_power_t * pow(beta_2, n_minibatches)
+
+
+
+
+    cdef Hogwild_workspace * _allocate_hogwild_workspace(self, int n_threads) except NULL:
+
+        cdef Hogwild_workspace * workspace = <Hogwild_workspace *> malloc(n_threads * sizeof(Hogwild_workspace))
+        cdef Hogwild_workspace * thread_workspace
+        cdef long thread_index, index
+
+        # A mini-batch touches at most one user and two items per sample
+        cdef long max_users = self.batch_size, max_items = 2 * self.batch_size
+
+        if workspace == NULL:
+            raise MemoryError()
+
+        for thread_index in range(n_threads):
+
+            thread_workspace = workspace + thread_index
+
+            thread_workspace.user_slot = <long *> malloc(self.n_users * sizeof(long))
+            thread_workspace.item_slot = <long *> malloc(self.n_items * sizeof(long))
+            thread_workspace.user_ids = <long *> malloc(max_users * sizeof(long))
+            thread_workspace.item_ids = <long *> malloc(max_items * sizeof(long))
+            thread_workspace.user_accumulator = <double *> malloc(max_users * self.n_factors * sizeof(double))
+            thread_workspace.item_accumulator = <double *> malloc(max_items * self.n_factors * sizeof(double))
+            thread_workspace.user_bias_accumulator = <double *> malloc(max_users * sizeof(double))
+            thread_workspace.item_bias_accumulator = <double *> malloc(max_items * sizeof(double))
+            thread_workspace.factor_buffer = <double *> malloc(self.n_factors * sizeof(double))
+
+            thread_workspace.n_touched_users = 0
+            thread_workspace.n_touched_items = 0
+            thread_workspace.global_bias_accumulator = 0.0
+            thread_workspace.loss = 0.0
+            thread_workspace.random_state = self.thread_random_state[thread_index]
+
+            if thread_workspace.user_slot == NULL or thread_workspace.item_slot == NULL or \
+                thread_workspace.user_ids == NULL or thread_workspace.item_ids == NULL or \
+                thread_workspace.user_accumulator == NULL or thread_workspace.item_accumulator == NULL or \
+                thread_workspace.user_bias_accumulator == NULL or thread_workspace.item_bias_accumulator == NULL or \
+                thread_workspace.factor_buffer == NULL:
+
+                self._free_hogwild_workspace(workspace, thread_index + 1)
+                raise MemoryError()
+
+            for index in range(self.n_users):
+                thread_workspace.user_slot[index] = -1
+
+            for index in range(self.n_items):
+                thread_workspace.item_slot[index] = -1
+
+        return workspace
+
+
+
+    cdef void _free_hogwild_workspace(self, Hogwild_workspace * workspace, int n_threads):
+
+        cdef long thread_index
+
+        for thread_index in range(n_threads):
+
+            # The generator state is kept, so the next epoch continues the random sequence
+            self.thread_random_state[thread_index] = workspace[thread_index].random_state
+
+            free(workspace[thread_index].user_slot)
+            free(workspace[thread_index].item_slot)
+            free(workspace[thread_index].user_ids)
+            free(workspace[thread_index].item_ids)
+            free(workspace[thread_index].user_accumulator)
+            free(workspace[thread_index].item_accumulator)
+            free(workspace[thread_index].user_bias_accumulator)
+            free(workspace[thread_index].item_bias_accumulator)
+            free(workspace[thread_index].factor_buffer)
+
+        free(workspace)
+
+
+
+    cdef long _hogwild_slot(self, long * slot, long * ids, long * n_touched, double * accumulator, double * bias_accumulator, long index) nogil:
+        """
+        Returns the position of the user or item in the thread-local accumulators, adding it if not yet touched
+        """
+
+        cdef long position, factor_index
+
+        if slot[index] == -1:
+            position = n_touched[0]
+            n_touched[0] += 1
+
+            slot[index] = position
+            ids[position] = index
+            bias_accumulator[position] = 0.0
+
+            for factor_index in range(self.n_factors):
+                accumulator[position * self.n_factors + factor_index] = 0.0
+
+        return slot[index]
+
+
+
+    cdef int _hogwild_minibatch_BPR(self, Hogwild_workspace * workspace, int * epoch_samples_pointer, long first_sample,
+                                    double beta_1_power_t, double beta_2_power_t) nogil:
+
+        cdef BPR_sample sample
+        cdef long num_sample_in_batch, factor_index, u_position, i_position, j_position
+        cdef double x_uij, sigmoid_item, H_i, H_j, W_u
+
+        for num_sample_in_batch in range(self.batch_size):
+
+            if epoch_samples_pointer != NULL:
+                sample.user = epoch_samples_pointer[3 * (first_sample + num_sample_in_batch)]
+                sample.pos_item = epoch_samples_pointer[3 * (first_sample + num_sample_in_batch) + 1]
+                sample.neg_item = epoch_samples_pointer[3 * (first_sample + num_sample_in_batch) + 2]
+            else:
+                sampleBPR_nogil(&self.URM_train_indptr[0], &self.URM_train_indices[0], self.n_users, self.n_items,
+                                &workspace.random_state, &sample)
+
+            u_position = self._hogwild_slot(workspace.user_slot, workspace.user_ids, &workspace.n_touched_users,
+                                            workspace.user_accumulator, workspace.user_bias_accumulator, sample.user)
+            i_position = self._hogwild_slot(workspace.item_slot, workspace.item_ids, &workspace.n_touched_items,
+                                            workspace.item_accumulator, workspace.item_bias_accumulator, sample.pos_item)
+            j_position = self._hogwild_slot(workspace.item_slot, workspace.item_ids, &workspace.n_touched_items,
+                                            workspace.item_accumulator, workspace.item_bias_accumulator, sample.neg_item)
+
+            x_uij = 0.0
+
+            for factor_index in range(self.n_factors):
+                x_uij += self.USER_factors[sample.user, factor_index] * (self.ITEM_factors[sample.pos_item, factor_index] - self.ITEM_factors[sample.neg_item, factor_index])
+
+            # Use gradient of log(sigm(-x_uij))
+            sigmoid_item = 1 / (1 + exp(x_uij))
+
+            workspace.loss += x_uij**2
+
+            for factor_index in range(self.n_factors):
+
+                H_i = self.ITEM_factors[sample.pos_item, factor_index]
+                H_j = self.ITEM_factors[sample.neg_item, factor_index]
+                W_u = self.USER_factors[sample.user, factor_index]
+
+                workspace.user_accumulator[u_position * self.n_factors + factor_index] += sigmoid_item * ( H_i - H_j ) - self.user_reg * W_u
+                workspace.item_accumulator[i_position * self.n_factors + factor_index] += sigmoid_item * ( W_u ) - self.positive_reg * H_i
+                workspace.item_accumulator[j_position * self.n_factors + factor_index] += sigmoid_item * (-W_u ) - self.negative_reg * H_j
+
+        self._hogwild_apply_minibatch(workspace, beta_1_power_t, beta_2_power_t)
+
+        return 0
+
+
+
+    cdef int _hogwild_minibatch_FUNK_SVD(self, Hogwild_workspace * workspace, double beta_1_power_t, double beta_2_power_t) nogil:
+
+        cdef MSE_sample sample
+        cdef long num_sample_in_batch, factor_index, u_position, i_position
+        cdef double prediction, prediction_error, H_i, W_u
+
+        for num_sample_in_batch in range(self.batch_size):
+
+            sampleMSE_nogil(&self.URM_train_indptr[0], &self.URM_train_indices[0], &self.URM_train_data[0], self.n_users, self.n_items,
+                            self.MSE_sample_negative_interactions_flag != 0.0, self.MSE_negative_interactions_quota,
+                            &workspace.random_state, &sample)
+
+            u_position = self._hogwild_slot(workspace.user_slot, workspace.user_ids, &workspace.n_touched_users,
+                                            workspace.user_accumulator, workspace.user_bias_accumulator, sample.user)
+            i_position = self._hogwild_slot(workspace.item_slot, workspace.item_ids, &workspace.n_touched_items,
+                                            workspace.item_accumulator, workspace.item_bias_accumulator, sample.item)
+
+            if self.use_bias:
+                prediction = self.GLOBAL_bias[0] + self.USER_bias[sample.user] + self.ITEM_bias[sample.item]
+            else:
+                prediction = 0.0
+
+            for factor_index in range(self.n_factors):
+                prediction += self.USER_factors[sample.user, factor_index] * self.ITEM_factors[sample.item, factor_index]
+
+            prediction_error = sample.rating - prediction
+            workspace.loss += prediction_error**2
+
+            if self.use_bias:
+                workspace.global_bias_accumulator += prediction_error - self.bias_reg * self.GLOBAL_bias[0]
+                workspace.item_bias_accumulator[i_position] += prediction_error - self.bias_reg * self.ITEM_bias[sample.item]
+                workspace.user_bias_accumulator[u_position] += prediction_error - self.bias_reg * self.USER_bias[sample.user]
+
+            for factor_index in range(self.n_factors):
+
+                H_i = self.ITEM_factors[sample.item, factor_index]
+                W_u = self.USER_factors[sample.user, factor_index]
+
+                workspace.item_accumulator[i_position * self.n_factors + factor_index] += prediction_error * W_u - self.positive_reg * H_i
+                workspace.user_accumulator[u_position * self.n_factors + factor_index] += prediction_error * H_i - self.user_reg * W_u
+
+        self._hogwild_apply_minibatch(workspace, beta_1_power_t, beta_2_power_t)
+
+        return 0
+
+
+
+    cdef int _hogwild_sample_ASY_SVD(self, Hogwild_workspace * workspace, double beta_1_power_t, double beta_2_power_t) nogil:
+        """
+        AsySVD only supports mini-batches of one sample, so the updates are applied directly as in the sequential epoch
+        """
+
+        cdef MSE_sample sample
+        cdef long factor_index, item_index, item_id, start_pos_seen_items, end_pos_seen_items
+        cdef double prediction, prediction_error, denominator, H_i, W_u, local_gradient
+
+        sampleMSE_nogil(&self.URM_train_indptr[0], &self.URM_train_indices[0], &self.URM_train_data[0], self.n_users, self.n_items,
+                        self.MSE_sample_negative_interactions_flag != 0.0, self.MSE_negative_interactions_quota,
+                        &workspace.random_state, &sample)
+
+        start_pos_seen_items = self.URM_train_indptr[sample.user]
+        end_pos_seen_items = self.URM_train_indptr[sample.user+1]
+
+        # Accumulate latent factors of rated items
+        for factor_index in range(self.n_factors):
+            workspace.factor_buffer[factor_index] = 0.0
+
+        for item_index in range(start_pos_seen_items, end_pos_seen_items):
+            item_id = self.URM_train_indices[item_index]
+
+            for factor_index in range(self.n_factors):
+                workspace.factor_buffer[factor_index] += self.USER_factors[item_id, factor_index]
+
+        denominator = sqrt(self.profile_length[sample.user])
+
+        if self.use_bias:
+            prediction = self.GLOBAL_bias[0] + self.USER_bias[sample.user] + self.ITEM_bias[sample.item]
+        else:
+            prediction = 0.0
+
+        for factor_index in range(self.n_factors):
+            workspace.factor_buffer[factor_index] /= denominator
+            prediction += workspace.factor_buffer[factor_index] * self.ITEM_factors[sample.item, factor_index]
+
+        prediction_error = sample.rating - prediction
+        workspace.loss += prediction_error**2
+
+        if self.use_bias:
+
+            local_gradient = prediction_error - self.bias_reg * self.GLOBAL_bias[0]
+            local_gradient = self.adaptive_gradient(local_gradient, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2, beta_1_power_t, beta_2_power_t)
+            self.GLOBAL_bias[0] += self.learning_rate * local_gradient
+
+            local_gradient = prediction_error - self.bias_reg * self.ITEM_bias[sample.item]
+            local_gradient = self.adaptive_gradient(local_gradient, sample.item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2, beta_1_power_t, beta_2_power_t)
+            self.ITEM_bias[sample.item] += self.learning_rate * local_gradient
+
+            local_gradient = prediction_error - self.bias_reg * self.USER_bias[sample.user]
+            local_gradient = self.adaptive_gradient(local_gradient, sample.user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2, beta_1_power_t, beta_2_power_t)
+            self.USER_bias[sample.user] += self.learning_rate * local_gradient
+
+        # Update USER factors, therefore all item factors for seen items
+        for item_index in range(start_pos_seen_items, end_pos_seen_items):
+            item_id = self.URM_train_indices[item_index]
+
+            for factor_index in range(self.n_factors):
+
+                H_i = self.ITEM_factors[sample.item, factor_index]
+                W_u = self.USER_factors[item_id, factor_index]
+
+                local_gradient = prediction_error * H_i - self.user_reg * W_u
+                local_gradient = self.adaptive_gradient(local_gradient, item_id, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2, beta_1_power_t, beta_2_power_t)
+
+                self.USER_factors[item_id, factor_index] += self.learning_rate * local_gradient
+
+        # Update ITEM factors
+        for factor_index in range(self.n_factors):
+
+            H_i = self.ITEM_factors[sample.item, factor_index]
+            W_u = workspace.factor_buffer[factor_index]
+
+            local_gradient = prediction_error * W_u - self.item_reg * H_i
+            local_gradient = self.adaptive_gradient(local_gradient, sample.item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2, beta_1_power_t, beta_2_power_t)
+
+            self.ITEM_factors[sample.item, factor_index] += self.learning_rate * local_gradient
+
+        return 0
+
+
+
+    cdef int _hogwild_apply_minibatch(self, Hogwild_workspace * workspace, double beta_1_power_t, double beta_2_power_t) nogil:
+        """
+        Applies the thread-local accumulated gradients to the shared latent factors and clears the workspace,
+        as _apply_minibatch_updates_to_latent_factors does for the sequential epoch
+        """
+
+        cdef long position, sampled_user, sampled_item, factor_index
+        cdef double local_gradient
+
+        if self.use_bias:
+
+            local_gradient = workspace.global_bias_accumulator / self.batch_size
+            local_gradient = self.adaptive_gradient(local_gradient, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2, beta_1_power_t, beta_2_power_t)
+
+            self.GLOBAL_bias[0] += self.learning_rate * local_gradient
+            workspace.global_bias_accumulator = 0.0
+
+
+        for position in range(workspace.n_touched_items):
+
+            sampled_item = workspace.item_ids[position]
+
+            if self.use_bias:
+                local_gradient = workspace.item_bias_accumulator[position] / self.batch_size
+                local_gradient = self.adaptive_gradient(local_gradient, sampled_item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2, beta_1_power_t, beta_2_power_t)
+
+                self.ITEM_bias[sampled_item] += self.learning_rate * local_gradient
+
+            for factor_index in range(self.n_factors):
+                local_gradient = workspace.item_accumulator[position * self.n_factors + factor_index] / self.batch_size
+                local_gradient = self.adaptive_gradient(local_gradient, sampled_item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2, beta_1_power_t, beta_2_power_t)
+
+                self.ITEM_factors[sampled_item, factor_index] += self.learning_rate * local_gradient
+
+            workspace.item_slot[sampled_item] = -1
+
+
+        for position in range(workspace.n_touched_users):
+
+            sampled_user = workspace.user_ids[position]
+
+            if self.use_bias:
+                local_gradient = workspace.user_bias_accumulator[position] / self.batch_size
+                local_gradient = self.adaptive_gradient(local_gradient, sampled_user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2, beta_1_power_t, beta_2_power_t)
+
+                self.USER_bias[sampled_user] += self.learning_rate * local_gradient
+
+            for factor_index in range(self.n_factors):
+                local_gradient = workspace.user_accumulator[position * self.n_factors + factor_index] / self.batch_size
+                local_gradient = self.adaptive_gradient(local_gradient, sampled_user, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2, beta_1_power_t, beta_2_power_t)
+
+                self.USER_factors[sampled_user, factor_index] += self.learning_rate * local_gradient
+
+            workspace.user_slot[sampled_user] = -1
+
+
+        workspace.n_touched_items = 0
+        workspace.n_touched_users = 0
+
+        return 0
+
+
+
+
     def get_USER_factors(self):
         return np.array(self.USER_factors)
 
@@ -777,7 +1403,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
             # Compute adaptive gradients
             local_gradient_bias_global = self.GLOBAL_bias_minibatch_accumulator[0] / self.batch_size
-            local_gradient_bias_global = self.adaptive_gradient(local_gradient_bias_global, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2)
+            local_gradient_bias_global = self.adaptive_gradient(local_gradient_bias_global, 0, 0, self.sgd_cache_bias_GLOBAL, self.sgd_cache_bias_GLOBAL_momentum_1, self.sgd_cache_bias_GLOBAL_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
             # Apply updates to bias
             self.GLOBAL_bias[0] += self.learning_rate * local_gradient_bias_global
@@ -792,7 +1418,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
             if self.use_bias:
                 local_gradient_bias_item = self.ITEM_bias_minibatch_accumulator[sampled_item] / self.batch_size
-                local_gradient_bias_item = self.adaptive_gradient(local_gradient_bias_item, sampled_item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2)
+                local_gradient_bias_item = self.adaptive_gradient(local_gradient_bias_item, sampled_item, 0, self.sgd_cache_bias_I, self.sgd_cache_bias_I_momentum_1, self.sgd_cache_bias_I_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                 self.ITEM_bias[sampled_item] += self.learning_rate * local_gradient_bias_item
                 self.ITEM_bias_minibatch_accumulator[sampled_item] = 0.0
@@ -800,7 +1426,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
             for factor_index in range(self.n_factors):
                 local_gradient_item = self.ITEM_factors_minibatch_accumulator[sampled_item, factor_index] / self.batch_size
-                local_gradient_item = self.adaptive_gradient(local_gradient_item, sampled_item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2)
+                local_gradient_item = self.adaptive_gradient(local_gradient_item, sampled_item, factor_index, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                 self.ITEM_factors[sampled_item, factor_index] += self.learning_rate * local_gradient_item
                 self.ITEM_factors_minibatch_accumulator[sampled_item, factor_index] = 0.0
@@ -815,7 +1441,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
             if self.use_bias:
                 local_gradient_bias_user = self.USER_bias_minibatch_accumulator[sampled_user] / self.batch_size
-                local_gradient_bias_user = self.adaptive_gradient(local_gradient_bias_user, sampled_user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2)
+                local_gradient_bias_user = self.adaptive_gradient(local_gradient_bias_user, sampled_user, 0, self.sgd_cache_bias_U, self.sgd_cache_bias_U_momentum_1, self.sgd_cache_bias_U_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                 self.USER_bias[sampled_user] += self.learning_rate * local_gradient_bias_user
                 self.USER_bias_minibatch_accumulator[sampled_user] = 0.0
@@ -823,7 +1449,7 @@ cdef class MatrixFactorization_Cython_Epoch:
 
             for factor_index in range(self.n_factors):
                 local_gradient_user = self.USER_factors_minibatch_accumulator[sampled_user, factor_index] / self.batch_size
-                local_gradient_user = self.adaptive_gradient(local_gradient_user, sampled_user, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2)
+                local_gradient_user = self.adaptive_gradient(local_gradient_user, sampled_user, factor_index, self.sgd_cache_U, self.sgd_cache_U_momentum_1, self.sgd_cache_U_momentum_2, self.beta_1_power_t, self.beta_2_power_t)
 
                 self.USER_factors[sampled_user, factor_index] += self.learning_rate * local_gradient_user
                 self.USER_factors_minibatch_accumulator[sampled_user, factor_index] = 0.0
@@ -832,10 +1458,11 @@ cdef class MatrixFactorization_Cython_Epoch:
 
 
 
-    cdef double adaptive_gradient(self, double gradient, long user_or_item_id, long factor_id, double[:,:] sgd_cache, double[:,:] sgd_cache_momentum_1, double[:,:] sgd_cache_momentum_2):
+    cdef double adaptive_gradient(self, double gradient, long user_or_item_id, long factor_id, double[:,:] sgd_cache, double[:,:] sgd_cache_momentum_1, double[:,:] sgd_cache_momentum_2,
+                                  double beta_1_power_t, double beta_2_power_t) nogil:
 
 
-        cdef double gradient_update
+        cdef double gradient_update, momentum_1, momentum_2
 
         if self.useAdaGrad:
             sgd_cache[user_or_item_id, factor_id] += gradient ** 2
@@ -858,10 +1485,10 @@ cdef class MatrixFactorization_Cython_Epoch:
                 sgd_cache_momentum_2[user_or_item_id, factor_id] * self.beta_2 + (1 - self.beta_2) * gradient**2
 
 
-            self.momentum_1 = sgd_cache_momentum_1[user_or_item_id, factor_id]/ (1 - self.beta_1_power_t)
-            self.momentum_2 = sgd_cache_momentum_2[user_or_item_id, factor_id]/ (1 - self.beta_2_power_t)
+            momentum_1 = sgd_cache_momentum_1[user_or_item_id, factor_id]/ (1 - beta_1_power_t)
+            momentum_2 = sgd_cache_momentum_2[user_or_item_id, factor_id]/ (1 - beta_2_power_t)
 
-            gradient_update = self.momentum_1/ (sqrt(self.momentum_2) + 1e-8)
+            gradient_update = momentum_1/ (sqrt(momentum_2) + 1e-8)
 
 
         else:
@@ -7,9 +7,41 @@ Created on 23/03/2019
 from ..Base.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
 from ..Base.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 from ..Base.Recommender_utils import check_matrix
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 
+def compute_ALS_user_factors_from_confidence(C_profile, ITEM_factors, reg):
+    """
+    Fold-in of the ALS user factors, solves the user update (YtY + Yt*(Cu-I)*Y + reg*I) x = Yt*Cu*p(u) of each row
+    of the confidence matrix keeping the item factors Y fixed. Rows without interactions get zero factors
+    :param C_profile:       CSR matrix n_profiles x n_items with the confidence of the observed interactions
+    :param ITEM_factors:    n_items x n_factors
+    :return:                n_profiles x n_factors
+    """
+
+    n_factors = ITEM_factors.shape[1]
+
+    YtY_regularized = ITEM_factors.T.dot(ITEM_factors) + reg * np.eye(n_factors)
+    USER_factors = np.zeros((C_profile.shape[0], n_factors), dtype=ITEM_factors.dtype)
+
+    for row_index in range(C_profile.shape[0]):
+
+        start_pos, end_pos = C_profile.indptr[row_index], C_profile.indptr[row_index + 1]
+
+        if start_pos == end_pos:
+            continue
+
+        Y_interactions = ITEM_factors[C_profile.indices[start_pos:end_pos], :]
+        confidence = C_profile.data[start_pos:end_pos]
+
+        A = YtY_regularized + Y_interactions.T.dot((confidence - 1)[:, None] * Y_interactions)
+
+        USER_factors[row_index, :] = np.linalg.solve(A, Y_interactions.T.dot(confidence))
+
+    return USER_factors
+
+
 class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_Early_Stopping):
     """
 
@@ -33,6 +65,7 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
     RECOMMENDER_NAME = "IALSRecommender"
 
     AVAILABLE_CONFIDENCE_SCALING = ["linear", "log"]
+    AVAILABLE_SOLVERS = ["exact", "cg"]
 
     def fit(self, epochs=300,
             num_factors=20,
@@ -42,6 +75,11 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
             reg=1e-3,
             init_mean=0.0,
             init_std=0.1,
+            solver="exact",
+            cg_steps=3,
+            num_threads=1,
+            batch_interactions=100000,
+            batch_memory_MB=64,
             **earlystopping_kwargs):
         """
 
@@ -53,6 +91,13 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         :param epsilon: epsilon used in log scaling only
         :param init_mean: mean used to initialize the latent factors
         :param init_std: standard deviation used to initialize the latent factors
+        :param solver: 'exact' solves the regularized least squares of each row, 'cg' applies cg_steps conjugate
+                        gradient iterations starting from the previous factors, as done by the implicit library
+        :param cg_steps: number of conjugate gradient iterations per row, used only by the 'cg' solver
+        :param num_threads: number of threads solving the batches of rows in parallel, each one holds its own batch
+        :param batch_interactions: approximate number of (padded) interactions in each batch of rows
+        :param batch_memory_MB: maximum size of the arrays of a batch, its rows are also limited so that the stacked
+                        n_rows x n_factors x n_factors systems fit in it. The peak is about num_threads times this
         :return:
         """
 
@@ -61,12 +106,22 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
                 "Value for 'confidence_scaling' not recognized. Acceptable values are {}, provided was '{}'".format(
                     self.AVAILABLE_CONFIDENCE_SCALING, confidence_scaling))
 
+        if solver not in self.AVAILABLE_SOLVERS:
+            raise ValueError(
+                "Value for 'solver' not recognized. Acceptable values are {}, provided was '{}'".format(
+                    self.AVAILABLE_SOLVERS, solver))
+
         self.num_factors = num_factors
+        self.confidence_scaling = confidence_scaling
         self.alpha = alpha
         self.epsilon = epsilon
         self.reg = reg
+        self.solver = solver
+        self.cg_steps = cg_steps
+        self.num_threads = num_threads
 
-        self.USER_factors = self._init_factors(self.n_users, False)  # don't need values, will compute them
+        # The conjugate gradient starts from the previous factors, so the user factors need initial values as well
+        self.USER_factors = self._init_factors(self.n_users, self.solver == "cg")
         self.ITEM_factors = self._init_factors(self.n_items)
 
         self._build_confidence_matrix(confidence_scaling)
@@ -79,6 +134,9 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
 
         self.regularization_diagonal = np.diag(self.reg * np.ones(self.num_factors))
 
+        self.user_batches = self._build_row_batches(self.C, self.warm_users, batch_interactions, batch_memory_MB)
+        self.item_batches = self._build_row_batches(self.C_csc, self.warm_items, batch_interactions, batch_memory_MB)
+
         self._update_best_model()
 
         self._train_with_early_stopping(epochs,
@@ -97,20 +155,36 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
 
         self.C_csc = check_matrix(self.C.copy(), format="csc", dtype=np.float32)
 
-    def _linear_scaling_confidence(self):
+    def _linear_scaling_confidence(self, URM=None):
 
-        C = check_matrix(self.URM_train, format="csr", dtype=np.float32)
+        C = check_matrix(self.URM_train if URM is None else URM, format="csr", dtype=np.float32)
         C.data = 1.0 + self.alpha * C.data
 
         return C
 
-    def _log_scaling_confidence(self):
+    def _log_scaling_confidence(self, URM=None):
 
-        C = check_matrix(self.URM_train, format="csr", dtype=np.float32)
+        C = check_matrix(self.URM_train if URM is None else URM, format="csr", dtype=np.float32)
         C.data = 1.0 + self.alpha * np.log(1.0 + C.data / self.epsilon)
 
         return C
 
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+
+        if self.confidence_scaling == 'linear':
+            C_profile = self._linear_scaling_confidence(profile_csr_rows)
+        else:
+            C_profile = self._log_scaling_confidence(profile_csr_rows)
+
+        return compute_ALS_user_factors_from_confidence(C_profile, self.ITEM_factors, self.reg)
+
+    def _get_additional_data_dict_to_save(self):
+        return {"confidence_scaling": self.confidence_scaling,
+                "alpha": self.alpha,
+                "epsilon": self.epsilon,
+                "reg": self.reg,
+                }
+
     def _prepare_model_for_validation(self):
         pass
 
@@ -123,63 +197,152 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         # fit user factors
         # VV = n_factors x n_factors
         VV = self.ITEM_factors.T.dot(self.ITEM_factors)
+        self._update_factors_batches(self.user_batches, self.USER_factors, self.ITEM_factors, VV)
 
-        for user_id in self.warm_users:
-            # get (positive i.e. non-zero scored) items for user
+        # fit item factors
+        # UU = n_factors x n_factors
+        UU = self.USER_factors.T.dot(self.USER_factors)
+        self._update_factors_batches(self.item_batches, self.ITEM_factors, self.USER_factors, UU)
 
-            start_pos = self.C.indptr[user_id]
-            end_pos = self.C.indptr[user_id + 1]
+    def _build_row_batches(self, C, row_ids, batch_interactions, batch_memory_MB):
+        """
+        Groups the rows by profile length so that each batch can be stored as dense padded arrays.
+        Each batch is a tuple (row_ids, profile, confidence), with profile and confidence |n_rows|x|max_length|.
+        The padded cells have zero confidence and point to index 0, so they do not change the result.
+        """
 
-            user_profile = self.C.indices[start_pos:end_pos]
-            user_confidence = self.C.data[start_pos:end_pos]
+        # Bytes of a row in _update_batch_exact: the gathered and weighted factors, the system and its copy in solve
+        row_bytes = lambda length: 8 * 2 * self.num_factors * (max(length, 1) + self.num_factors)
+        batch_bytes = batch_memory_MB * 1e6
 
-            self.USER_factors[user_id, :] = self._update_row(user_profile, user_confidence, self.ITEM_factors, VV)
+        max_rows_for_length = lambda length: int(max(1, min(batch_interactions // max(length, 1),
+                                                              batch_bytes // row_bytes(length))))
 
-        # fit item factors
-        # UU = n_factors x n_factors
-        UU = self.USER_factors.T.dot(self.USER_factors)
+        profile_length = np.ediff1d(C.indptr)[row_ids]
+
+        sorted_position = np.argsort(profile_length, kind="stable")
+        row_ids = row_ids[sorted_position]
+        profile_length = profile_length[sorted_position]
+
+        batches = []
+        start = 0
 
-        for item_id in self.warm_items:
-            start_pos = self.C_csc.indptr[item_id]
-            end_pos = self.C_csc.indptr[item_id + 1]
+        while start < len(row_ids):
 
-            item_profile = self.C_csc.indices[start_pos:end_pos]
-            item_confidence = self.C_csc.data[start_pos:end_pos]
+            # The lengths are sorted, so the last row of a batch has the maximum length
+            end = min(start + max_rows_for_length(profile_length[start]), len(row_ids))
 
-            self.ITEM_factors[item_id, :] = self._update_row(item_profile, item_confidence, self.USER_factors, UU)
+            while end - start > max_rows_for_length(profile_length[end - 1]):
+                end = start + max_rows_for_length(profile_length[end - 1])
 
-    def _update_row(self, interaction_profile, interaction_confidence, Y, YtY):
+            batch_row_ids = row_ids[start:end]
+            batch_length = profile_length[start:end]
+            max_length = batch_length[-1]
+
+            position = C.indptr[batch_row_ids][:, None] + np.arange(max_length)[None, :]
+            valid = np.arange(max_length)[None, :] < batch_length[:, None]
+            position = np.where(valid, position, 0)
+
+            profile = np.where(valid, C.indices[position], 0)
+            confidence = np.where(valid, C.data[position], 0.0)
+
+            batches.append((batch_row_ids, profile, confidence))
+            start = end
+
+        return batches
+
+    def _update_factors_batches(self, batches, X, Y, YtY):
+        """
+        Updates the rows of X in all the batches, which are distributed over a thread pool.
+        The numpy batched operations release the GIL and each batch writes different rows of X
+        """
+
+        YtY_regularized = YtY + self.regularization_diagonal
+
+        if self.solver == "exact":
+            update_batch = lambda batch: self._update_batch_exact(batch, X, Y, YtY_regularized)
+        else:
+            # As in the implicit library the conjugate gradient works in single precision
+            Y_float32 = Y.astype(np.float32)
+            YtY_regularized = YtY_regularized.astype(np.float32)
+            update_batch = lambda batch: self._update_batch_cg(batch, X, Y_float32, YtY_regularized)
+
+        if self.num_threads > 1:
+            with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+                list(executor.map(update_batch, batches))
+
+        else:
+            for batch in batches:
+                update_batch(batch)
+
+    def _update_batch_exact(self, batch, X, Y, YtY_regularized):
+        """
+        Exact update of the latent factors of the rows in the batch. Following the original paper, the factors of a
+        row are (Yt*Cu*Y + reg*I)^-1 * Yt*Cu*p(u), decomposed as (YtY + Yt*(Cu-I)*Y + reg*I)^-1 * Yt*Cu*p(u) so that
+        only the interactions of the row are needed. The systems of all the rows in the batch are built with stacked
+        matrix products and solved together
         """
-        Update latent factors for a single user or item.
 
-        Y = |n_interactions|x|n_factors|
-        YtY =   |n_factors|x|n_factors|
+        row_ids, profile, confidence = batch
+
+        # |n_rows|x|max_length|x|n_factors|
+        Y_interactions = Y[profile]
+
+        # The padded cells have confidence 0, their weight must be 0 as well
+        weight = np.where(confidence > 0, confidence - 1, 0.0)
+
+        A = np.matmul(Y_interactions.transpose(0, 2, 1), Y_interactions * weight[:, :, None])
+        A += YtY_regularized
+
+        B = np.matmul(Y_interactions.transpose(0, 2, 1), confidence[:, :, None])
+
+        X[row_ids, :] = np.linalg.solve(A, B)[:, :, 0]
+
+    def _update_batch_cg(self, batch, X, Y, YtY_regularized):
         """
+        Applies cg_steps iterations of conjugate gradient to the systems of all the rows in the batch, starting from
+        the current factors. The system matrices are never built, their product with a vector is computed as
+        YtY*p + Yt*(Cu-I)*(Y*p) + reg*p
+        """
+
+        row_ids, profile, confidence = batch
+
+        Y_interactions = Y[profile]
+        weight = np.where(confidence > 0, confidence - 1, 0.0).astype(Y.dtype)
+
+        def system_dot(vector):
+            projection = np.matmul(Y_interactions, vector[:, :, None])[:, :, 0]
+            return vector.dot(YtY_regularized) + np.matmul((weight * projection)[:, None, :], Y_interactions)[:, 0, :]
+
+        x = X[row_ids, :].astype(Y.dtype)
+
+        residual = np.matmul(confidence[:, None, :].astype(Y.dtype), Y_interactions)[:, 0, :] - system_dot(x)
+        direction = residual.copy()
+        residual_norm = np.einsum("rf,rf->r", residual, residual)
+
+        for _ in range(self.cg_steps):
+
+            # Rows already converged get a zero step
+            active = residual_norm > 1e-20
+
+            if not active.any():
+                break
 
-        # Latent factors ony of item/users for which an interaction exists in the interaction profile
-        Y_interactions = Y[interaction_profile, :]
+            system_direction = system_dot(direction)
+            curvature = np.einsum("rf,rf->r", direction, system_direction)
 
-        # Following the notation of the original paper we report the update rule for the Item factors (User factors are identical):
-        # Y are the item factors |n_items|x|n_factors|
-        # Cu is a diagonal matrix |n_interactions|x|n_interactions| with the user confidence for the observed items
-        # p(u) is a boolean vectors indexing only observed items. Here it will disappear as we already extract only the observed latent factors
-        #       however, it will have an impact in the dimensions of the matrix, since it transforms Cu from a diagonal matrix to a row vector of 1 row and |n_interactions| columns
-        # (Yt*Cu*Y + reg*I)^-1 * Yt*Cu*profile
-        # which can be decomposed as
-        # (YtY + Yt*(Cu-I)*Y + reg*I)^-1 * Yt*Cu*p(u)
+            step = np.where(active, residual_norm / np.where(active, curvature, 1.0), 0.0)
 
-        # A = (|n_interactions|x|n_factors|) dot (|n_interactions|x|n_interactions| ) dot (|n_interactions|x|n_factors| )
-        #   = |n_factors|x|n_factors|
-        # A_slow = Y_interactions.T.dot(np.diag(interaction_confidence - 1)).dot(Y_interactions)
+            x += step[:, None] * direction
+            residual -= step[:, None] * system_direction
 
-        # if v = diag(|n_interactions|) and k = |n_interactions|x|n_factors|
-        # computing np.diag(v).dot(k) will be SLOW
-        # we use an equivalent formulation (v * k.T).T which is much faster
-        A = Y_interactions.T.dot(((interaction_confidence - 1) * Y_interactions.T).T)
+            new_residual_norm = np.einsum("rf,rf->r", residual, residual)
+            beta = np.where(active, new_residual_norm / np.where(active, residual_norm, 1.0), 0.0)
 
-        B = YtY + A + self.regularization_diagonal
+            direction = residual + beta[:, None] * direction
+            residual_norm = new_residual_norm
 
-        return np.dot(np.linalg.inv(B), Y_interactions.T.dot(interaction_confidence))
+        X[row_ids, :] = x
 
     def _init_factors(self, num_factors, assign_values=True):
 
@@ -6,9 +6,11 @@ Created on 30/11/2020
 @author: Alessandro Sanvito
 """
 
-from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 from .PureSVDRecommender import PureSVDItemRecommender
-class PureSVDItemCBFRecommender(BaseItemSimilarityMatrixRecommender):
+import multiprocessing
+
+
+class PureSVDItemCBFRecommender(PureSVDItemRecommender):
     """ PureSVDItem recommender"""
 
     RECOMMENDER_NAME = "PureSVDItemCBFRecommender"
@@ -18,7 +20,10 @@ class PureSVDItemCBFRecommender(BaseItemSimilarityMatrixRecommender):
 
         self.ICM_train = ICM_train
 
-    def fit(self, num_factors=100, topK=None, random_seed=None):
+    def fit(self, num_factors=100, topK=None, random_seed=None, num_threads=multiprocessing.cpu_count()):
         calculator = PureSVDItemRecommender(self.ICM_train.T, verbose=self.verbose)
-        calculator.fit(num_factors=num_factors, topK=topK, random_seed=random_seed)
-        self.W_sparse = calculator.W_sparse
\ No newline at end of file
+        calculator.fit(num_factors=num_factors, topK=topK, random_seed=random_seed, num_threads=num_threads)
+
+        # The scoring and the saving of W_sparse and ITEM_factors are those of PureSVDItemRecommender
+        self.fit_from_item_factors(calculator.ITEM_factors, topK=None)
+        self.W_sparse = calculator.W_sparse
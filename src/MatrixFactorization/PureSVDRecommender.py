@@ -7,9 +7,160 @@ Created on 14/06/18
 """
 
 from ..Base.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
-from sklearn.utils.extmath import randomized_svd
+from sklearn.utils.extmath import randomized_svd, svd_flip
+from scipy.sparse.linalg import LinearOperator
+from ..Base.DataIO import DataIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import scipy.sparse as sps
 import numpy as np
+import scipy.linalg
+import multiprocessing
+import hashlib
+
+
+# Decompositions computed by compute_randomized_svd, the least recently used ones are dropped first.
+# The size must be at least the number of folds fitted in each trial, otherwise every entry is dropped before reuse
+_SVD_CACHE = OrderedDict()
+_SVD_CACHE_MAX_SIZE = 10
+
+
+class ProductLinearOperator(LinearOperator):
+    """
+    Product A * B of two matrices applied lazily, the product itself is never computed
+    """
+
+    def __init__(self, A, B):
+        super(ProductLinearOperator, self).__init__(dtype=np.result_type(A.dtype, B.dtype),
+                                                    shape=(A.shape[0], B.shape[1]))
+        self.A = A
+        self.B = B
+
+    def _matvec(self, x):
+        return self.A.dot(self.B.dot(x))
+
+    def _matmat(self, X):
+        return self.A.dot(self.B.dot(X))
+
+    def _rmatvec(self, x):
+        return self.B.T.dot(self.A.T.dot(x))
+
+    def _adjoint(self):
+        return ProductLinearOperator(self.B.T, self.A.T)
+
+
+def randomized_svd_linear_operator(operator, n_components, n_oversamples=10, n_iter=4, random_state=None):
+    """
+    Randomized SVD of a LinearOperator, it only requires the products of the operator and of its adjoint with
+    dense matrices. Same algorithm as sklearn randomized_svd with LU normalized power iterations, see:
+        Finding structure with randomness: Stochastic algorithms for constructing approximate matrix decompositions,
+        N. Halko, P. G. Martinsson, J. A. Tropp, 2009
+    """
+
+    random_state = np.random.RandomState(random_state)
+    n_random = n_components + n_oversamples
+
+    operator_adjoint = operator.H
+
+    # Range finder, power iterations imprint the top singular vectors in Q
+    Q = random_state.normal(size=(operator.shape[1], n_random)).astype(operator.dtype, copy=False)
+
+    for _ in range(n_iter):
+        Q, _ = scipy.linalg.lu(operator.matmat(Q), permute_l=True)
+        Q, _ = scipy.linalg.lu(operator_adjoint.matmat(Q), permute_l=True)
+
+    Q, _ = scipy.linalg.qr(operator.matmat(Q), mode="economic")
+
+    # Project the operator on the range and compute the SVD of the small matrix B = Q.T * operator
+    B = operator_adjoint.matmat(Q).T
+
+    Uhat, Sigma, QT = scipy.linalg.svd(B, full_matrices=False)
+    U = np.dot(Q, Uhat)
+
+    U, QT = svd_flip(U, QT)
+
+    return U[:, :n_components], Sigma[:n_components], QT[:n_components, :]
+
+
+def get_URM_fingerprint(URM):
+    """
+    Hash of the shape and content of a sparse matrix, used to recognize the same URM across different objects.
+    The fingerprint of a ProductLinearOperator combines those of its two matrices
+    """
+
+    if isinstance(URM, ProductLinearOperator):
+        return hashlib.sha1((get_URM_fingerprint(URM.A) + get_URM_fingerprint(URM.B)).encode()).hexdigest()
+
+    URM = sps.csr_matrix(URM)
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update(np.array(URM.shape, dtype=np.int64).tobytes())
+    fingerprint.update(str(URM.dtype).encode())
+
+    for array in [URM.indptr, URM.indices, URM.data]:
+        fingerprint.update(np.ascontiguousarray(array).tobytes())
+
+    return fingerprint.hexdigest()
+
+
+def clear_svd_cache():
+    _SVD_CACHE.clear()
+
+
+def set_svd_cache_max_size(max_size):
+    """
+    Sets the number of decompositions kept by compute_randomized_svd, e.g., to the number of folds
+    """
+
+    global _SVD_CACHE_MAX_SIZE
+    _SVD_CACHE_MAX_SIZE = max_size
+
+    while len(_SVD_CACHE) > _SVD_CACHE_MAX_SIZE:
+        _SVD_CACHE.popitem(last=False)
+
+
+def compute_randomized_svd(URM, num_factors, n_iter=4, random_seed=None, use_cache=True, cache_num_factors=None):
+    """
+    Randomized SVD of the URM, returns U, Sigma, QT with num_factors components.
+    The URM can also be a ProductLinearOperator, which is decomposed without computing the product.
+
+    The decompositions are cached by URM fingerprint, n_iter and random_seed. A cached decomposition with at least
+    num_factors components is truncated instead of computing a new one, its leading components are the same
+    up to the randomization error. Decompositions computed with random_seed=None are never cached, each of those
+    fits is a new random decomposition.
+
+    :param cache_num_factors:   if greater than num_factors the decomposition is computed with cache_num_factors
+                                components, so that the following fits with up to cache_num_factors are truncations
+    """
+
+    if isinstance(URM, LinearOperator):
+        svd_function = randomized_svd_linear_operator
+    else:
+        svd_function = randomized_svd
+
+    if not use_cache or random_seed is None:
+        return svd_function(URM, n_components=num_factors, n_iter=n_iter, random_state=random_seed)
+
+    cache_key = (get_URM_fingerprint(URM), n_iter, random_seed)
+
+    if cache_key in _SVD_CACHE and _SVD_CACHE[cache_key][1].shape[0] >= num_factors:
+        _SVD_CACHE.move_to_end(cache_key)
+        U, Sigma, QT = _SVD_CACHE[cache_key]
+
+    else:
+        U, Sigma, QT = svd_function(URM,
+                                    n_components=max(num_factors, cache_num_factors or 0),
+                                    n_iter=n_iter,
+                                    random_state=random_seed)
+
+        _SVD_CACHE[cache_key] = (U, Sigma, QT)
+        _SVD_CACHE.move_to_end(cache_key)
+
+        while len(_SVD_CACHE) > _SVD_CACHE_MAX_SIZE:
+            _SVD_CACHE.popitem(last=False)
+
+    # Copies, so that the cached decomposition cannot be modified through the model
+    return U[:, :num_factors].copy(), Sigma[:num_factors].copy(), QT[:num_factors, :].copy()
 
 
 class PureSVDRecommender(BaseMatrixFactorizationRecommender):
@@ -29,13 +180,22 @@ class PureSVDRecommender(BaseMatrixFactorizationRecommender):
     def __init__(self, URM_train, verbose=True):
         super(PureSVDRecommender, self).__init__(URM_train, verbose=verbose)
 
-    def fit(self, num_factors=100, random_seed=None, n_iter = 4):
+    def fit(self, num_factors=100, random_seed=None, n_iter = 4, use_cache=True, cache_num_factors=None):
+        """
+        :param use_cache:           if True the decomposition is reused by later fits on the same URM with the same
+                                    n_iter and random_seed and a lower or equal num_factors, see compute_randomized_svd.
+                                    Only fits with a random_seed are cached
+        :param cache_num_factors:   number of components of the cached decomposition, if greater than num_factors
+        """
+
         self._print("Computing SVD decomposition...")
 
-        U, Sigma, QT = randomized_svd(self.URM_train,
-                                      n_components=num_factors,
-                                      n_iter=n_iter,
-                                      random_state=random_seed)
+        U, Sigma, QT = compute_randomized_svd(self.URM_train,
+                                              num_factors,
+                                              n_iter=n_iter,
+                                              random_seed=random_seed,
+                                              use_cache=use_cache,
+                                              cache_num_factors=cache_num_factors)
 
         U_s = U * sps.diags(Sigma)
 
@@ -44,54 +204,78 @@ class PureSVDRecommender(BaseMatrixFactorizationRecommender):
 
         self._print("Computing SVD decomposition... Done!")
 
+    def _compute_user_factors_from_profile(self, profile_csr_rows):
+
+        # Since URM = U*Sigma*QT and Q is orthonormal, U*Sigma is the projection URM*Q
+        return profile_csr_rows.dot(self.ITEM_factors)
+
+
+def compute_W_sparse_from_item_latent_factors(ITEM_factors, topK=100, block_size=None,
+                                              num_threads=multiprocessing.cpu_count()):
+    """
+    Computes the item-item similarity ITEM_factors * ITEM_factors.T keeping the topK values of each column.
+    The similarity is computed in float32 blocks of rows, which are distributed over a thread pool. Since the
+    similarity is symmetric the topK of each block row are the topK of the corresponding column.
+    :param block_size:  number of items in each block, by default blocks have about 10M cells
+    """
 
-def compute_W_sparse_from_item_latent_factors(ITEM_factors, topK=100):
+    ITEM_factors = np.ascontiguousarray(ITEM_factors, dtype=np.float32)
     n_items, n_factors = ITEM_factors.shape
 
-    block_size = 100
+    topK = min(topK, n_items)
 
-    start_item = 0
-    end_item = 0
+    if block_size is None:
+        block_size = max(1, 10**7 // n_items)
 
-    values = []
-    rows = []
-    cols = []
+    top_k_idx = np.empty((n_items, topK), dtype=np.int32)
+    top_k_values = np.empty((n_items, topK), dtype=np.float32)
 
-    # Compute all similarities for each item using vectorization
-    while start_item < n_items:
+    def _compute_block(start_item):
 
         end_item = min(n_items, start_item + block_size)
 
         this_block_weight = np.dot(ITEM_factors[start_item:end_item, :], ITEM_factors.T)
 
-        for col_index_in_block in range(this_block_weight.shape[0]):
-            this_column_weights = this_block_weight[col_index_in_block, :]
-            item_original_index = start_item + col_index_in_block
+        if topK < n_items:
+            block_top_k_idx = np.argpartition(-this_block_weight, topK - 1, axis=1)[:, :topK]
+        else:
+            block_top_k_idx = np.broadcast_to(np.arange(n_items), this_block_weight.shape)
 
-            # Sort indices and select TopK
-            # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-            # - Partition the data to extract the set of relevant items
-            # - Sort only the relevant items
-            # - Get the original item index
-            relevant_items_partition = (-this_column_weights).argpartition(topK - 1)[0:topK]
-            relevant_items_partition_sorting = np.argsort(-this_column_weights[relevant_items_partition])
-            top_k_idx = relevant_items_partition[relevant_items_partition_sorting]
+        # Each block writes its own rows of the preallocated arrays
+        top_k_idx[start_item:end_item, :] = block_top_k_idx
+        top_k_values[start_item:end_item, :] = np.take_along_axis(this_block_weight, block_top_k_idx, axis=1)
 
-            # Incrementally build sparse matrix, do not add zeros
-            notZerosMask = this_column_weights[top_k_idx] != 0.0
-            numNotZeros = np.sum(notZerosMask)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        list(executor.map(_compute_block, range(0, n_items, block_size)))
 
-            values.extend(this_column_weights[top_k_idx][notZerosMask])
-            rows.extend(top_k_idx[notZerosMask])
-            cols.extend(np.ones(numNotZeros) * item_original_index)
+    # Do not add zeros, row i of the arrays becomes column i of W
+    not_zeros_mask = top_k_values != 0.0
 
-        start_item += block_size
+    cols_indptr = np.zeros(n_items + 1, dtype=np.int64)
+    cols_indptr[1:] = np.cumsum(not_zeros_mask.sum(axis=1))
 
-    W_sparse = sps.csr_matrix((values, (rows, cols)),
+    W_sparse = sps.csc_matrix((top_k_values[not_zeros_mask], top_k_idx[not_zeros_mask], cols_indptr),
                               shape=(n_items, n_items),
                               dtype=np.float32)
 
-    return W_sparse
+    return W_sparse.tocsr()
+
+
+def compute_factored_item_score(user_profile_array, ITEM_factors, items_to_compute=None):
+    """
+    Computes the scores user_profile_array * ITEM_factors * ITEM_factors.T without materializing the item-item
+    matrix, which is equivalent to an item-item similarity with no topK selection
+    """
+
+    user_profile_factors = user_profile_array.dot(ITEM_factors)
+
+    if items_to_compute is not None:
+        item_scores = - np.ones((user_profile_array.shape[0], user_profile_array.shape[1]), dtype=np.float32) * np.inf
+        item_scores[:, items_to_compute] = np.dot(user_profile_factors, ITEM_factors[items_to_compute, :].T)
+    else:
+        item_scores = np.dot(user_profile_factors, ITEM_factors.T)
+
+    return item_scores
 
 
 from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
@@ -114,19 +298,67 @@ class PureSVDItemRecommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, verbose=True):
         super(PureSVDItemRecommender, self).__init__(URM_train, verbose=verbose)
 
-    def fit(self, num_factors=100, topK=None, random_seed=None, n_iter=4):
+        self.W_sparse = None
+        self.ITEM_factors = None
+
+    def fit(self, num_factors=100, topK=None, random_seed=None, n_iter=4, use_cache=True, cache_num_factors=None,
+            num_threads=multiprocessing.cpu_count()):
+        """
+        :param topK:                if None the item-item matrix is not built, the scores are computed in factored
+                                    form as URM_train * ITEM_factors * ITEM_factors.T
+        :param num_threads:         number of threads computing the item-item matrix, see
+                                    compute_W_sparse_from_item_latent_factors
+        :param use_cache:           if True the decomposition is reused by later fits on the same URM with the same
+                                    n_iter and random_seed and a lower or equal num_factors, see compute_randomized_svd.
+                                    Only fits with a random_seed are cached
+        :param cache_num_factors:   number of components of the cached decomposition, if greater than num_factors
+        """
+
         self._print("Computing SVD decomposition...")
 
-        U, Sigma, QT = randomized_svd(self.URM_train,
-                                      n_components=num_factors,
-                                      n_iter=n_iter,
-                                      random_state=random_seed)
+        U, Sigma, QT = compute_randomized_svd(self.URM_train,
+                                              num_factors,
+                                              n_iter=n_iter,
+                                              random_seed=random_seed,
+                                              use_cache=use_cache,
+                                              cache_num_factors=cache_num_factors)
+
+        self.fit_from_item_factors(QT.T, topK=topK, num_threads=num_threads)
+
+        self._print("Computing SVD decomposition... Done!")
+
+    def fit_from_item_factors(self, ITEM_factors, topK=None, num_threads=multiprocessing.cpu_count()):
+        """
+        Builds the model from item latent factors computed elsewhere, e.g., by decomposing a matrix other than URM_train
+        """
+
+        self.ITEM_factors = np.ascontiguousarray(ITEM_factors, dtype=np.float32)
 
         if topK is None:
-            topK = self.n_items
+            self.W_sparse = None
+        else:
+            self.W_sparse = compute_W_sparse_from_item_latent_factors(self.ITEM_factors, topK=topK,
+                                                                      num_threads=num_threads)
 
-        W_sparse = compute_W_sparse_from_item_latent_factors(QT.T, topK=topK)
+    def _compute_item_score_from_profile(self, profile_csr_rows, items_to_compute=None):
 
-        self.W_sparse = sps.csr_matrix(W_sparse)
+        if self.W_sparse is None:
+            return compute_factored_item_score(profile_csr_rows, self.ITEM_factors, items_to_compute=items_to_compute)
 
-        self._print("Computing SVD decomposition... Done!")
+        return super(PureSVDItemRecommender, self)._compute_item_score_from_profile(profile_csr_rows,
+                                                                                    items_to_compute=items_to_compute)
+
+    def save_model(self, folder_path, file_name=None):
+
+        if file_name is None:
+            file_name = self.RECOMMENDER_NAME
+
+        self._print("Saving model in file '{}'".format(folder_path + file_name))
+
+        data_dict_to_save = {"W_sparse": self.W_sparse,
+                             "ITEM_factors": self.ITEM_factors}
+
+        dataIO = DataIO(folder_path=folder_path)
+        dataIO.save_data(file_name=file_name, data_dict_to_save=data_dict_to_save)
+
+        self._print("Saving complete")
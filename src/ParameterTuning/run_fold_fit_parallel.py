@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import inspect, os, time, traceback
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    print("run_fold_fit_parallel: Unable to load threadpoolctl, the BLAS threads of each fit will not be limited")
+    threadpool_limits = None
+
+from ..Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+# Fit arguments setting the number of threads or processes used inside a single fit
+INNER_PARALLELISM_ARGS = ["num_threads", "workers", "n_jobs"]
+
+
+def _get_fold_file_name(recommender_class, fold_index):
+    return "{}_fold_{}".format(recommender_class.RECOMMENDER_NAME, fold_index)
+
+
+def _fit_fold(recommender_class, fold_index, constructor_kwargs, fit_kwargs, inner_cores, output_folder_path):
+    """
+    Fits the recommender of one fold, the numpy/scipy BLAS threads are limited to inner_cores as well if threadpoolctl
+    is installed
+    :return:    the fitted recommender or, if output_folder_path is not None, the file name it has been saved with
+    """
+
+    try:
+        with ExitStack() as context_stack:
+            if threadpool_limits is not None:
+                context_stack.enter_context(threadpool_limits(limits=inner_cores))
+
+            recommender_instance = recommender_class(**constructor_kwargs)
+            recommender_instance.fit(**fit_kwargs)
+
+        if output_folder_path is None:
+            return recommender_instance
+
+        file_name = _get_fold_file_name(recommender_class, fold_index)
+        recommender_instance.save_model(output_folder_path, file_name=file_name)
+
+        return file_name
+
+    except Exception as e:
+        # The traceback of the worker process is lost when the exception is sent back
+        traceback.print_exc()
+        raise e
+
+
+def get_inner_fit_kwargs(recommender_class, fit_kwargs, inner_cores):
+    """
+    Sets the fit arguments in INNER_PARALLELISM_ARGS accepted by the recommender to inner_cores, a smaller positive
+    value given in fit_kwargs is kept. Values <= 0 are replaced as well, some recommenders read 0 as all the cores
+    """
+
+    fit_kwargs = fit_kwargs.copy()
+    fit_parameters = inspect.signature(recommender_class.fit).parameters
+
+    for arg_name in INNER_PARALLELISM_ARGS:
+        if arg_name in fit_parameters:
+            arg_value = fit_kwargs.get(arg_name, inner_cores)
+
+            if arg_value is None or arg_value <= 0:
+                arg_value = inner_cores
+
+            fit_kwargs[arg_name] = min(arg_value, inner_cores)
+
+    return fit_kwargs
+
+
+def run_fold_fit_parallel(recommender_class, constructor_kwargs_list, fit_kwargs, total_cores=None,
+                          n_processes=None, output_folder_path=None):
+    """
+    Fits one recommender for each fold with the same fit_kwargs, the folds are fitted concurrently in a process pool.
+    The total_cores are shared between the processes and the threads of each fit: each process gets
+    total_cores // n_processes cores, which are given to the fit arguments num_threads, workers or n_jobs if the
+    recommender has them and limit the BLAS threads. The latter requires threadpoolctl, which is optional.
+
+    Example, instead of fitting the folds in a loop:
+        p3alpha_recommenders = run_fold_fit_parallel(P3alphaRecommender,
+                                                     [{"URM_train": URM_train, "verbose": False} for URM_train in URMs_train],
+                                                     {"topK": 212, "alpha": 0.47, "implicit": True})
+
+    :param constructor_kwargs_list: list with the constructor keyword arguments of each fold
+    :param total_cores:             cores used overall, default all of them
+    :param n_processes:             number of folds fitted concurrently, default min(n_folds, total_cores).
+                                    If 1 the folds are fitted in this process
+    :param output_folder_path:      if not None each fitted model is saved in the folder and not sent back to this
+                                    process, which is needed for recommenders which cannot be pickled, e.g., with
+                                    Cython objects. Load them with load_fold_models
+    :return:                        list with the fitted recommender of each fold or, if output_folder_path is given,
+                                    with the file names of the saved models
+    """
+
+    n_folds = len(constructor_kwargs_list)
+
+    if total_cores is None:
+        total_cores = multiprocessing.cpu_count()
+
+    if n_processes is None:
+        n_processes = min(n_folds, total_cores)
+
+    n_processes = max(1, min(n_processes, n_folds))
+    inner_cores = max(1, total_cores // n_processes)
+
+    fit_kwargs = get_inner_fit_kwargs(recommender_class, fit_kwargs, inner_cores)
+
+    if output_folder_path is not None and not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    start_time = time.time()
+
+    fold_args_list = [(recommender_class, fold_index, constructor_kwargs_list[fold_index], fit_kwargs, inner_cores,
+                       output_folder_path) for fold_index in range(n_folds)]
+
+    if n_processes == 1:
+        result_list = [_fit_fold(*fold_args) for fold_args in fold_args_list]
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_processes) as executor:
+            future_list = [executor.submit(_fit_fold, *fold_args) for fold_args in fold_args_list]
+            result_list = [future.result() for future in future_list]
+
+    new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+    print("run_fold_fit_parallel: {} fitted on {} folds with {} processes of {} cores in {:.2f} {}".format(
+        recommender_class.RECOMMENDER_NAME, n_folds, n_processes, inner_cores, new_time_value, new_time_unit))
+
+    return result_list
+
+
+def load_fold_models(recommender_class, constructor_kwargs_list, output_folder_path, file_name_list=None):
+    """
+    Loads the models saved by run_fold_fit_parallel, each built with the constructor arguments of its fold
+    """
+
+    if file_name_list is None:
+        file_name_list = [_get_fold_file_name(recommender_class, fold_index)
+                          for fold_index in range(len(constructor_kwargs_list))]
+
+    recommender_list = []
+
+    for constructor_kwargs, file_name in zip(constructor_kwargs_list, file_name_list):
+        recommender_instance = recommender_class(**constructor_kwargs)
+        recommender_instance.load_model(output_folder_path, file_name=file_name)
+        recommender_list.append(recommender_instance)
+
+    return recommender_list
@@ -19,6 +19,7 @@ from ..KNN.ItemKNNCFRecommender import ItemKNNCFRecommender
 from ..GraphBased.P3alphaRecommender import P3alphaRecommender
 from ..GraphBased.RP3betaRecommender import RP3betaRecommender
 from ..EASE_R.EASE_R_Recommender import EASE_R_Recommender
+from ..EASE_R.SparseEASE_R_Recommender import SparseEASE_R_Recommender
 
 # KNN machine learning
 from ..SLIM_BPR.Cython.SLIM_BPR_Cython import SLIM_BPR_Cython
@@ -469,6 +470,20 @@ def runParameterSearch_Collaborative(recommender_class, URM_train, URM_train_las
                 FIT_KEYWORD_ARGS={}
             )
 
+        if recommender_class is SparseEASE_R_Recommender:
+            hyperparameters_range_dictionary = {}
+            hyperparameters_range_dictionary["topK"] = Integer(5, 1000)
+            hyperparameters_range_dictionary["neighborhood_size"] = Integer(50, 1000)
+            hyperparameters_range_dictionary["normalize_matrix"] = Categorical([False])
+            hyperparameters_range_dictionary["l2_norm"] = Real(low=1e0, high=1e7, prior='log-uniform')
+
+            recommender_input_args = SearchInputRecommenderArgs(
+                CONSTRUCTOR_POSITIONAL_ARGS=[URM_train],
+                CONSTRUCTOR_KEYWORD_ARGS={},
+                FIT_POSITIONAL_ARGS=[],
+                FIT_KEYWORD_ARGS={}
+            )
+
         #########################################################################################################
 
         if URM_train_last_test is not None:
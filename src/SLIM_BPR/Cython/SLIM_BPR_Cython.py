@@ -69,7 +69,19 @@ class SLIM_BPR_Cython(BaseItemSimilarityMatrixRecommender, Incremental_Training_
             random_seed=None,
             batch_size=1000, lambda_i=0.0, lambda_j=0.0, learning_rate=1e-4, topK=200,
             sgd_mode='adagrad', gamma=0.995, beta_1=0.9, beta_2=0.999,
+            num_threads=1, hogwild_batch_size=None, sparse_weights_mode='tree', sparse_weights_capacity=None,
+            vectorized_sampling=False,
             **earlystopping_kwargs):
+        """
+        :param num_threads:     if greater than 1, each epoch is run by num_threads threads updating
+                                the shared similarity without locks (hogwild)
+        :param hogwild_batch_size:      number of samples each thread processes in a single task, if None the
+                                        samples are split evenly among the num_threads threads
+        :param sparse_weights_mode:     storage of the sparse weights, 'tree' or 'topK_rows'. The latter keeps
+                                        at most sparse_weights_capacity cells per row in contiguous memory
+        :param sparse_weights_capacity: cells per row in 'topK_rows' mode, default is 2*topK
+        :param vectorized_sampling:     if True the samples of each epoch are generated at once by BPR_Batch_Sampler
+        """
 
         # Import compiled module
         from .SLIM_BPR_Cython_Epoch import SLIM_BPR_Cython_Epoch
@@ -103,6 +115,8 @@ class SLIM_BPR_Cython(BaseItemSimilarityMatrixRecommender, Incremental_Training_
         self.positive_threshold_BPR = positive_threshold_BPR
         self.sgd_mode = sgd_mode
         self.epochs = epochs
+        self.num_threads = num_threads
+        self.sparse_weights_mode = sparse_weights_mode
 
         if self.positive_threshold_BPR is not None:
             URM_train_positive.data = URM_train_positive.data >= self.positive_threshold_BPR
@@ -124,7 +138,12 @@ class SLIM_BPR_Cython(BaseItemSimilarityMatrixRecommender, Incremental_Training_
                                                  random_seed=random_seed,
                                                  gamma=gamma,
                                                  beta_1=beta_1,
-                                                 beta_2=beta_2)
+                                                 beta_2=beta_2,
+                                                 num_threads=self.num_threads,
+                                                 hogwild_batch_size=hogwild_batch_size,
+                                                 sparse_weights_mode=self.sparse_weights_mode,
+                                                 sparse_weights_capacity=sparse_weights_capacity,
+                                                 vectorized_sampling=vectorized_sampling)
 
         if (topK != False and topK < 1):
             raise ValueError(
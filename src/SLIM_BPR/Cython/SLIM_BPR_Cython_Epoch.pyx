@@ -32,14 +32,19 @@ ELSE:
 
 
 from ...Base.Recommender_utils import similarityMatrixTopK, check_matrix
+from ...Base.BPR_Batch_Sampler import BPR_Batch_Sampler
 import numpy as np
 import cython
 cimport numpy as np
 import time
 import sys
 
-from libc.math cimport exp, sqrt
-from libc.stdlib cimport rand, srand, RAND_MAX
+from libc.math cimport exp, sqrt, pow
+from libc.stdlib cimport rand, srand, RAND_MAX, malloc, free
+
+from cython.parallel import prange, threadid
+from cpython.pythread cimport PyThread_type_lock, PyThread_allocate_lock, PyThread_free_lock, \
+    PyThread_acquire_lock, PyThread_release_lock, WAIT_LOCK
 
 
 cdef struct BPR_sample:
@@ -50,6 +55,78 @@ cdef struct BPR_sample:
     long seen_items_end_pos
 
 
+
+cdef inline np.uint64_t xorshift_random(np.uint64_t * random_state) nogil:
+    """
+    xorshift64* generator, each thread of the hogwild epoch owns its state so no synchronization is needed
+    """
+
+    random_state[0] ^= random_state[0] >> 12
+    random_state[0] ^= random_state[0] << 25
+    random_state[0] ^= random_state[0] >> 27
+
+    return (random_state[0] * <np.uint64_t> 2685821657736338717) >> 16
+
+
+
+cdef int sampleBPR_nogil(int * URM_mask_indptr, int * URM_mask_indices, long n_users, long n_items,
+                         np.uint64_t * random_state, BPR_sample * sample) nogil:
+    """
+    Same sampling as SLIM_BPR_Cython_Epoch.sampleBPR_Cython, using the given random generator state
+    """
+
+    cdef long index
+    cdef int neg_item_selected, n_seen_items = 0
+
+    # Skip users with no interactions or with no negative items
+    while n_seen_items == 0 or n_seen_items == n_items:
+
+        sample.user = xorshift_random(random_state) % n_users
+
+        sample.seen_items_start_pos = URM_mask_indptr[sample.user]
+        sample.seen_items_end_pos = URM_mask_indptr[sample.user + 1]
+
+        n_seen_items = sample.seen_items_end_pos - sample.seen_items_start_pos
+
+
+    index = xorshift_random(random_state) % n_seen_items
+
+    sample.pos_item = URM_mask_indices[sample.seen_items_start_pos + index]
+
+
+    neg_item_selected = False
+
+    while not neg_item_selected:
+
+        sample.neg_item = xorshift_random(random_state) % n_items
+
+        index = 0
+        # Indices data is sorted, so I don't need to go to the end of the current row
+        while index < n_seen_items and URM_mask_indices[sample.seen_items_start_pos + index] < sample.neg_item:
+            index+=1
+
+        if index == n_seen_items or URM_mask_indices[sample.seen_items_start_pos + index] > sample.neg_item:
+            neg_item_selected = True
+
+    return 0
+
+
+
+cdef int read_BPR_sample(int * triple, int * URM_mask_indptr, BPR_sample * sample) nogil:
+    """
+    Reads a (user, positive item, negative item) triple produced by BPR_Batch_Sampler
+    """
+
+    sample.user = triple[0]
+    sample.pos_item = triple[1]
+    sample.neg_item = triple[2]
+
+    sample.seen_items_start_pos = URM_mask_indptr[sample.user]
+    sample.seen_items_end_pos = URM_mask_indptr[sample.user + 1]
+
+    return 0
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.initializedcheck(False)
@@ -67,6 +144,8 @@ cdef class SLIM_BPR_Cython_Epoch:
     cdef int[:] URM_mask_indices, URM_mask_indptr
 
     cdef Sparse_Matrix_Tree_CSR S_sparse
+    cdef Sparse_Matrix_TopK_Rows S_topK_rows
+    cdef int use_topK_rows
     cdef Triangular_Matrix S_symmetric
     cdef double[:,:] S_dense
 
@@ -80,7 +159,19 @@ cdef class SLIM_BPR_Cython_Epoch:
 
     cdef double [:] sgd_cache_I_momentum_1, sgd_cache_I_momentum_2
     cdef double beta_1, beta_2, beta_1_power_t, beta_2_power_t
-    cdef double momentum_1, momentum_2
+
+
+    # Hogwild
+
+    cdef int num_threads, hogwild_batch_size
+    cdef np.uint64_t[:] thread_random_state
+    cdef PyThread_type_lock * S_sparse_row_locks
+
+
+    # Vectorized sampling
+
+    cdef int vectorized_sampling
+    cdef object batch_sampler
 
 
 
@@ -90,7 +181,21 @@ cdef class SLIM_BPR_Cython_Epoch:
                  learning_rate = 0.01, li_reg = 0.0, lj_reg = 0.0,
                  batch_size = 1, topK = 150, symmetric = True,
                  verbose = False, random_seed = None,
-                 sgd_mode='adam', gamma=0.995, beta_1=0.9, beta_2=0.999):
+                 sgd_mode='adam', gamma=0.995, beta_1=0.9, beta_2=0.999,
+                 num_threads = 1, hogwild_batch_size = None,
+                 sparse_weights_mode = 'tree', sparse_weights_capacity = None,
+                 vectorized_sampling = False):
+        """
+        :param vectorized_sampling:     if True the samples of each epoch are generated at the beginning of the epoch
+                                        by BPR_Batch_Sampler, instead of one at a time
+        :param sparse_weights_mode:     storage of S when train_with_sparse_weights is True, either 'tree' for
+                                        Sparse_Matrix_Tree_CSR or 'topK_rows' for Sparse_Matrix_TopK_Rows
+        :param sparse_weights_capacity: number of cells of each row in 'topK_rows' mode, default is 2*topK
+        :param num_threads:         if greater than 1 each epoch is run in parallel by num_threads threads
+                                    updating S without synchronization (hogwild)
+        :param hogwild_batch_size:  number of samples each thread draws and processes in a single task, if None
+                                    the samples of each of the 5 rounds of the epoch are split evenly among the threads
+        """
 
         super(SLIM_BPR_Cython_Epoch, self).__init__()
 
@@ -119,9 +224,28 @@ cdef class SLIM_BPR_Cython_Epoch:
         self.URM_mask_indices = np.array(URM_mask.indices, dtype=np.int32)
         self.URM_mask_indptr = np.array(URM_mask.indptr, dtype=np.int32)
 
+        self.vectorized_sampling = vectorized_sampling
+        self.batch_sampler = BPR_Batch_Sampler(URM_mask, random_seed=random_seed) if vectorized_sampling else None
+
+
+        self.use_topK_rows = False
 
         if self.train_with_sparse_weights:
-            self.S_sparse = Sparse_Matrix_Tree_CSR(self.n_items, self.n_items)
+
+            if sparse_weights_mode == 'tree':
+                self.S_sparse = Sparse_Matrix_Tree_CSR(self.n_items, self.n_items)
+
+            elif sparse_weights_mode == 'topK_rows':
+
+                if sparse_weights_capacity is None:
+                    sparse_weights_capacity = 2*self.topK if self.topK else self.n_items
+
+                self.use_topK_rows = True
+                self.S_topK_rows = Sparse_Matrix_TopK_Rows(self.n_items, self.n_items, min(sparse_weights_capacity, self.n_items))
+
+            else:
+                raise ValueError("sparse_weights_mode not recognized. Acceptable values are 'tree' and 'topK_rows'. "
+                                 "Provided value was '{}'".format(sparse_weights_mode))
 
         elif self.symmetric:
             self.S_symmetric = Triangular_Matrix(self.n_items, isSymmetric = True)
@@ -134,6 +258,38 @@ cdef class SLIM_BPR_Cython_Epoch:
 
         self._init_adaptive_gradient_cache(sgd_mode, gamma, beta_1, beta_2)
 
+        self._init_hogwild(num_threads, hogwild_batch_size, random_seed)
+
+
+
+
+    def _init_hogwild(self, num_threads, hogwild_batch_size, random_seed):
+
+        cdef long row
+
+        assert num_threads >= 1, "SLIM_BPR_Cython_Epoch: num_threads must be a positive integer, provided value was {}".format(
+            num_threads)
+
+        assert hogwild_batch_size is None or hogwild_batch_size >= 1, "SLIM_BPR_Cython_Epoch: hogwild_batch_size must be None or a positive integer, provided value was {}".format(
+            hogwild_batch_size)
+
+        self.num_threads = num_threads
+
+        # 0 selects the size from the number of samples of each round
+        self.hogwild_batch_size = 0 if hogwild_batch_size is None else hogwild_batch_size
+
+        # Each thread has its own random generator, the states are derived from random_seed
+        self.thread_random_state = np.random.RandomState(random_seed).randint(1, 2**62, size=num_threads, dtype=np.uint64)
+
+        self.S_sparse_row_locks = NULL
+
+        # A new cell changes the structure of the tree of its row, so only the rows of the sparse S need a lock
+        if self.num_threads > 1 and self.train_with_sparse_weights:
+            self.S_sparse_row_locks = <PyThread_type_lock *> PyMem_Malloc(self.n_items * sizeof(PyThread_type_lock))
+
+            for row in range(self.n_items):
+                self.S_sparse_row_locks[row] = PyThread_allocate_lock()
+
 
 
 
@@ -204,6 +360,15 @@ cdef class SLIM_BPR_Cython_Epoch:
             self.S_symmetric.dealloc()
             self.S_symmetric = None
 
+        cdef long row
+
+        if self.S_sparse_row_locks != NULL:
+            for row in range(self.n_items):
+                PyThread_free_lock(self.S_sparse_row_locks[row])
+
+            PyMem_Free(self.S_sparse_row_locks)
+            self.S_sparse_row_locks = NULL
+
 
 
 
@@ -218,6 +383,7 @@ cdef class SLIM_BPR_Cython_Epoch:
         cdef long start_time_batch = time.time()
 
         cdef BPR_sample sample
+        cdef int[:,:] epoch_samples
         cdef long i, j
         cdef long index, seenItem, numCurrentBatch, itemId
         cdef double x_uij, gradient, loss = 0.0
@@ -231,11 +397,21 @@ cdef class SLIM_BPR_Cython_Epoch:
         else:
             printStep = 5000000
 
+        if self.num_threads > 1:
+            self._epochIteration_hogwild()
+            return
+
+        if self.vectorized_sampling:
+            epoch_samples = self.batch_sampler.sample_epoch(totalNumberOfBatch)
+
 
         # Uniform user sampling without replacement
         for numCurrentBatch in range(totalNumberOfBatch):
 
-            sample = self.sampleBPR_Cython()
+            if self.vectorized_sampling:
+                read_BPR_sample(&epoch_samples[numCurrentBatch, 0], &self.URM_mask_indptr[0], &sample)
+            else:
+                sample = self.sampleBPR_Cython()
 
             i = sample.pos_item
             j = sample.neg_item
@@ -251,7 +427,7 @@ cdef class SLIM_BPR_Cython_Epoch:
                 index +=1
 
                 if self.train_with_sparse_weights:
-                   x_uij += self.S_sparse.get_value(i, seenItem) - self.S_sparse.get_value(j, seenItem)
+                   x_uij += self.get_S_value_nogil(i, seenItem) - self.get_S_value_nogil(j, seenItem)
 
                 elif self.symmetric:
                     x_uij += self.S_symmetric.get_value(i, seenItem) - self.S_symmetric.get_value(j, seenItem)
@@ -264,8 +440,10 @@ cdef class SLIM_BPR_Cython_Epoch:
             loss += x_uij**2
 
 
-            local_gradient_i = self.adaptive_gradient(gradient, i, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2)
-            local_gradient_j = self.adaptive_gradient(gradient, j, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2)
+            local_gradient_i = self.adaptive_gradient(gradient, i, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2,
+                                                      self.beta_1_power_t, self.beta_2_power_t)
+            local_gradient_j = self.adaptive_gradient(gradient, j, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2,
+                                                      self.beta_1_power_t, self.beta_2_power_t)
 
 
             index = 0
@@ -280,16 +458,16 @@ cdef class SLIM_BPR_Cython_Epoch:
 
                     if seenItem != i:
                         if self.li_reg!= 0.0:
-                            self.S_sparse.add_value(i, seenItem, self.learning_rate * (local_gradient_i - self.li_reg * self.S_sparse.get_value(i, seenItem)))
+                            self.add_S_value_nogil(i, seenItem, self.learning_rate * (local_gradient_i - self.li_reg * self.get_S_value_nogil(i, seenItem)))
                         else:
-                            self.S_sparse.add_value(i, seenItem, self.learning_rate * local_gradient_i)
+                            self.add_S_value_nogil(i, seenItem, self.learning_rate * local_gradient_i)
 
 
                     if seenItem != j:
                         if self.lj_reg!= 0.0:
-                            self.S_sparse.add_value(j, seenItem, -self.learning_rate * (local_gradient_j - self.lj_reg * self.S_sparse.get_value(j, seenItem)))
+                            self.add_S_value_nogil(j, seenItem, -self.learning_rate * (local_gradient_j - self.lj_reg * self.get_S_value_nogil(j, seenItem)))
                         else:
-                            self.S_sparse.add_value(j, seenItem, -self.learning_rate * local_gradient_j)
+                            self.add_S_value_nogil(j, seenItem, -self.learning_rate * local_gradient_j)
 
 
                 elif self.symmetric:
@@ -320,7 +498,8 @@ cdef class SLIM_BPR_Cython_Epoch:
 
             # If I have reached at least 20% of the total number of batches or samples
             # This allows to limit the memory occupancy of the sparse matrix
-            if self.train_with_sparse_weights and numCurrentBatch % (totalNumberOfBatch/5) == 0 and numCurrentBatch!=0:
+            # The topK rows have a fixed capacity and never need to be rebalanced
+            if self.train_with_sparse_weights and not self.use_topK_rows and numCurrentBatch % (totalNumberOfBatch/5) == 0 and numCurrentBatch!=0:
                 self.S_sparse.rebalance_tree(TopK=self.topK)
 
 
@@ -340,6 +519,209 @@ cdef class SLIM_BPR_Cython_Epoch:
 
 
 
+    def _epochIteration_hogwild(self):
+        """
+        Lock-free parallel epoch, see:
+            Hogwild!: A Lock-Free Approach to Parallelizing Stochastic Gradient Descent,
+            F. Niu, B. Recht, C. Re, S. J. Wright, NIPS 2011.
+        The samples are processed in mini-batches by num_threads threads, each with its own random generator and
+        sample buffer. The threads update the shared S and adaptive gradient caches without synchronization,
+        with the exception of the sparse S in which rows i and j are locked while a sample is processed.
+        As in the sequential epoch the sparse tree is rebalanced every 20% of the samples.
+        """
+
+        cdef long n_samples = int(self.n_users / self.batch_size) + 1
+        cdef int n_rounds = 5, n_threads = self.num_threads, thread_index
+        cdef long round_index, round_start, round_samples, n_batches, batch_index, batch_start, batch_samples, sample_index
+        cdef long hogwild_batch_size = self.hogwild_batch_size, n_users = self.n_users, n_items = self.n_items
+
+        # With fixed size chunks a short epoch may have fewer chunks than threads in each round
+        if hogwild_batch_size == 0:
+            hogwild_batch_size = max(1, ((n_samples + n_rounds - 1) // n_rounds + n_threads - 1) // n_threads)
+
+        cdef int * URM_mask_indptr = &self.URM_mask_indptr[0]
+        cdef int * URM_mask_indices = &self.URM_mask_indices[0]
+        cdef np.uint64_t * thread_random_state = &self.thread_random_state[0]
+        cdef double[:] thread_loss = np.zeros(n_threads, dtype=np.float64)
+
+        cdef double beta_1 = self.beta_1, beta_2 = self.beta_2
+        cdef double start_beta_1_power_t = self.beta_1_power_t, start_beta_2_power_t = self.beta_2_power_t
+        cdef double beta_1_power_t, beta_2_power_t
+
+        cdef BPR_sample * thread_sample_buffer
+        cdef BPR_sample * sample_buffer = <BPR_sample *> malloc(n_threads * hogwild_batch_size * sizeof(BPR_sample))
+
+        cdef int[:,:] epoch_samples
+        cdef int * epoch_samples_pointer = NULL
+
+        if self.vectorized_sampling:
+            epoch_samples = self.batch_sampler.sample_epoch(n_samples)
+            epoch_samples_pointer = &epoch_samples[0, 0]
+
+        if sample_buffer == NULL:
+            raise MemoryError()
+
+        start_time_epoch = time.time()
+        start_time_batch = time.time()
+
+        try:
+            for round_index in range(n_rounds):
+
+                round_start = n_samples * round_index // n_rounds
+                round_samples = n_samples * (round_index + 1) // n_rounds - round_start
+                n_batches = (round_samples + hogwild_batch_size - 1) // hogwild_batch_size
+
+                for batch_index in prange(n_batches, nogil=True, schedule='dynamic', num_threads=n_threads):
+
+                    thread_index = threadid()
+                    thread_sample_buffer = sample_buffer + thread_index * hogwild_batch_size
+
+                    batch_start = batch_index * hogwild_batch_size
+                    batch_samples = min(hogwild_batch_size, round_samples - batch_start)
+
+                    for sample_index in range(batch_samples):
+                        if epoch_samples_pointer != NULL:
+                            read_BPR_sample(epoch_samples_pointer + 3 * (round_start + batch_start + sample_index),
+                                            URM_mask_indptr, &thread_sample_buffer[sample_index])
+                        else:
+                            sampleBPR_nogil(URM_mask_indptr, URM_mask_indices, n_users, n_items,
+                                            &thread_random_state[thread_index], &thread_sample_buffer[sample_index])
+
+                    # Adam bias correction, as if the mini-batches were processed sequentially
+                    beta_1_power_t = start_beta_1_power_t * pow(beta_1, round_start + batch_start)
+                    beta_2_power_t = start_beta_2_power_t * pow(beta_2, round_start + batch_start)
+
+                    for sample_index in range(batch_samples):
+                        thread_loss[thread_index] += self.sample_update_nogil(&thread_sample_buffer[sample_index],
+                                                                              URM_mask_indices, beta_1_power_t, beta_2_power_t)
+
+                        beta_1_power_t = beta_1_power_t * beta_1
+                        beta_2_power_t = beta_2_power_t * beta_2
+
+
+                # This allows to limit the memory occupancy of the sparse matrix
+                if self.train_with_sparse_weights and not self.use_topK_rows and round_index < n_rounds - 1:
+                    self.S_sparse.rebalance_tree(TopK=self.topK)
+
+
+                if self.verbose:
+                    print("Processed {} ( {:.2f}% ) in {:.2f} seconds. BPR loss is {:.2E}. Sample per second: {:.0f} with {} threads and chunks of {}".format(
+                        round_start + round_samples,
+                        100.0* float(round_start + round_samples)/n_samples,
+                        time.time() - start_time_batch,
+                        np.sum(thread_loss)/(round_start + round_samples),
+                        float(round_start + round_samples) / (time.time() - start_time_epoch),
+                        n_threads,
+                        hogwild_batch_size))
+
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+
+                    start_time_batch = time.time()
+
+        finally:
+            free(sample_buffer)
+
+        if self.useAdam:
+            self.beta_1_power_t = start_beta_1_power_t * pow(beta_1, n_samples)
+            self.beta_2_power_t = start_beta_2_power_t * pow(beta_2, n_samples)
+
+
+
+
+    cdef double sample_update_nogil(self, BPR_sample * sample, int * URM_mask_indices,
+                                    double beta_1_power_t, double beta_2_power_t) nogil:
+        """
+        SGD step of the hogwild epoch for a single sample
+        :return: the squared x_uij, used for the loss
+        """
+
+        cdef long i = sample.pos_item, j = sample.neg_item
+        cdef long index, seenItem
+        cdef double x_uij = 0.0, gradient, local_gradient_i, local_gradient_j, reg_i, reg_j
+
+        if self.train_with_sparse_weights:
+            # Rows are always locked in the same order to avoid deadlocks
+            PyThread_acquire_lock(self.S_sparse_row_locks[min(i, j)], WAIT_LOCK)
+            PyThread_acquire_lock(self.S_sparse_row_locks[max(i, j)], WAIT_LOCK)
+
+
+        for index in range(sample.seen_items_start_pos, sample.seen_items_end_pos):
+            seenItem = URM_mask_indices[index]
+            x_uij += self.get_S_value_nogil(i, seenItem) - self.get_S_value_nogil(j, seenItem)
+
+
+        gradient = 1 / (1 + exp(x_uij))
+
+        local_gradient_i = self.adaptive_gradient(gradient, i, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2,
+                                                  beta_1_power_t, beta_2_power_t)
+        local_gradient_j = self.adaptive_gradient(gradient, j, self.sgd_cache_I, self.sgd_cache_I_momentum_1, self.sgd_cache_I_momentum_2,
+                                                  beta_1_power_t, beta_2_power_t)
+
+
+        for index in range(sample.seen_items_start_pos, sample.seen_items_end_pos):
+            seenItem = URM_mask_indices[index]
+
+            # If no reg is required, avoid accessing S
+            if seenItem != i:
+                reg_i = self.li_reg * self.get_S_value_nogil(i, seenItem) if self.li_reg != 0.0 else 0.0
+                self.add_S_value_nogil(i, seenItem, self.learning_rate * (local_gradient_i - reg_i))
+
+            if seenItem != j:
+                reg_j = self.lj_reg * self.get_S_value_nogil(j, seenItem) if self.lj_reg != 0.0 else 0.0
+                self.add_S_value_nogil(j, seenItem, -self.learning_rate * (local_gradient_j - reg_j))
+
+
+        if self.train_with_sparse_weights:
+            PyThread_release_lock(self.S_sparse_row_locks[max(i, j)])
+            PyThread_release_lock(self.S_sparse_row_locks[min(i, j)])
+
+        return x_uij**2
+
+
+
+
+    cdef double get_S_value_nogil(self, long row, long col) nogil:
+
+        if self.use_topK_rows:
+            return self.S_topK_rows.get_value(row, col)
+
+        elif self.train_with_sparse_weights:
+            return tree_get_value(self.S_sparse.row_pointer[row].head, col)
+
+        elif self.symmetric:
+            if col > row:
+                return self.S_symmetric.row_pointer[col][row]
+            return self.S_symmetric.row_pointer[row][col]
+
+        else:
+            return self.S_dense[row, col]
+
+
+
+    cdef double add_S_value_nogil(self, long row, long col, double value) nogil:
+
+        cdef double * cell
+
+        if self.use_topK_rows:
+            return self.S_topK_rows.add_value(row, col, value)
+
+        elif self.train_with_sparse_weights:
+            return tree_add_value(&self.S_sparse.row_pointer[row], col, value)
+
+        elif self.symmetric:
+            # Only the lower triangular is stored
+            cell = &self.S_symmetric.row_pointer[max(row, col)][min(row, col)]
+            cell[0] += value
+            return cell[0]
+
+        else:
+            self.S_dense[row, col] += value
+            return self.S_dense[row, col]
+
+
+
+
     def get_S(self):
 
         # FIll diagonal with zeros
@@ -348,7 +730,7 @@ cdef class SLIM_BPR_Cython_Epoch:
         while index < self.n_items:
 
             if self.train_with_sparse_weights:
-                self.S_sparse.add_value(index, index, -self.S_sparse.get_value(index, index))
+                self.add_S_value_nogil(index, index, -self.get_S_value_nogil(index, index))
 
             elif self.symmetric:
                 self.S_symmetric.add_value(index, index, -self.S_symmetric.get_value(index, index))
@@ -362,7 +744,10 @@ cdef class SLIM_BPR_Cython_Epoch:
 
         if self.topK == False:
 
-            if self.train_with_sparse_weights:
+            if self.use_topK_rows:
+                return self.S_topK_rows.get_scipy_csr(TopK = False)
+
+            elif self.train_with_sparse_weights:
                 return self.S_sparse.get_scipy_csr(TopK = False)
 
             elif self.symmetric:
@@ -378,7 +763,10 @@ cdef class SLIM_BPR_Cython_Epoch:
 
         else :
 
-            if self.train_with_sparse_weights:
+            if self.use_topK_rows:
+                return self.S_topK_rows.get_scipy_csr(TopK=self.topK)
+
+            elif self.train_with_sparse_weights:
                 return self.S_sparse.get_scipy_csr(TopK=self.topK)
 
             elif self.symmetric:
@@ -395,10 +783,11 @@ cdef class SLIM_BPR_Cython_Epoch:
 
 
 
-    cdef double adaptive_gradient(self, double gradient, long user_or_item_id, double[:] sgd_cache, double[:] sgd_cache_momentum_1, double[:] sgd_cache_momentum_2):
+    cdef double adaptive_gradient(self, double gradient, long user_or_item_id, double[:] sgd_cache, double[:] sgd_cache_momentum_1, double[:] sgd_cache_momentum_2,
+                                  double beta_1_power_t, double beta_2_power_t) nogil:
 
 
-        cdef double gradient_update
+        cdef double gradient_update, momentum_1, momentum_2
 
         if self.useAdaGrad:
             sgd_cache[user_or_item_id] += gradient ** 2
@@ -421,10 +810,10 @@ cdef class SLIM_BPR_Cython_Epoch:
                 sgd_cache_momentum_2[user_or_item_id] * self.beta_2 + (1 - self.beta_2) * gradient**2
 
 
-            self.momentum_1 = sgd_cache_momentum_1[user_or_item_id]/ (1 - self.beta_1_power_t)
-            self.momentum_2 = sgd_cache_momentum_2[user_or_item_id]/ (1 - self.beta_2_power_t)
+            momentum_1 = sgd_cache_momentum_1[user_or_item_id]/ (1 - beta_1_power_t)
+            momentum_2 = sgd_cache_momentum_2[user_or_item_id]/ (1 - beta_2_power_t)
 
-            gradient_update = self.momentum_1/ (sqrt(self.momentum_2) + 1e-8)
+            gradient_update = momentum_1/ (sqrt(momentum_2) + 1e-8)
 
 
         else:
@@ -497,7 +886,8 @@ cimport numpy as np
 
 #from libc.stdlib cimport malloc, free#, qsort
 # PyMem malloc and free are slightly faster than plain C equivalents as they optimize OS calls
-from cpython.mem cimport PyMem_Malloc, PyMem_Free
+# The nodes use the Raw allocator, which does not require the GIL, so the tree can be updated by the hogwild threads
+from cpython.mem cimport PyMem_Malloc, PyMem_Free, PyMem_RawMalloc, PyMem_RawFree
 
 # Declaring QSORT as "gil safe", appending "nogil" at the end of the declaration
 # Otherwise I will not be able to pass the comparator function pointer
@@ -520,11 +910,11 @@ ctypedef struct head_pointer_tree_s:
 
 
 # Function to allocate a new node
-cdef matrix_element_tree_s * pointer_new_matrix_element_tree_s(long column, double data, matrix_element_tree_s *higher,  matrix_element_tree_s *lower):
+cdef matrix_element_tree_s * pointer_new_matrix_element_tree_s(long column, double data, matrix_element_tree_s *higher,  matrix_element_tree_s *lower) nogil:
 
     cdef matrix_element_tree_s * new_element
 
-    new_element = < matrix_element_tree_s * > PyMem_Malloc(sizeof(matrix_element_tree_s))
+    new_element = < matrix_element_tree_s * > PyMem_RawMalloc(sizeof(matrix_element_tree_s))
     new_element.column = column
     new_element.data = data
     new_element.higher = higher
@@ -533,6 +923,100 @@ cdef matrix_element_tree_s * pointer_new_matrix_element_tree_s(long column, doub
     return new_element
 
 
+
+cdef double tree_get_value(matrix_element_tree_s * current_element, long col) nogil:
+    """
+    The function returns the value of the cell in the given column of the tree, 0.0 if the cell does not exist
+
+    :param current_element: root of the tree of the row
+    """
+
+    cdef int stopSearch = False
+
+    # If the row is empty, return default
+    if current_element == NULL:
+        return 0.0
+
+    # Follow the tree structure
+    while not stopSearch:
+
+        if current_element.column < col and current_element.higher != NULL:
+            current_element = current_element.higher
+
+        elif current_element.column > col and current_element.lower != NULL:
+            current_element = current_element.lower
+
+        else:
+            stopSearch = True
+
+
+    # If the cell exist, return its value
+    if current_element.column == col:
+        return current_element.data
+
+    # The cell is not found, return default
+    else:
+        return 0.0
+
+
+
+cdef double tree_add_value(head_pointer_tree_s * row_head, long col, double value) nogil:
+    """
+    The function adds a value to the cell in the given column of the tree. A new cell is created if necessary.
+
+    :param row_head: struct containing the root of the tree of the row
+    :return double: resulting cell value
+    """
+
+    cdef matrix_element_tree_s* current_element
+    cdef int stopSearch = False
+
+
+    # If the row is empty, create a new element
+    if row_head.head == NULL:
+
+        row_head.head = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
+
+        return value
+
+
+    # If the row is not empty, look for the cell
+    current_element = row_head.head
+
+    # Follow the tree structure
+    while not stopSearch:
+
+        if current_element.column < col and current_element.higher != NULL:
+            current_element = current_element.higher
+
+        elif current_element.column > col and current_element.lower != NULL:
+            current_element = current_element.lower
+
+        else:
+            stopSearch = True
+
+    # If the cell exist, update its value
+    if current_element.column == col:
+        current_element.data += value
+
+        return current_element.data
+
+
+    # The cell is not found, create new Higher element
+    elif current_element.column < col:
+
+        current_element.higher = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
+
+        return value
+
+    # The cell is not found, create new Lower element
+    else:
+
+        current_element.lower = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
+
+        return value
+
+
 # Functions to compare structs to be used in C qsort
 cdef int compare_struct_on_column(const void *a_input, const void *b_input):
     """
@@ -633,58 +1117,8 @@ cdef class Sparse_Matrix_Tree_CSR:
             raise ValueError("Cell is outside matrix. Matrix shape is ({},{}), coordinates given are ({},{})".format(
                 self.num_rows, self.num_cols, row, col))
 
-        cdef matrix_element_tree_s* current_element, new_element, * old_element
-        cdef int stopSearch = False
-
-
-        # If the row is empty, create a new element
-        if self.row_pointer[row].head == NULL:
-
-            # row_pointer is a python object, so I need the object itself and not the address
-            self.row_pointer[row].head = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
-
-            return value
-
-
-        # If the row is not empty, look for the cell
         # row_pointer contains the struct itself, but I just want its address
-        current_element = self.row_pointer[row].head
-
-        # Follow the tree structure
-        while not stopSearch:
-
-            if current_element.column < col and current_element.higher != NULL:
-                current_element = current_element.higher
-
-            elif current_element.column > col and current_element.lower != NULL:
-                current_element = current_element.lower
-
-            else:
-                stopSearch = True
-
-        # If the cell exist, update its value
-        if current_element.column == col:
-            current_element.data += value
-
-            return current_element.data
-
-
-        # The cell is not found, create new Higher element
-        elif current_element.column < col and current_element.higher == NULL:
-
-            current_element.higher = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
-
-            return value
-
-        # The cell is not found, create new Lower element
-        elif current_element.column > col and current_element.lower == NULL:
-
-            current_element.lower = pointer_new_matrix_element_tree_s(col, value, NULL, NULL)
-
-            return value
-
-        else:
-            assert False, 'ERROR - Current insert operation is not implemented'
+        return tree_add_value(&self.row_pointer[row], col, value)
 
 
 
@@ -704,39 +1138,7 @@ cdef class Sparse_Matrix_Tree_CSR:
                 "Cell is outside matrix. Matrix shape is ({},{}), coordinates given are ({},{})".format(
                     self.num_rows, self.num_cols, row, col))
 
-
-        cdef matrix_element_tree_s* current_element
-        cdef int stopSearch = False
-
-        # If the row is empty, return default
-        if self.row_pointer[row].head == NULL:
-            return 0.0
-
-
-        # If the row is not empty, look for the cell
-        # row_pointer contains the struct itself, but I just want its address
-        current_element = self.row_pointer[row].head
-
-        # Follow the tree structure
-        while not stopSearch:
-
-            if current_element.column < col and current_element.higher != NULL:
-                current_element = current_element.higher
-
-            elif current_element.column > col and current_element.lower != NULL:
-                current_element = current_element.lower
-
-            else:
-                stopSearch = True
-
-
-        # If the cell exist, return its value
-        if current_element.column == col:
-            return current_element.data
-
-        # The cell is not found, return default
-        else:
-            return 0.0
+        return tree_get_value(self.row_pointer[row].head, col)
 
 
 
@@ -883,7 +1285,7 @@ cdef class Sparse_Matrix_Tree_CSR:
             self.subtree_free_memory(root.lower)
 
             # Once the lower elements have been reached, start freeing from the bottom
-            PyMem_Free(root)
+            PyMem_RawFree(root)
 
 
 
@@ -899,7 +1301,7 @@ cdef class Sparse_Matrix_Tree_CSR:
             self.subtree_free_memory(head.higher)
 
             # Once the tail element have been reached, start freeing from them
-            PyMem_Free(head)
+            PyMem_RawFree(head)
 
 
 
@@ -1028,7 +1430,7 @@ cdef class Sparse_Matrix_Tree_CSR:
 
             index -= 1
             while index >= 0:
-                PyMem_Free(vector_pointer_to_list_elements[index].head)
+                PyMem_RawFree(vector_pointer_to_list_elements[index].head)
                 index -= 1
 
         # Free array
@@ -1195,6 +1597,184 @@ cdef class Sparse_Matrix_Tree_CSR:
 
 
 
+##################################################################################################################
+#####################
+#####################            TOPK ROWS MATRIX
+#####################
+##################################################################################################################
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.initializedcheck(False)
+@cython.nonecheck(False)
+@cython.cdivision(True)
+@cython.overflowcheck(False)
+cdef class Sparse_Matrix_TopK_Rows:
+    """
+    Sparse matrix in which every row has a fixed number of cells, stored in contiguous arrays sorted by column.
+    When a new cell is added to a full row, the cell with the smallest value is evicted if the new value is greater,
+    otherwise the new value is discarded. The memory is allocated once and is num_rows * capacity cells.
+    """
+
+    cdef long num_rows, num_cols
+    cdef int capacity
+
+    cdef int[:,:] columns
+    cdef double[:,:] data
+    cdef int[:] row_size
+
+    # Position of the smallest value of each row, -1 if it has to be searched again
+    cdef int[:] row_min_position
+
+
+    def __init__(self, long num_rows, long num_cols, int capacity):
+
+        assert capacity >= 1, "Sparse_Matrix_TopK_Rows: capacity must be a positive integer, provided value was {}".format(capacity)
+
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.capacity = capacity
+
+        self.columns = np.zeros((num_rows, capacity), dtype=np.int32)
+        self.data = np.zeros((num_rows, capacity), dtype=np.float64)
+        self.row_size = np.zeros(num_rows, dtype=np.int32)
+        self.row_min_position = -np.ones(num_rows, dtype=np.int32)
+
+
+
+    cdef int find_position(self, long row, long col) nogil:
+        """
+        Binary search of the column in the row
+        :return int: position of the cell if it exists, otherwise the position in which it should be inserted
+        """
+
+        cdef int low = 0, high = self.row_size[row], middle
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.columns[row, middle] < col:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+
+
+    cdef double get_value(self, long row, long col) nogil:
+        """
+        The function returns the value of the specified cell, no bound check is done
+
+        :return double: cell value, 0.0 if the cell does not exist
+        """
+
+        cdef int position = self.find_position(row, col)
+
+        if position < self.row_size[row] and self.columns[row, position] == col:
+            return self.data[row, position]
+
+        return 0.0
+
+
+
+    cdef double add_value(self, long row, long col, double value) nogil:
+        """
+        The function adds a value to the specified cell, no bound check is done.
+        If the cell does not exist and the row is full, the cell with the smallest value is evicted to make room,
+        unless the new value is smaller.
+
+        :return double: resulting cell value, 0.0 if the new cell has been discarded
+        """
+
+        cdef int position = self.find_position(row, col)
+        cdef int index, min_position = self.row_min_position[row]
+
+        if position < self.row_size[row] and self.columns[row, position] == col:
+            self.data[row, position] += value
+
+            # Keep the position of the smallest value up to date when possible
+            if min_position == position and value > 0.0:
+                self.row_min_position[row] = -1
+            elif min_position != -1 and self.data[row, position] < self.data[row, min_position]:
+                self.row_min_position[row] = position
+
+            return self.data[row, position]
+
+        if value == 0.0:
+            return 0.0
+
+        if self.row_size[row] == self.capacity:
+
+            if min_position == -1:
+                min_position = 0
+
+                for index in range(1, self.capacity):
+                    if self.data[row, index] < self.data[row, min_position]:
+                        min_position = index
+
+                self.row_min_position[row] = min_position
+
+            # Most of the new cells of a full row are discarded here without changing the row
+            if value <= self.data[row, min_position]:
+                return 0.0
+
+            # Remove the evicted cell shifting the following ones to the left
+            for index in range(min_position, self.capacity - 1):
+                self.columns[row, index] = self.columns[row, index + 1]
+                self.data[row, index] = self.data[row, index + 1]
+
+            self.row_size[row] -= 1
+
+            if min_position < position:
+                position -= 1
+
+        # Make room for the new cell shifting the following ones to the right
+        for index in range(self.row_size[row], position, -1):
+            self.columns[row, index] = self.columns[row, index - 1]
+            self.data[row, index] = self.data[row, index - 1]
+
+        self.columns[row, position] = col
+        self.data[row, position] = value
+        self.row_size[row] += 1
+
+        # The cells have been shifted
+        self.row_min_position[row] = -1
+
+        return value
+
+
+
+    def get_scipy_csr(self, TopK = False):
+        """
+        The function returns the current sparse matrix as a scipy_csr object, keeping for each row the TopK
+        highest values if TopK is not False
+
+        :return: scipy_csr object
+        """
+
+        columns = np.array(self.columns)
+        data = np.array(self.data)
+        row_size = np.array(self.row_size)
+
+        valid_mask = np.arange(self.capacity)[None, :] < row_size[:, None]
+        data[~valid_mask] = -np.inf
+
+        if TopK and TopK < self.capacity:
+            top_k_partition = np.argpartition(-data, TopK-1, axis=1)[:, :TopK]
+            columns = np.take_along_axis(columns, top_k_partition, axis=1)
+            data = np.take_along_axis(data, top_k_partition, axis=1)
+
+        rows = np.repeat(np.arange(self.num_rows), data.shape[1]).reshape(data.shape)
+        valid_mask = np.logical_and(np.isfinite(data), data != 0.0)
+
+        return sps.csr_matrix((data[valid_mask], (rows[valid_mask], columns[valid_mask])),
+                              shape=(self.num_rows, self.num_cols))
+
+
+
+
 ##################################################################################################################
 #####################
 #####################            TRIANGULAR MATRIX
@@ -10,23 +10,32 @@ import sys
 import time
 
 import numpy as np
+import scipy.sparse as sps
 from scipy.special import expit
 
-from ..Base.BaseRecommender import BaseRecommender
+from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from ..Base.BPR_Batch_Sampler import BPR_Batch_Sampler
+from ..Base.Recommender_utils import check_matrix, csr_rows_topK
 
 
-class SLIM_BPR(BaseRecommender):
+class SLIM_BPR(BaseItemSimilarityMatrixRecommender):
     """
     This class is a python porting of the BPRSLIM algorithm in MyMediaLite written in C#
-    The code is identical with no optimizations
+
+    The updates are applied in mini-batches: the predictions of the batch are computed gathering the cells of S
+    corresponding to the items seen by each user and the gradient is accumulated and added only to the touched cells.
+    With batch_size=1 the updates are identical to the original per-sample ones.
+    S can either be a dense matrix or a float32 sparse matrix keeping about topK values per row.
+    The updates of the cells already in the sparse S are added in place, the new cells are kept in a small sorted
+    buffer which is merged in S only when it grows larger than sqrt(nnz(S) * cells per batch), so that rebuilding S
+    does not cost O(nnz(S)) at every batch. Each distinct cell of the batch is searched only once.
     """
 
-    def __init__(self, URM_train, lambda_i=0.0025, lambda_j=0.00025, learning_rate=0.05):
-        super(SLIM_BPR, self).__init__(URM_train)
+    RECOMMENDER_NAME = "SLIM_BPR_Recommender"
+
+    def __init__(self, URM_train, lambda_i=0.0025, lambda_j=0.00025, learning_rate=0.05, verbose=True):
+        super(SLIM_BPR, self).__init__(URM_train, verbose=verbose)
 
-        self.URM_train = URM_train
-        self.n_users = URM_train.shape[0]
-        self.n_items = URM_train.shape[1]
         self.lambda_i = lambda_i
         self.lambda_j = lambda_j
         self.learning_rate = learning_rate
@@ -34,41 +43,160 @@ class SLIM_BPR(BaseRecommender):
         self.normalize = False
         self.sparse_weights = False
 
-    def updateFactors(self, user_id, pos_item_id, neg_item_id):
+    @staticmethod
+    def _find_keys(sorted_keys, keys):
+        """
+        :return:    position of each key in sorted_keys and mask of the keys which are present
+        """
+
+        if len(sorted_keys) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=np.bool_)
+
+        position = np.searchsorted(sorted_keys, keys)
+        position = np.minimum(position, len(sorted_keys) - 1)
+
+        return position, sorted_keys[position] == keys
+
+    def _get_S_cells(self, keys):
+        """
+        :param keys:    sorted unique keys row*n_items + col of the cells
+        :return:        the values of the cells and, for the sparse S, where they are, to update them with _add_to_S
+        """
+
+        if not self.sparse_weights:
+            return self.S[keys // self.n_items, keys % self.n_items], None
+
+        # The cells of the sparse S are looked up with a search on the sorted keys, a cell is either in S or in the
+        # buffer of the new cells. The search is faster since the keys are sorted as well
+        position, found = self._find_keys(self._S_keys, keys)
+        new_position, new_found = self._find_keys(self._S_new_keys, keys)
+
+        values = np.zeros(len(keys), dtype=np.float32)
+        values[found] = self.S.data[position[found]]
+        values[new_found] = self._S_new_values[new_position[new_found]]
+
+        return values, (position, found, new_position, new_found)
+
+    def _add_to_S(self, keys, cells, delta):
+        """
+        Adds delta to the cells with the sorted unique keys, cells is the location returned by _get_S_cells
+        """
+
+        if not self.sparse_weights:
+            self.S[keys // self.n_items, keys % self.n_items] += delta
+            return
+
+        position, found, new_position, new_found = cells
+
+        self.S.data[position[found]] += delta[found]
+        self._S_new_values[new_position[new_found]] += delta[new_found]
+
+        # The new cells are inserted in the sorted buffer
+        insert_mask = np.logical_not(np.logical_or(found, new_found))
+
+        if insert_mask.any():
+            insert_position = np.searchsorted(self._S_new_keys, keys[insert_mask])
+            self._S_new_keys = np.insert(self._S_new_keys, insert_position, keys[insert_mask])
+            self._S_new_values = np.insert(self._S_new_values, insert_position, delta[insert_mask])
+
+        if len(self._S_new_keys) > np.sqrt(max(len(self._S_keys), 1) * len(keys)):
+            self._merge_new_cells()
+
+    def _set_sparse_S(self, S):
+
+        self.S = check_matrix(S, 'csr', dtype=np.float32)
+        self.S.sum_duplicates()
+        self.S.sort_indices()
+
+        self._S_keys = np.repeat(np.arange(self.n_items, dtype=np.int64), np.ediff1d(self.S.indptr)) * self.n_items + \
+                       self.S.indices
+
+        self._S_new_keys = np.zeros(0, dtype=np.int64)
+        self._S_new_values = np.zeros(0, dtype=np.float32)
+
+    def _merge_new_cells(self):
+
+        if len(self._S_new_keys) == 0:
+            return
+
+        S_new = sps.csr_matrix((self._S_new_values, (self._S_new_keys // self.n_items, self._S_new_keys % self.n_items)),
+                               shape=(self.n_items, self.n_items), dtype=np.float32)
 
-        # Calculate current predicted score
-        userSeenItems = self.URM_train[user_id].indices
-        prediction = 0
+        self._set_sparse_S(self.S + S_new)
 
-        for userSeenItem in userSeenItems:
-            prediction += self.S[pos_item_id, userSeenItem] - self.S[neg_item_id, userSeenItem]
+    def updateFactorsBatch(self, user_id_array, pos_item_id_array, neg_item_id_array):
 
-        x_uij = prediction
-        logisticFunction = expit(-x_uij)
+        URM_batch = self.URM_train[user_id_array]
+
+        # One cell for each (sample, seen item) pair
+        sample_index = np.repeat(np.arange(len(user_id_array)), np.ediff1d(URM_batch.indptr))
+        seen_item_array = URM_batch.indices
+
+        pos_row_array = pos_item_id_array[sample_index]
+        neg_row_array = neg_item_id_array[sample_index]
+
+        # The cells are identified by the key row*n_items + col, each distinct cell is looked up and updated once
+        cell_keys = np.concatenate((pos_row_array.astype(np.int64) * self.n_items + seen_item_array,
+                                    neg_row_array.astype(np.int64) * self.n_items + seen_item_array))
+
+        unique_keys, cell_index = np.unique(cell_keys, return_inverse=True)
+        S_unique_values, S_cells = self._get_S_cells(unique_keys)
+
+        pos_cell_index = cell_index[:len(sample_index)]
+        neg_cell_index = cell_index[len(sample_index):]
+
+        S_pos_values = S_unique_values[pos_cell_index]
+        S_neg_values = S_unique_values[neg_cell_index]
+
+        x_uij = np.bincount(sample_index, weights=S_pos_values - S_neg_values, minlength=len(user_id_array))
+        logistic_function = expit(-x_uij)[sample_index]
 
         # Update similarities for all items except those sampled
-        for userSeenItem in userSeenItems:
+        pos_mask = pos_row_array != seen_item_array
+        neg_mask = neg_row_array != seen_item_array
+
+        # For positive item is PLUS logistic minus lambda*S, for negative item is MINUS logistic minus lambda*S
+        update_cell_index = np.concatenate((pos_cell_index[pos_mask], neg_cell_index[neg_mask]))
+        update_values = np.concatenate((logistic_function[pos_mask] - self.lambda_i * S_pos_values[pos_mask],
+                                        - logistic_function[neg_mask] - self.lambda_j * S_neg_values[neg_mask]))
 
-            # For positive item is PLUS logistic minus lambda*S
-            if (pos_item_id != userSeenItem):
-                update = logisticFunction - self.lambda_i * self.S[pos_item_id, userSeenItem]
-                self.S[pos_item_id, userSeenItem] += self.learning_rate * update
+        # Accumulate the updates of the same cell, the diagonal cells are never updated
+        S_delta = np.bincount(update_cell_index, weights=self.learning_rate * update_values,
+                              minlength=len(unique_keys)).astype(np.float32)
 
-            # For positive item is MINUS logistic minus lambda*S
-            if (neg_item_id != userSeenItem):
-                update = - logisticFunction - self.lambda_j * self.S[neg_item_id, userSeenItem]
-                self.S[neg_item_id, userSeenItem] += self.learning_rate * update
+        diagonal_mask = unique_keys // self.n_items == unique_keys % self.n_items
 
-    def fit(self, epochs=15):
+        if diagonal_mask.any():
+            unique_keys, S_delta = unique_keys[~diagonal_mask], S_delta[~diagonal_mask]
+
+            if S_cells is not None:
+                S_cells = tuple(array[~diagonal_mask] for array in S_cells)
+
+        self._add_to_S(unique_keys, S_cells, S_delta)
+
+    def fit(self, epochs=15, random_seed=None, batch_size=1000, topK=None):
         """
         Train SLIM wit BPR. If the model was already trained, overwrites matrix S
         :param epochs:
+        :param batch_size:  number of samples whose gradient is applied at once
+        :param topK:        if not None S is a float32 sparse matrix initialized to zero which keeps the topK largest
+                            values of each row, otherwise S is a dense matrix initialized with random values
         :return: -
         """
 
-        # Initialize similarity with random values and zero-out diagonal
-        self.S = np.random.random((self.n_items, self.n_items)).astype('float32')
-        self.S[np.arange(self.n_items), np.arange(self.n_items)] = 0
+        self.batch_size = batch_size
+        self.topK = topK
+        self.sparse_weights = topK is not None
+
+        self.batch_sampler = BPR_Batch_Sampler(self.URM_train, random_seed=random_seed)
+
+        if self.sparse_weights:
+            self._set_sparse_S(sps.csr_matrix((self.n_items, self.n_items), dtype=np.float32))
+
+        else:
+            # Initialize similarity with random values and zero-out diagonal
+            self.S = np.random.RandomState(random_seed).random_sample((self.n_items, self.n_items)).astype('float32')
+            self.S[np.arange(self.n_items), np.arange(self.n_items)] = 0
 
         start_time_train = time.time()
 
@@ -76,14 +204,20 @@ class SLIM_BPR(BaseRecommender):
             start_time_epoch = time.time()
 
             self.epochIteration()
-            print("Epoch {} of {} complete in {:.2f} minutes".format(currentEpoch + 1, epochs,
-                                                                     float(time.time() - start_time_epoch) / 60))
+            self._print("Epoch {} of {} complete in {:.2f} minutes".format(currentEpoch + 1, epochs,
+                                                                           float(time.time() - start_time_epoch) / 60))
 
-        print("Train completed in {:.2f} minutes".format(float(time.time() - start_time_train) / 60))
+        self._print("Train completed in {:.2f} minutes".format(float(time.time() - start_time_train) / 60))
 
         # The similarity matrix is learnt row-wise
         # To be used in the product URM*S must be transposed to be column-wise
-        self.W = self.S.T
+        if self.sparse_weights:
+            self.W_sparse = check_matrix(csr_rows_topK(self.S, self.topK).T, 'csr', dtype=np.float32)
+            del self._S_keys, self._S_new_keys, self._S_new_values
+
+        else:
+            self.W = self.S.T
+            self.W_sparse = sps.csr_matrix(self.W, dtype=np.float32)
 
         del self.S
 
@@ -94,60 +228,27 @@ class SLIM_BPR(BaseRecommender):
 
         start_time = time.time()
 
-        # Uniform user sampling without replacement
-        for numSample in range(numPositiveIteractions):
+        # The triples of the whole epoch are sampled at once
+        epoch_samples = self.batch_sampler.sample_epoch(numPositiveIteractions)
 
-            user_id, pos_item_id, neg_item_id = self.sampleTriple()
-            self.updateFactors(user_id, pos_item_id, neg_item_id)
+        for start_sample in range(0, numPositiveIteractions, self.batch_size):
 
-            if (numSample % 5000 == 0):
-                print("Processed {} ( {:.2f}% ) in {:.4f} seconds".format(numSample,
-                                                                          100.0 * float(
-                                                                              numSample) / numPositiveIteractions,
-                                                                          time.time() - start_time))
+            batch_samples = epoch_samples[start_sample:start_sample + self.batch_size]
+            self.updateFactorsBatch(batch_samples[:, 0], batch_samples[:, 1], batch_samples[:, 2])
 
-                sys.stderr.flush()
+            # The rows grow with the updates, they are pruned when the average exceeds twice topK
+            if self.sparse_weights and len(self._S_keys) + len(self._S_new_keys) > 2 * self.topK * self.n_items:
+                self._merge_new_cells()
+                self._set_sparse_S(csr_rows_topK(self.S, self.topK))
 
-                start_time = time.time()
+        if self.sparse_weights:
+            self._merge_new_cells()
+            self._set_sparse_S(csr_rows_topK(self.S, self.topK))
 
-    def sampleUser(self):
-        """
-        Sample a user that has viewed at least one and not all items
-        :return: user_id
-        """
-        while (True):
-
-            user_id = np.random.randint(0, self.n_users)
-            numSeenItems = self.URM_train[user_id].nnz
-
-            if (numSeenItems > 0 and numSeenItems < self.n_items):
-                return user_id
-
-    def sampleItemPair(self, user_id):
-        """
-        Returns for the given user a random seen item and a random not seen item
-        :param user_id:
-        :return: pos_item_id, neg_item_id
-        """
-
-        userSeenItems = self.URM_train[user_id].indices
-
-        pos_item_id = userSeenItems[np.random.randint(0, len(userSeenItems))]
-
-        while (True):
-
-            neg_item_id = np.random.randint(0, self.n_items)
-
-            if (neg_item_id not in userSeenItems):
-                return pos_item_id, neg_item_id
-
-    def sampleTriple(self):
-        """
-        Randomly samples a user and then samples randomly a seen and not seen item
-        :return: user_id, pos_item_id, neg_item_id
-        """
+        elapsed_time = max(time.time() - start_time, 1e-9)
 
-        user_id = self.sampleUser()
-        pos_item_id, neg_item_id = self.sampleItemPair(user_id)
+        self._print("Processed {} samples in {:.2f} seconds. Samples per second: {:.0f}".format(
+            numPositiveIteractions, elapsed_time, numPositiveIteractions / elapsed_time))
 
-        return user_id, pos_item_id, neg_item_id
+        sys.stdout.flush()
+        sys.stderr.flush()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 19/10/2026
+
+"""
+
+import numpy as np
+import multiprocessing
+import time, sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ...Base.Recommender_utils import check_matrix
+from ...Base.Similarity.Compute_Similarity import Compute_Similarity
+from ...SLIM_ElasticNet.SLIMElasticNetRecommender import SLIMElasticNetRecommender, topK_arrays_to_W_sparse
+from ...Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+from ...CythonCompiler.run_compile_subprocess import run_compile_subprocess
+
+
+def compute_item_gram_matrix(URM_train, topK=None):
+    """
+    Computes the item Gram matrix URM_train.T * URM_train without its diagonal, which is returned separately
+    :param URM_train:
+    :param topK:        if not None only the topK values of each column are kept
+    :return:            gram_matrix CSC without diagonal, gram_diagonal array
+    """
+
+    URM_train = check_matrix(URM_train, 'csc', dtype=np.float32)
+    n_items = URM_train.shape[1]
+
+    gram_diagonal = np.array(URM_train.power(2).sum(axis=0), dtype=np.float32).ravel()
+
+    similarity = Compute_Similarity(URM_train, shrink=0, topK=n_items if topK is None else topK,
+                                    normalize=False, similarity="cosine")
+
+    gram_matrix = check_matrix(similarity.compute_similarity(), 'csc', dtype=np.float32)
+    gram_matrix.sort_indices()
+
+    return gram_matrix, gram_diagonal
+
+
+class SLIM_ElasticNet_Cython(SLIMElasticNetRecommender):
+    """
+    SLIM ElasticNet fitted with a compiled coordinate descent working directly on the item Gram matrix.
+    The Gram matrix is computed only once and shared by all the regressions, which are solved in parallel threads
+    over chunks of items. The regression of item j only uses the items co-occurring with it as features.
+    """
+
+    RECOMMENDER_NAME = "SLIM_ElasticNet_Cython_Recommender"
+
+    def __init__(self, URM_train, verbose=True, recompile_cython=False):
+        super(SLIM_ElasticNet_Cython, self).__init__(URM_train, verbose=verbose)
+
+        if recompile_cython:
+            print("Compiling in Cython")
+            self.runCompilationScript()
+            print("Compilation Complete")
+
+    def fit(self, l1_ratio=0.1, alpha=1.0, tol=1e-4, positive_only=True, topK=100, max_iter=100,
+            gram_topK=None, num_threads=multiprocessing.cpu_count(), chunk_size=1000):
+        """
+        :param gram_topK:       if not None only the gram_topK largest co-occurrences of each item are kept,
+                                which reduces both the memory and the features of each regression
+        :param num_threads:     number of threads fitting chunks of items in parallel
+        :param chunk_size:      number of items fitted by a thread in a single call
+        """
+
+        assert l1_ratio >= 0 and l1_ratio <= 1, "SLIM_ElasticNet: l1_ratio must be between 0 and 1, provided value was {}".format(
+            l1_ratio)
+
+        # Import compiled module
+        from .SLIM_ElasticNet_Cython_Solver import fit_items_coordinate_descent
+
+        self.alpha = alpha
+        self.tol = tol
+        self.l1_ratio = l1_ratio
+        self.positive_only = positive_only
+        self.topK = topK
+        self.max_iter = max_iter
+        self.gram_topK = gram_topK
+
+        start_time = time.time()
+
+        n_samples, n_items = self.URM_train.shape
+
+        gram_matrix, gram_diagonal = compute_item_gram_matrix(self.URM_train, topK=self.gram_topK)
+
+        # Same objective as sklearn ElasticNet, whose loss is scaled by 1/(2*n_samples)
+        l1_penalty = self.alpha * self.l1_ratio * n_samples
+        l2_penalty = self.alpha * (1 - self.l1_ratio) * n_samples
+
+        topK_indices = np.zeros((n_items, self.topK), dtype=np.int32)
+        topK_values = np.zeros((n_items, self.topK), dtype=np.float32)
+        topK_count = np.zeros(n_items, dtype=np.int32)
+
+        gram_indptr = gram_matrix.indptr.astype(np.int32)
+        gram_indices = gram_matrix.indices.astype(np.int32)
+        gram_data = gram_matrix.data.astype(np.float32)
+
+        def _fit_chunk(start_item):
+            fit_items_coordinate_descent(gram_indptr, gram_indices, gram_data, gram_diagonal,
+                                         start_item, min(start_item + chunk_size, n_items),
+                                         l1_penalty, l2_penalty, self.positive_only,
+                                         self.max_iter, self.tol,
+                                         topK_indices, topK_values, topK_count)
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(_fit_chunk, range(0, n_items, chunk_size)))
+
+        self.W_sparse = topK_arrays_to_W_sparse(topK_indices, topK_values, topK_count)
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+
+        self._print("Processed {} items in {:.2f} {}. Items per second: {:.2f}".format(
+            n_items, new_time_value, new_time_unit, n_items / (time.time() - start_time)))
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    def runCompilationScript(self):
+
+        # Run compile script setting the working directory to ensure the compiled file are contained in the
+        # appropriate subfolder and not the project root
+
+        file_subfolder = "/SLIM_ElasticNet/Cython"
+        file_to_compile_list = ['SLIM_ElasticNet_Cython_Solver.pyx']
+
+        run_compile_subprocess(file_subfolder, file_to_compile_list)
+
+        print("{}: Compiled module {} in subfolder: {}".format(self.RECOMMENDER_NAME, file_to_compile_list,
+                                                               file_subfolder))
+
+        # Command to run compilation script
+        # python compile_script.py SLIM_ElasticNet_Cython_Solver.pyx build_ext --inplace
+
+        # Command to generate html report
+        # cython -a SLIM_ElasticNet_Cython_Solver.pyx
@@ -0,0 +1,219 @@
+"""
+Created on 19/10/2026
+
+"""
+
+#cython: language_level=3
+#cython: boundscheck=False
+#cython: wraparound=False
+#cython: initializedcheck=False
+#cython: nonecheck=False
+#cython: cdivision=True
+#cython: overflowcheck=False
+
+
+import numpy as np
+cimport numpy as np
+
+from libc.math cimport fabs
+from libc.stdlib cimport malloc, free
+
+
+cdef inline void _heap_sift_down(int * heap_index, float * heap_value, int heap_size, int position) nogil:
+    """
+    Restores the min-heap property starting from position, the minimum is kept in position 0
+    """
+
+    cdef int child, swap_index
+    cdef float swap_value
+
+    while True:
+        child = 2 * position + 1
+
+        if child >= heap_size:
+            return
+
+        if child + 1 < heap_size and heap_value[child + 1] < heap_value[child]:
+            child += 1
+
+        if heap_value[position] <= heap_value[child]:
+            return
+
+        swap_index = heap_index[position]
+        swap_value = heap_value[position]
+        heap_index[position] = heap_index[child]
+        heap_value[position] = heap_value[child]
+        heap_index[child] = swap_index
+        heap_value[child] = swap_value
+
+        position = child
+
+
+cdef inline void _heap_push_top_k(int * heap_index, float * heap_value, int * heap_size, int topK,
+                                  int index, float value) nogil:
+    """
+    Adds the value to a min-heap of capacity topK, when the heap is full the smallest value is evicted
+    """
+
+    cdef int position, parent, swap_index
+    cdef float swap_value
+
+    if heap_size[0] < topK:
+        position = heap_size[0]
+        heap_index[position] = index
+        heap_value[position] = value
+        heap_size[0] += 1
+
+        while position > 0:
+            parent = (position - 1) // 2
+
+            if heap_value[parent] <= heap_value[position]:
+                break
+
+            swap_index = heap_index[position]
+            swap_value = heap_value[position]
+            heap_index[position] = heap_index[parent]
+            heap_value[position] = heap_value[parent]
+            heap_index[parent] = swap_index
+            heap_value[parent] = swap_value
+
+            position = parent
+
+    elif value > heap_value[0]:
+        heap_index[0] = index
+        heap_value[0] = value
+        _heap_sift_down(heap_index, heap_value, heap_size[0], 0)
+
+
+def fit_items_coordinate_descent(int[:] gram_indptr, int[:] gram_indices, float[:] gram_data, float[:] gram_diagonal,
+                                 int start_item, int end_item,
+                                 double l1_penalty, double l2_penalty, bint positive_only,
+                                 int max_iter, double tol,
+                                 int[:, :] topK_indices, float[:, :] topK_values, int[:] topK_count):
+    """
+    Solves the ElasticNet regression of every item in [start_item, end_item) with cyclic coordinate descent on the
+    precomputed item Gram matrix, without ever accessing the data matrix.
+
+    The Gram matrix is given column-wise (CSC arrays) and must NOT contain the diagonal, which is passed separately.
+    For target item j the features are the items k in the column j of the Gram matrix, j itself is excluded.
+    Items that do not co-occur with j keep a zero coefficient, which is exact when positive_only is True
+    and the data is non-negative.
+
+    The penalties must already be scaled by the number of samples:
+        l1_penalty = alpha * l1_ratio * n_samples
+        l2_penalty = alpha * (1 - l1_ratio) * n_samples
+
+    The GIL is released for the whole computation, so different item ranges can be fitted by different threads
+    as long as they write on different rows of the output arrays.
+
+    :param topK_indices:    n_items x topK array, row j receives the item indices of the topK coefficients of item j
+    :param topK_values:     n_items x topK array, row j receives the values of the topK coefficients of item j
+    :param topK_count:      n_items array, receives the number of valid cells in each row of the previous arrays
+    """
+
+    cdef int n_items = gram_diagonal.shape[0]
+    cdef int topK = topK_indices.shape[1]
+
+    cdef int target_item, feature_item, n_iter, index, inner_index, heap_size
+    cdef int target_start, target_end
+    cdef double rho, coef_old, coef_new, coef_delta, max_delta, max_coef
+
+    cdef double * coef = <double *> malloc(n_items * sizeof(double))
+    cdef double * gram_coef_product = <double *> malloc(n_items * sizeof(double))
+    cdef char * coef_touched = <char *> malloc(n_items * sizeof(char))
+    cdef int * heap_index = <int *> malloc(max(topK, 1) * sizeof(int))
+    cdef float * heap_value = <float *> malloc(max(topK, 1) * sizeof(float))
+
+    if coef == NULL or gram_coef_product == NULL or coef_touched == NULL or heap_index == NULL or heap_value == NULL:
+        free(coef)
+        free(gram_coef_product)
+        free(coef_touched)
+        free(heap_index)
+        free(heap_value)
+        raise MemoryError()
+
+    with nogil:
+
+        for index in range(n_items):
+            coef[index] = 0.0
+            gram_coef_product[index] = 0.0
+            coef_touched[index] = 0
+
+        for target_item in range(start_item, end_item):
+
+            target_start = gram_indptr[target_item]
+            target_end = gram_indptr[target_item + 1]
+
+            for n_iter in range(max_iter):
+
+                max_delta = 0.0
+                max_coef = 0.0
+
+                for index in range(target_start, target_end):
+
+                    feature_item = gram_indices[index]
+
+                    if feature_item == target_item or gram_diagonal[feature_item] == 0.0:
+                        continue
+
+                    coef_old = coef[feature_item]
+
+                    # The product does not contain the diagonal term, so it already excludes the current coefficient
+                    rho = gram_data[index] - gram_coef_product[feature_item]
+
+                    if rho > l1_penalty:
+                        coef_new = (rho - l1_penalty) / (gram_diagonal[feature_item] + l2_penalty)
+                    elif rho < -l1_penalty and not positive_only:
+                        coef_new = (rho + l1_penalty) / (gram_diagonal[feature_item] + l2_penalty)
+                    else:
+                        coef_new = 0.0
+
+                    if coef_new != coef_old:
+                        coef_delta = coef_new - coef_old
+                        coef[feature_item] = coef_new
+                        coef_touched[feature_item] = 1
+
+                        for inner_index in range(gram_indptr[feature_item], gram_indptr[feature_item + 1]):
+                            gram_coef_product[gram_indices[inner_index]] += coef_delta * gram_data[inner_index]
+
+                        if fabs(coef_delta) > max_delta:
+                            max_delta = fabs(coef_delta)
+
+                    if fabs(coef_new) > max_coef:
+                        max_coef = fabs(coef_new)
+
+                if max_coef == 0.0 or max_delta / max_coef < tol:
+                    break
+
+            # Select topK values and clean the buffers, only the columns of the updated features have been touched
+            heap_size = 0
+
+            for index in range(target_start, target_end):
+
+                feature_item = gram_indices[index]
+
+                if not coef_touched[feature_item]:
+                    continue
+
+                coef_new = coef[feature_item]
+
+                if coef_new != 0.0:
+                    _heap_push_top_k(heap_index, heap_value, &heap_size, topK, feature_item, <float> coef_new)
+
+                for inner_index in range(gram_indptr[feature_item], gram_indptr[feature_item + 1]):
+                    gram_coef_product[gram_indices[inner_index]] = 0.0
+
+                coef[feature_item] = 0.0
+                coef_touched[feature_item] = 0
+
+            for index in range(heap_size):
+                topK_indices[target_item, index] = heap_index[index]
+                topK_values[target_item, index] = heap_value[index]
+
+            topK_count[target_item] = heap_size
+
+    free(coef)
+    free(gram_coef_product)
+    free(coef_touched)
+    free(heap_index)
+    free(heap_value)
@@ -6,15 +6,119 @@
 
 import numpy as np
 import scipy.sparse as sps
-from ..Base.Recommender_utils import check_matrix
+from ..Base.Recommender_utils import check_matrix, similarityMatrixTopK
+from ..Base.Similarity.Compute_Similarity import Compute_Similarity
 from sklearn.linear_model import ElasticNet
 from sklearn.exceptions import ConvergenceWarning
 
 from ..Base.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
+from ..Base.DataIO import DataIO
+from ..MatrixFactorization.PureSVDRecommender import get_URM_fingerprint
 from ..Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 import time, sys, warnings
 
 
+def get_item_neighbourhoods(URM_train, neighbourhood_size, neighbourhood_W=None):
+    """
+    Selects for each item the candidate features of its SLIM regression
+    :param URM_train:
+    :param neighbourhood_size:  number of candidates for each item
+    :param neighbourhood_W:     item-item similarity whose column j contains the neighbours of item j,
+                                if None the co-occurrence matrix URM_train.T * URM_train is used
+    :return:                    CSC matrix whose column j contains the candidates of item j, itself excluded
+    """
+
+    if neighbourhood_W is None:
+        # The co-occurrence matrix is the Gram matrix, any item not co-occurring with j cannot get a positive
+        # coefficient in its regression
+        similarity = Compute_Similarity(check_matrix(URM_train, 'csc', dtype=np.float32), shrink=0,
+                                        topK=neighbourhood_size, normalize=False, similarity="cosine")
+        neighbourhoods = similarity.compute_similarity()
+
+    else:
+        neighbourhoods = check_matrix(neighbourhood_W, 'csr', dtype=np.float32).copy()
+        neighbourhoods.setdiag(0.0)
+        neighbourhoods.eliminate_zeros()
+        neighbourhoods = similarityMatrixTopK(neighbourhoods, k=neighbourhood_size)
+
+    neighbourhoods = check_matrix(neighbourhoods, 'csc', dtype=np.float32)
+    neighbourhoods.sort_indices()
+
+    return neighbourhoods
+
+
+def _fit_item_alpha_path(model, X, currentItem, alphas, topK_indices, topK_values, topK_count, candidate_items=None):
+    """
+    Fits the model of currentItem for each alpha, in the given order, warm starting each solution from the previous one.
+    The positive coefficients of each path point are written, sorted by decreasing value, in row currentItem of the
+    arrays of that point
+    :param model:           ElasticNet model with warm_start=True
+    :param X:               CSC data matrix, the column of currentItem is temporarily set to zero
+    :param alphas:          regularization path, it should be decreasing so that the solutions become denser
+    :param topK_indices:    n_alphas x n_items x topK array
+    :param topK_values:     n_alphas x n_items x topK array
+    :param topK_count:      n_alphas x n_items array
+    :param candidate_items: if not None, sorted array of the only items used as features, currentItem excluded
+    """
+
+    # get the target column
+    y = X[:, currentItem].toarray()
+
+    if candidate_items is None:
+        X_features = X
+        feature_items = None
+
+        # set the j-th column of X to zero
+        start_pos = X.indptr[currentItem]
+        end_pos = X.indptr[currentItem + 1]
+
+        current_item_data_backup = X.data[start_pos: end_pos].copy()
+        X.data[start_pos: end_pos] = 0.0
+
+    else:
+        # Only the columns of the candidates are copied, the target is not among them
+        X_features = X[:, candidate_items]
+        feature_items = candidate_items
+
+        if len(candidate_items) == 0:
+            topK_count[:, currentItem] = 0
+            return
+
+    topK = min(topK_indices.shape[2], X_features.shape[1])
+
+    # The path of each item starts from zero coefficients
+    if hasattr(model, "coef_"):
+        del model.coef_
+
+    for alpha_index, alpha in enumerate(alphas):
+
+        model.set_params(alpha=alpha)
+
+        # fit one ElasticNet model per column
+        model.fit(X_features, y)
+
+        # model.coef_ contains the coefficient of the ElasticNet model
+        # let's keep only the topK positive values, sorted so that any smaller topK is a prefix
+        if topK < len(model.coef_):
+            relevant_items_partition = (-model.coef_).argpartition(topK)[0:topK]
+        else:
+            relevant_items_partition = np.arange(len(model.coef_))
+
+        relevant_items_partition_sorting = np.argsort(-model.coef_[relevant_items_partition])
+        ranking = relevant_items_partition[relevant_items_partition_sorting]
+
+        notZerosMask = model.coef_[ranking] > 0.0
+        ranking = ranking[notZerosMask]
+
+        topK_indices[alpha_index, currentItem, :len(ranking)] = ranking if feature_items is None else feature_items[ranking]
+        topK_values[alpha_index, currentItem, :len(ranking)] = model.coef_[ranking]
+        topK_count[alpha_index, currentItem] = len(ranking)
+
+    if candidate_items is None:
+        # finally, replace the original values of the j-th column
+        X.data[start_pos:end_pos] = current_item_data_backup
+
+
 class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
     """
     Train a Sparse Linear Methods (SLIM) item similarity model.
@@ -137,87 +241,502 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
                                        shape=(n_items, n_items), dtype=np.float32)
 
 
-import multiprocessing
-from multiprocessing import Pool
-from functools import partial
+    def fit_alpha_path(self, alphas, l1_ratio=0.1, tol=1e-2, positive_only=True, topK=100, max_iter=100,
+                       neighbourhood_size=None, neighbourhood_W=None,
+                       checkpoint_folder_path=None, checkpoint_chunk_size=1000):
+        """
+        Fits the model along a regularization path, each item is fitted for all the alphas in decreasing order
+        warm starting from the previous solution, so the whole path costs little more than the densest fit.
+        A W_sparse is built for each (alpha, topK) pair, all topK values are obtained from the same solution
+        by truncating its sorted coefficients. Use set_alpha_path_point to select the one to use.
+        NOTE: the topK coefficients of all the path points are kept in memory until the end,
+              which requires n_alphas * n_items * max(topK) * 8 bytes
+        :param alphas:              list of alpha values
+        :param tol:                 the default is the tolerance fit uses, so fit_alpha_path([alpha]) is equivalent to it
+        :param topK:                an integer or a list of integers
+        :param neighbourhood_size:  if not None, the regression of each item only uses as features its
+                                    neighbourhood_size most co-occurring items, see get_item_neighbourhoods
+        :param neighbourhood_W:     optional item-item similarity used to select the neighbourhoods instead of the
+                                    co-occurrences, e.g., the W_sparse of an ItemKNN
+        :param checkpoint_folder_path:  if not None, the coefficients of every chunk of items are saved in this folder
+                                        as soon as the chunk is fitted. If the folder already contains the chunks of an
+                                        interrupted fit with the same hyperparameters, they are loaded instead of being
+                                        fitted again
+        :param checkpoint_chunk_size:   number of items in each saved chunk
+        """
+
+        self._init_alpha_path(alphas, l1_ratio, tol, positive_only, topK, max_iter)
 
+        # Display ConvergenceWarning only once and not for every item it occurs
+        warnings.simplefilter("once", category=ConvergenceWarning)
 
-class MultiThreadSLIM_ElasticNet(SLIMElasticNetRecommender, BaseItemSimilarityMatrixRecommender):
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+        n_items = URM_train.shape[1]
 
-    def __init__(self, URM_train, verbose=True):
-        super(MultiThreadSLIM_ElasticNet, self).__init__(URM_train, verbose=verbose)
+        model = ElasticNet(**self._get_alpha_path_model_kwargs())
 
-    def _partial_fit(self, currentItem, X, topK):
-        model = ElasticNet(alpha=self.alpha,
-                           l1_ratio=self.l1_ratio,
-                           positive=self.positive_only,
-                           fit_intercept=False,
-                           copy_X=False,
-                           precompute=True,
-                           selection='random',
-                           max_iter=self.max_iter,
-                           tol=self.tol)
-
-        # WARNING: make a copy of X to avoid race conditions on column j
-        # TODO: We can probably come up with something better here.
-        X_j = X.copy()
-        # get the target column
-        y = X_j[:, currentItem].toarray()
-        # set the j-th column of X to zero
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = 0.0
-        # fit one ElasticNet model per column
-        model.fit(X_j, y)
-        # self.model.coef_ contains the coefficient of the ElasticNet model
-        # let's keep only the non-zero values
-        # nnz_idx = model.coef_ > 0.0
+        neighbourhoods = self._get_neighbourhoods(neighbourhood_size, neighbourhood_W)
 
-        relevant_items_partition = (-model.coef_).argpartition(topK)[0:topK]
-        relevant_items_partition_sorting = np.argsort(-model.coef_[relevant_items_partition])
-        ranking = relevant_items_partition[relevant_items_partition_sorting]
+        topK_indices = np.zeros((len(self.alpha_path), n_items, max(self.topK_path)), dtype=np.int32)
+        topK_values = np.zeros((len(self.alpha_path), n_items, max(self.topK_path)), dtype=np.float32)
+        topK_count = np.zeros((len(self.alpha_path), n_items), dtype=np.int32)
 
-        notZerosMask = model.coef_[ranking] > 0.0
-        ranking = ranking[notZerosMask]
+        if checkpoint_folder_path is None:
+            checkpoint_dataIO, item_ranges = None, [(0, n_items)]
+        else:
+            checkpoint_dataIO, item_ranges = self._init_checkpoint(checkpoint_folder_path, checkpoint_chunk_size,
+                                                                   topK_indices, topK_values, topK_count)
+
+        n_items_to_fit = sum(end_item - start_item for start_item, end_item in item_ranges)
+        n_items_fitted = 0
+
+        start_time = time.time()
+        start_time_printBatch = start_time
 
-        values = model.coef_[ranking]
-        rows = ranking
-        cols = [currentItem] * len(ranking)
+        for start_item, end_item in item_ranges:
+            for currentItem in range(start_item, end_item):
 
-        return values, rows, cols
+                if neighbourhoods is None:
+                    candidate_items = None
+                else:
+                    candidate_items = neighbourhoods.indices[neighbourhoods.indptr[currentItem]:
+                                                             neighbourhoods.indptr[currentItem + 1]]
+
+                _fit_item_alpha_path(model, URM_train, currentItem, self.alpha_path,
+                                     topK_indices, topK_values, topK_count, candidate_items=candidate_items)
+
+                n_items_fitted += 1
+
+                elapsed_time = time.time() - start_time
+                new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+
+                if time.time() - start_time_printBatch > 300 or n_items_fitted == n_items_to_fit:
+                    self._print("Processed {} ( {:.2f}% ) in {:.2f} {}. Items per second: {:.2f}".format(
+                        n_items_fitted,
+                        100.0 * float(n_items_fitted) / n_items_to_fit,
+                        new_time_value,
+                        new_time_unit,
+                        float(n_items_fitted) / elapsed_time))
+
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+
+                    start_time_printBatch = time.time()
+
+            if checkpoint_dataIO is not None:
+                _save_checkpoint_fragment(checkpoint_dataIO, start_item, end_item,
+                                          topK_indices, topK_values, topK_count)
+
+        self._set_alpha_path_W_sparse(topK_indices, topK_values, topK_count)
+
+    def _init_alpha_path(self, alphas, l1_ratio, tol, positive_only, topK, max_iter):
 
-    def fit(self, l1_ratio=0.1, alpha=1.0, tol =1e-4, positive_only=True, topK=100, max_iter=100,
-            workers=multiprocessing.cpu_count()):
         assert l1_ratio >= 0 and l1_ratio <= 1, "SLIM_ElasticNet: l1_ratio must be between 0 and 1, provided value was {}".format(
             l1_ratio)
 
-        self.alpha = alpha
-        self.tol = tol
+        # Decreasing alphas produce increasingly dense solutions, which is what makes warm starting effective
+        self.alpha_path = sorted(np.atleast_1d(alphas).tolist(), reverse=True)
+        self.topK_path = sorted(np.atleast_1d(topK).astype(int).tolist())
+
         self.l1_ratio = l1_ratio
+        self.tol = tol
         self.positive_only = positive_only
-        self.topK = topK
         self.max_iter = max_iter
 
-        self.workers = workers
+    def _get_neighbourhoods(self, neighbourhood_size, neighbourhood_W):
 
-        self.URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
-        n_items = self.URM_train.shape[1]
-        # fit item's factors in parallel
+        self.neighbourhood_size = neighbourhood_size
 
-        # oggetto riferito alla funzione nel quale predefinisco parte dell'input
-        _pfit = partial(self._partial_fit, X=self.URM_train, topK=self.topK)
+        if neighbourhood_size is None:
+            return None
 
-        # creo un pool con un certo numero di processi
-        pool = Pool(processes=self.workers)
+        neighbourhoods = get_item_neighbourhoods(self.URM_train, neighbourhood_size, neighbourhood_W=neighbourhood_W)
 
-        # avvio il pool passando la funzione (con la parte fissa dell'input)
-        # e il rimanente parametro, variabile
-        res = pool.map(_pfit, np.arange(n_items))
+        self._print("Each regression uses on average {:.1f} features instead of {}".format(
+            neighbourhoods.nnz / self.n_items, self.n_items - 1))
 
-        # res contains a vector of (values, rows, cols) tuples
-        values, rows, cols = [], [], []
-        for values_, rows_, cols_ in res:
-            values.extend(values_)
-            rows.extend(rows_)
-            cols.extend(cols_)
+        return neighbourhoods
 
-        # generate the sparse weight matrix
-        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
\ No newline at end of file
+    def _init_checkpoint(self, checkpoint_folder_path, chunk_size, topK_indices, topK_values, topK_count):
+        """
+        Loads in the output arrays the chunks already saved in the checkpoint folder
+        :return: the DataIO of the checkpoint folder and the item ranges that still have to be fitted
+        """
+
+        if checkpoint_folder_path[-1] != "/":
+            checkpoint_folder_path += "/"
+
+        checkpoint_dataIO = DataIO(folder_path=checkpoint_folder_path)
+
+        n_items = topK_count.shape[1]
+
+        # The neighbourhood_W, if any, is not part of the metadata, so it is not checked
+        checkpoint_metadata = {"alpha_path": self.alpha_path,
+                               "max_topK": max(self.topK_path),
+                               "l1_ratio": self.l1_ratio,
+                               "tol": self.tol,
+                               "positive_only": self.positive_only,
+                               "max_iter": self.max_iter,
+                               "neighbourhood_size": self.neighbourhood_size,
+                               "URM_fingerprint": get_URM_fingerprint(self.URM_train)}
+
+        if os.path.isfile(checkpoint_folder_path + _CHECKPOINT_METADATA_FILE_NAME + ".zip"):
+            saved_metadata = checkpoint_dataIO.load_data(_CHECKPOINT_METADATA_FILE_NAME)["checkpoint_metadata"]
+
+            assert saved_metadata == checkpoint_metadata, \
+                "{}: checkpoint folder '{}' contains a fit with different hyperparameters or data: {}".format(
+                    self.RECOMMENDER_NAME, checkpoint_folder_path, saved_metadata)
+        else:
+            checkpoint_dataIO.save_data(_CHECKPOINT_METADATA_FILE_NAME, {"checkpoint_metadata": checkpoint_metadata})
+
+        fitted_items_mask = _load_checkpoint_fragments(checkpoint_dataIO, topK_indices, topK_values, topK_count)
+
+        # A chunk is fitted again unless all of its items are in the checkpoint
+        item_ranges = [(start_item, min(start_item + chunk_size, n_items))
+                       for start_item in range(0, n_items, chunk_size)
+                       if not fitted_items_mask[start_item:start_item + chunk_size].all()]
+
+        self._print("Checkpoint in '{}' contains {} ( {:.2f}% ) items, {} chunks left to fit".format(
+            checkpoint_folder_path, fitted_items_mask.sum(), 100.0 * fitted_items_mask.sum() / n_items,
+            len(item_ranges)))
+
+        return checkpoint_dataIO, item_ranges
+
+    def _get_alpha_path_model_kwargs(self):
+
+        return {"alpha": self.alpha_path[0],
+                "l1_ratio": self.l1_ratio,
+                "positive": self.positive_only,
+                "fit_intercept": False,
+                "copy_X": False,
+                "precompute": True,
+                "selection": 'random',
+                "max_iter": self.max_iter,
+                "tol": self.tol,
+                "warm_start": True}
+
+    def _set_alpha_path_W_sparse(self, topK_indices, topK_values, topK_count):
+
+        self.W_sparse_path = {}
+
+        for alpha_index, alpha in enumerate(self.alpha_path):
+            for topK in self.topK_path:
+                # The coefficients are sorted by decreasing value, so a smaller topK is a prefix of them
+                self.W_sparse_path[(alpha, topK)] = topK_arrays_to_W_sparse(
+                    topK_indices[alpha_index, :, :topK],
+                    topK_values[alpha_index, :, :topK],
+                    np.minimum(topK_count[alpha_index], topK))
+
+        # The last alpha is the smallest one, which corresponds to the densest model
+        self.set_alpha_path_point(self.alpha_path[-1], self.topK_path[-1])
+
+    def set_alpha_path_point(self, alpha, topK):
+        """
+        Selects as W_sparse the model fitted by fit_alpha_path for the given alpha and topK
+        """
+
+        assert (alpha, topK) in self.W_sparse_path, \
+            "{}: alpha {} and topK {} are not in the fitted path".format(self.RECOMMENDER_NAME, alpha, topK)
+
+        self.alpha = alpha
+        self.topK = topK
+        self.W_sparse = self.W_sparse_path[(alpha, topK)]
+
+
+import os, mmap
+import multiprocessing
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+
+def topK_arrays_to_W_sparse(topK_indices, topK_values, topK_count):
+    """
+    Builds the CSR item-item matrix from the fixed size arrays containing, for each item, its topK coefficients
+    :param topK_indices:    n_items x topK array, row j contains the item indices of the coefficients of item j
+    :param topK_values:     n_items x topK array, row j contains the values of the coefficients of item j
+    :param topK_count:      n_items array, number of valid cells in each row of the previous arrays
+    :return:
+    """
+
+    n_items, topK = topK_indices.shape
+
+    valid_mask = np.arange(topK)[None, :] < topK_count[:, None]
+
+    indptr = np.zeros(n_items + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(topK_count)
+
+    # Row j of the arrays contains the coefficients of the model for item j, i.e., column j of W
+    W_sparse = sps.csc_matrix((topK_values[valid_mask], topK_indices[valid_mask], indptr),
+                              shape=(n_items, n_items), dtype=np.float32)
+
+    return check_matrix(W_sparse, 'csr', dtype=np.float32)
+
+
+_CHECKPOINT_METADATA_FILE_NAME = "checkpoint_metadata"
+_CHECKPOINT_FRAGMENT_PREFIX = "fragment_"
+
+
+def _save_checkpoint_fragment(dataIO, start_item, end_item, topK_indices, topK_values, topK_count):
+    """
+    Saves the coefficients of the items in [start_item, end_item) as a CSR fragment for each path point,
+    row i of the fragment contains the coefficients of item start_item + i sorted by decreasing value
+    """
+
+    fragment_dict = {"start_item": start_item, "end_item": end_item}
+
+    for alpha_index in range(topK_count.shape[0]):
+
+        chunk_count = topK_count[alpha_index, start_item:end_item]
+        valid_mask = np.arange(topK_indices.shape[2])[None, :] < chunk_count[:, None]
+
+        indptr = np.zeros(len(chunk_count) + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(chunk_count)
+
+        # The column indices are not sorted on purpose, their order is the one of the coefficients
+        fragment_dict["W_fragment_{}".format(alpha_index)] = sps.csr_matrix(
+            (topK_values[alpha_index, start_item:end_item][valid_mask],
+             topK_indices[alpha_index, start_item:end_item][valid_mask],
+             indptr), shape=(len(chunk_count), topK_count.shape[1]))
+
+    # Written under a temporary name and then renamed, so a fit killed while saving does not leave a corrupted fragment
+    file_name = "{}{}_{}".format(_CHECKPOINT_FRAGMENT_PREFIX, start_item, end_item)
+
+    dataIO.save_data(file_name + ".tmp.zip", fragment_dict)
+    os.replace(dataIO.folder_path + file_name + ".tmp.zip", dataIO.folder_path + file_name + ".zip")
+
+
+def _load_checkpoint_fragments(dataIO, topK_indices, topK_values, topK_count):
+    """
+    Writes the coefficients of all the fragments in the checkpoint folder in the output arrays.
+    Fragments are loaded one at a time, so no other copy of the coefficients is held in memory
+    :return: boolean mask of the items loaded
+    """
+
+    fitted_items_mask = np.zeros(topK_count.shape[1], dtype=bool)
+
+    fragment_file_names = [file_name for file_name in os.listdir(dataIO.folder_path)
+                           if file_name.startswith(_CHECKPOINT_FRAGMENT_PREFIX) and file_name.endswith(".zip")
+                           and not file_name.endswith(".tmp.zip")]
+
+    for file_name in fragment_file_names:
+
+        fragment_dict = dataIO.load_data(file_name)
+        start_item, end_item = fragment_dict["start_item"], fragment_dict["end_item"]
+
+        for alpha_index in range(topK_count.shape[0]):
+
+            W_fragment = fragment_dict["W_fragment_{}".format(alpha_index)]
+            chunk_count = np.diff(W_fragment.indptr)
+
+            valid_mask = np.arange(topK_indices.shape[2])[None, :] < chunk_count[:, None]
+
+            topK_indices[alpha_index, start_item:end_item][valid_mask] = W_fragment.indices
+            topK_values[alpha_index, start_item:end_item][valid_mask] = W_fragment.data
+            topK_count[alpha_index, start_item:end_item] = chunk_count
+
+        fitted_items_mask[start_item:end_item] = True
+
+    return fitted_items_mask
+
+
+def _create_shared_array(array):
+    """
+    Copies the array in a new shared memory block
+    :return: the SharedMemory object, which must be unlinked by the caller once the shared array is released,
+             the shared array and the descriptor to attach to it
+    """
+
+    shared_memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+
+    shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf)
+    shared_array[:] = array
+
+    return shared_memory, shared_array, (shared_memory.name, array.shape, array.dtype.str)
+
+
+def _attach_shared_array(descriptor, copy_on_write=False):
+    """
+    Attaches to a shared memory block created by _create_shared_array without copying it.
+    With copy_on_write the block is mapped privately, writes are not visible to the other processes
+    and only the memory pages that are written are duplicated.
+    :return: the object owning the buffer, which must be kept alive, and the array
+    """
+
+    name, shape, dtype = descriptor
+
+    shared_memory = SharedMemory(name=name)
+
+    if not copy_on_write:
+        return shared_memory, np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+
+    if os.name == "nt":
+        buffer = mmap.mmap(-1, shared_memory.size, tagname=name, access=mmap.ACCESS_COPY)
+    else:
+        buffer = mmap.mmap(shared_memory._fd, shared_memory.size, access=mmap.ACCESS_COPY)
+
+    shared_memory.close()
+
+    return buffer, np.ndarray(shape, dtype=dtype, buffer=buffer)
+
+
+# State of each worker process of MultiThreadSLIM_ElasticNet, set once by the pool initializer
+_worker_state = {}
+
+
+def _init_worker(URM_shape, URM_descriptors, topK_descriptors, neighbourhood_descriptors, model_kwargs, alphas):
+
+    buffers = []
+
+    for name, descriptor in URM_descriptors.items():
+        # Each worker zeroes the target column in the data, so it needs a private view of it
+        buffer, _worker_state[name] = _attach_shared_array(descriptor, copy_on_write=name == "data")
+        buffers.append(buffer)
+
+    for name, descriptor in list(topK_descriptors.items()) + list(neighbourhood_descriptors.items()):
+        buffer, _worker_state[name] = _attach_shared_array(descriptor)
+        buffers.append(buffer)
+
+    _worker_state["buffers"] = buffers
+    _worker_state["URM_train"] = sps.csc_matrix((_worker_state["data"], _worker_state["indices"],
+                                                 _worker_state["indptr"]), shape=URM_shape, copy=False)
+    _worker_state["model"] = ElasticNet(**model_kwargs)
+    _worker_state["alphas"] = alphas
+
+
+def _fit_items_chunk(item_range):
+    """
+    Fits the items in [start_item, end_item) writing their topK coefficients in the shared output arrays
+    """
+
+    start_item, end_item = item_range
+
+    # The data is private to this worker, so the column of the current item can be set to zero
+    X = _worker_state["URM_train"]
+
+    # Display ConvergenceWarning only once and not for every item it occurs
+    warnings.simplefilter("once", category=ConvergenceWarning)
+
+    for currentItem in range(start_item, end_item):
+
+        if "neighbourhood_indptr" in _worker_state:
+            candidate_items = _worker_state["neighbourhood_indices"][_worker_state["neighbourhood_indptr"][currentItem]:
+                                                                     _worker_state["neighbourhood_indptr"][currentItem + 1]]
+        else:
+            candidate_items = None
+
+        _fit_item_alpha_path(_worker_state["model"], X, currentItem, _worker_state["alphas"],
+                             _worker_state["topK_indices"], _worker_state["topK_values"], _worker_state["topK_count"],
+                             candidate_items=candidate_items)
+
+    return item_range
+
+
+class MultiThreadSLIM_ElasticNet(SLIMElasticNetRecommender, BaseItemSimilarityMatrixRecommender):
+    """
+    Parallel SLIM ElasticNet, the items are fitted in contiguous chunks by a pool of processes.
+    The URM and the output arrays live in shared memory, so the memory used does not grow with the number of workers.
+    """
+
+    def __init__(self, URM_train, verbose=True):
+        super(MultiThreadSLIM_ElasticNet, self).__init__(URM_train, verbose=verbose)
+
+    def fit(self, l1_ratio=0.1, alpha=1.0, tol =1e-4, positive_only=True, topK=100, max_iter=100,
+            workers=multiprocessing.cpu_count(), chunk_size=None, neighbourhood_size=None, neighbourhood_W=None,
+            checkpoint_folder_path=None):
+
+        self.fit_alpha_path([alpha], l1_ratio=l1_ratio, tol=tol, positive_only=positive_only, topK=topK,
+                            max_iter=max_iter, workers=workers, chunk_size=chunk_size,
+                            neighbourhood_size=neighbourhood_size, neighbourhood_W=neighbourhood_W,
+                            checkpoint_folder_path=checkpoint_folder_path)
+
+    def fit_alpha_path(self, alphas, l1_ratio=0.1, tol=1e-4, positive_only=True, topK=100, max_iter=100,
+                       workers=multiprocessing.cpu_count(), chunk_size=None, neighbourhood_size=None,
+                       neighbourhood_W=None, checkpoint_folder_path=None):
+        """
+        :param chunk_size:              number of items fitted by a worker in a single task,
+                                        it is also the number of items in each chunk saved in the checkpoint
+        :param checkpoint_folder_path:  if not None, every chunk is saved in this folder as soon as it is fitted,
+                                        see SLIMElasticNetRecommender.fit_alpha_path
+        """
+
+        self._init_alpha_path(alphas, l1_ratio, tol, positive_only, topK, max_iter)
+
+        neighbourhoods = self._get_neighbourhoods(neighbourhood_size, neighbourhood_W)
+
+        self.workers = workers
+
+        self.URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+        n_items = self.URM_train.shape[1]
+
+        if chunk_size is None:
+            chunk_size = int(np.ceil(n_items / (4 * self.workers)))
+
+        n_alphas = len(self.alpha_path)
+        max_topK = max(self.topK_path)
+
+        shared_memory_list = []
+        shared_arrays = {}
+        descriptors = {}
+
+        try:
+            # Replace the URM arrays with the shared ones, so that a single copy of the data exists
+            for name in ["data", "indices", "indptr"]:
+                shared_memory, shared_arrays[name], descriptors[name] = _create_shared_array(
+                    getattr(self.URM_train, name))
+                shared_memory_list.append(shared_memory)
+
+            self.URM_train = sps.csc_matrix((shared_arrays["data"], shared_arrays["indices"], shared_arrays["indptr"]),
+                                            shape=self.URM_train.shape, copy=False)
+
+            for name, array in [("topK_indices", np.zeros((n_alphas, n_items, max_topK), dtype=np.int32)),
+                                ("topK_values", np.zeros((n_alphas, n_items, max_topK), dtype=np.float32)),
+                                ("topK_count", np.zeros((n_alphas, n_items), dtype=np.int32))]:
+                shared_memory, shared_arrays[name], descriptors[name] = _create_shared_array(array)
+                shared_memory_list.append(shared_memory)
+
+            neighbourhood_descriptors = {}
+
+            if neighbourhoods is not None:
+                for name in ["indices", "indptr"]:
+                    shared_memory, _, neighbourhood_descriptors["neighbourhood_" + name] = _create_shared_array(
+                        getattr(neighbourhoods, name))
+                    shared_memory_list.append(shared_memory)
+
+            URM_descriptors = {name: descriptors[name] for name in ["data", "indices", "indptr"]}
+            topK_descriptors = {name: descriptors[name] for name in ["topK_indices", "topK_values", "topK_count"]}
+
+            if checkpoint_folder_path is None:
+                checkpoint_dataIO = None
+                item_ranges = [(start_item, min(start_item + chunk_size, n_items))
+                               for start_item in range(0, n_items, chunk_size)]
+            else:
+                checkpoint_dataIO, item_ranges = self._init_checkpoint(checkpoint_folder_path, chunk_size,
+                                                                       shared_arrays["topK_indices"],
+                                                                       shared_arrays["topK_values"],
+                                                                       shared_arrays["topK_count"])
+
+            # fit chunks of items in parallel, each worker writes its results directly in the shared arrays
+            with Pool(processes=self.workers, initializer=_init_worker,
+                      initargs=(self.URM_train.shape, URM_descriptors, topK_descriptors, neighbourhood_descriptors,
+                                self._get_alpha_path_model_kwargs(), self.alpha_path)) as pool:
+
+                for start_item, end_item in pool.imap_unordered(_fit_items_chunk, item_ranges):
+                    # The chunk is complete in the shared arrays, so it can be saved by the main process
+                    if checkpoint_dataIO is not None:
+                        _save_checkpoint_fragment(checkpoint_dataIO, start_item, end_item,
+                                                  shared_arrays["topK_indices"], shared_arrays["topK_values"],
+                                                  shared_arrays["topK_count"])
+
+            # generate the sparse weight matrices
+            self._set_alpha_path_W_sparse(shared_arrays["topK_indices"], shared_arrays["topK_values"],
+                                          shared_arrays["topK_count"])
+
+        finally:
+            # The shared memory can be closed only when no array refers to it anymore,
+            # so the URM is moved out of it first
+            self.URM_train = self.URM_train.copy()
+            shared_arrays.clear()
+
+            for shared_memory in shared_memory_list:
+                shared_memory.close()
+                shared_memory.unlink()